@@ -0,0 +1,264 @@
+"""Batch runs: one workflow executed over many input variable sets."""
+
+import json
+import logging
+import os
+import threading
+import time
+from collections.abc import Iterable, Iterator
+from datetime import datetime
+
+from sqlalchemy import delete, func, insert
+from sqlalchemy.orm import joinedload
+
+from blobs import log_output
+from database import SessionLocal
+from executor import get_pool
+from models import Batch, Execution, ExecutionStepLog
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+INSERT_CHUNK_SIZE = 500
+DISPATCH_PAGE_SIZE = 500
+TERMINAL_STATUSES = ("SUCCESS", "FAILED", "CANCELLED", "TIMED_OUT")
+
+
+def create_batch(workflow_id: int, concurrency: int) -> int:
+    db = SessionLocal()
+    try:
+        batch = Batch(workflow_id=workflow_id, concurrency=concurrency)
+        db.add(batch)
+        db.commit()
+        return batch.id
+    finally:
+        db.close()
+
+
+def add_inputs(batch_id: int, workflow_id: int, inputs: list[dict]) -> None:
+    """Insert one QUEUED execution per input set in a single statement."""
+    if not inputs:
+        return
+    now = datetime.utcnow()
+    db = SessionLocal()
+    try:
+        db.execute(
+            insert(Execution),
+            [
+                {
+                    "workflow_id": workflow_id,
+                    "batch_id": batch_id,
+                    "status": "QUEUED",
+                    "created_at": now,
+                    "inputs": json.dumps(variables),
+                }
+                for variables in inputs
+            ],
+        )
+        db.query(Batch).filter(Batch.id == batch_id).update(
+            {Batch.total: Batch.total + len(inputs)})
+        db.commit()
+    finally:
+        db.close()
+
+
+def discard_batch(batch_id: int) -> None:
+    """Delete a batch whose request failed before it started, with its executions."""
+    db = SessionLocal()
+    try:
+        db.execute(delete(Execution).where(Execution.batch_id == batch_id))
+        db.execute(delete(Batch).where(Batch.id == batch_id))
+        db.commit()
+    finally:
+        db.close()
+
+
+def chunked(items: Iterable[dict], size: int = INSERT_CHUNK_SIZE) -> Iterator[list[dict]]:
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _dispatch(batch_id: int, concurrency: int) -> None:
+    """
+    Feed the batch's queued executions to the shared pool, at most
+    `concurrency` at a time. Ids are read a page at a time so memory does
+    not grow with the size of the batch.
+    """
+    in_flight = threading.BoundedSemaphore(concurrency)
+    pool = get_pool()
+    last_id = 0
+
+    db = SessionLocal()
+    try:
+        db.query(Batch).filter(Batch.id == batch_id).update(
+            {Batch.status: "RUNNING"})
+        db.commit()
+
+        while True:
+            ids = [
+                row.id
+                for row in db.query(Execution.id)
+                .filter(
+                    Execution.batch_id == batch_id,
+                    Execution.status == "QUEUED",
+                    Execution.id > last_id,
+                )
+                .order_by(Execution.id)
+                .limit(DISPATCH_PAGE_SIZE)
+            ]
+            if not ids:
+                break
+            for execution_id in ids:
+                in_flight.acquire()
+                try:
+                    pool.submit(execution_id, block=True,
+                                on_done=in_flight.release)
+                except Exception:
+                    in_flight.release()
+                    raise
+            last_id = ids[-1]
+
+        # Wait for the last executions to drain before closing the batch.
+        for _ in range(concurrency):
+            in_flight.acquire()
+
+        db.query(Batch).filter(Batch.id == batch_id).update(
+            {Batch.status: "COMPLETED", Batch.finished_at: datetime.utcnow()})
+        db.commit()
+    except Exception as e:
+        logger.exception("Batch %s dispatch failed: %s", batch_id, e)
+        db.rollback()
+        db.query(Batch).filter(Batch.id == batch_id).update(
+            {Batch.status: "FAILED", Batch.finished_at: datetime.utcnow()})
+        db.commit()
+    finally:
+        db.close()
+
+
+def start_batch(batch_id: int, concurrency: int) -> None:
+    threading.Thread(
+        target=_dispatch,
+        args=(batch_id, concurrency),
+        name=f"batch-{batch_id}",
+        daemon=True,
+    ).start()
+
+
+def batch_progress(db, batch: Batch) -> dict:
+    """Aggregate execution counts for a batch, by status."""
+    counts = dict(
+        db.query(Execution.status, func.count(Execution.id))
+        .filter(Execution.batch_id == batch.id)
+        .group_by(Execution.status)
+        .all()
+    )
+    finished = sum(counts.get(status, 0) for status in TERMINAL_STATUSES)
+    return {
+        "batch_id": batch.id,
+        "workflow_id": batch.workflow_id,
+        "status": batch.status,
+        "total": batch.total,
+        "finished": finished,
+        "progress": finished / batch.total if batch.total else 0.0,
+        "counts": counts,
+        "created_at": batch.created_at.isoformat() if batch.created_at else None,
+        "finished_at": batch.finished_at.isoformat() if batch.finished_at else None,
+    }
+
+
+def _result_rows(db, execution_ids: list[int]) -> Iterator[dict]:
+    executions = (
+        db.query(Execution)
+        .filter(Execution.id.in_(execution_ids))
+        .order_by(Execution.id)
+        .all()
+    )
+    logs: dict[int, list[ExecutionStepLog]] = {}
+    for log in (
+        db.query(ExecutionStepLog)
+        .options(joinedload(ExecutionStepLog.output_blob))
+        .filter(ExecutionStepLog.execution_id.in_(execution_ids),
+                ExecutionStepLog.parent_log_id.is_(None))
+        .order_by(ExecutionStepLog.step_order)
+    ):
+        logs.setdefault(log.execution_id, []).append(log)
+
+    for execution in executions:
+        step_logs = logs.get(execution.id, [])
+        yield {
+            "execution_id": execution.id,
+            "status": execution.status,
+            "error_message": execution.error_message,
+            "inputs": json.loads(execution.inputs) if execution.inputs else None,
+            "step_outputs": [
+                log_output(log) for log in step_logs if log.status == "COMPLETED"],
+        }
+
+
+def stream_results(batch_id: int, follow: bool = True,
+                   poll_interval: float = 1.0) -> Iterator[str]:
+    """
+    Yield NDJSON lines for executions of the batch as they finish.
+
+    Executions can finish out of id order, so the stream keeps a low-water
+    mark below which everything has been emitted, plus the ids emitted
+    above it. Only that window is ever held in memory.
+    """
+    low = 0
+    emitted: set[int] = set()
+    while True:
+        db = SessionLocal()
+        try:
+            batch = db.get(Batch, batch_id)
+            if batch is None:
+                return
+            # Checked before reading rows, so the last pass sees every
+            # execution that finished before the batch did. A failed
+            # batch may leave executions queued that will never finish.
+            batch_done = batch.status in ("COMPLETED", "FAILED")
+
+            # Read the first unfinished id before the finished rows: anything
+            # below it was already finished, so the next query is sure to
+            # see it and the window can safely move past it.
+            first_open = (
+                db.query(func.min(Execution.id))
+                .filter(
+                    Execution.batch_id == batch_id,
+                    Execution.status.notin_(TERMINAL_STATUSES),
+                    Execution.id > low,
+                )
+                .scalar()
+            )
+            finished = [
+                row.id
+                for row in db.query(Execution.id)
+                .filter(
+                    Execution.batch_id == batch_id,
+                    Execution.status.in_(TERMINAL_STATUSES),
+                    Execution.id > low,
+                )
+                .order_by(Execution.id)
+            ]
+            new_ids = [i for i in finished if i not in emitted]
+            for start in range(0, len(new_ids), DISPATCH_PAGE_SIZE):
+                page = new_ids[start:start + DISPATCH_PAGE_SIZE]
+                for row in _result_rows(db, page):
+                    yield json.dumps(row) + "\n"
+                emitted.update(page)
+        finally:
+            db.close()
+
+        if batch_done or not follow:
+            return
+        if first_open is None:
+            low = max(emitted, default=low)
+        else:
+            low = first_open - 1
+        emitted = {i for i in emitted if i > low}
+        time.sleep(poll_interval)
@@ -0,0 +1,173 @@
+"""
+Database write-path benchmark: executions per second at several levels
+of concurrency, with the LLM replaced by an instant in-process stand-in so
+the numbers reflect the runner and the database only.
+
+    python bench_db.py --concurrency 1,4,16 --executions 64 --steps 3 --stream
+    python bench_db.py --compare-untuned        # also run with SQLITE_TUNING=0
+
+Each run uses a fresh SQLite file in a temporary directory unless
+--database-url is given. Results can be written as JSON with --output.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+REPLY = "BENCH reply " + " ".join(["word"] * 30)
+
+
+def instant_reply(request: httpx.Request) -> httpx.Response:
+    """Answers every chat completion at once, streamed if asked."""
+    if json.loads(request.content).get("stream"):
+        words = REPLY.split(" ")
+        lines = [
+            "data: " + _dumps({"choices": [{"index": 0, "delta": {
+                "content": word if i == 0 else " " + word}}]})
+            for i, word in enumerate(words)
+        ]
+        lines.append("data: [DONE]")
+        return httpx.Response(200, text="\n\n".join(lines) + "\n\n",
+                              headers={"Content-Type": "text/event-stream"})
+    return httpx.Response(200, json={
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": REPLY}}],
+    })
+
+
+def _dumps(value) -> str:
+    return json.dumps(value, separators=(",", ":"))
+
+
+def run_level(concurrency: int, executions: int, steps: int) -> dict:
+    import engine_loop
+    from database import SessionLocal
+    from log_writer import get_log_writer
+    from models import Step, Workflow
+    from runner import create_execution, execute_by_id
+
+    db = SessionLocal()
+    try:
+        workflow = Workflow(name=f"bench-{concurrency}", steps=[
+            Step(model="bench", prompt=f"Bench step {order}", completion_criteria="BENCH",
+                 retry_limit=1, step_order=order)
+            for order in range(1, steps + 1)
+        ])
+        db.add(workflow)
+        db.commit()
+        execution_ids = [create_execution(workflow, db).id for _ in range(executions)]
+    finally:
+        db.close()
+
+    async def run_all() -> list[bool]:
+        slots = asyncio.Semaphore(concurrency)
+
+        async def run_one(execution_id: int) -> bool:
+            async with slots:
+                return (await execute_by_id(execution_id)).success
+
+        return await asyncio.gather(*(run_one(i) for i in execution_ids))
+
+    writer = get_log_writer()
+    flushes, rows = writer.flushes, writer.rows
+    start = time.perf_counter()
+    results = engine_loop.run(run_all())
+    wall = time.perf_counter() - start
+    return {
+        "concurrency": concurrency,
+        "executions": executions,
+        "failed": results.count(False),
+        "wall_seconds": wall,
+        "executions_per_second": executions / wall if wall else 0.0,
+        "partial_output_flushes": writer.flushes - flushes,
+        "partial_output_rows": writer.rows - rows,
+    }
+
+
+def run(args: argparse.Namespace) -> dict:
+    from database import DATABASE_URL, SQLITE_TUNING, engine
+    from llm_client import LLMClient, LLMConfig, set_client
+    from migrations import upgrade
+
+    upgrade(engine)
+    set_client(LLMClient(
+        config=LLMConfig(api_key="bench", api_url="http://bench.invalid/v1/chat/completions",
+                         stream=args.stream),
+        transport=httpx.MockTransport(instant_reply),
+    ))
+    levels = [run_level(c, args.executions, args.steps) for c in args.concurrency]
+    return {
+        "database_url": DATABASE_URL,
+        "sqlite_tuning": SQLITE_TUNING,
+        "steps": args.steps,
+        "stream": args.stream,
+        "levels": levels,
+    }
+
+
+def _print(results: dict) -> None:
+    tuning = "on" if results["sqlite_tuning"] else "off"
+    print(f"{results['database_url']} (SQLite tuning {tuning}), "
+          f"{results['steps']} steps, stream={results['stream']}")
+    for level in results["levels"]:
+        print(f"  concurrency {level['concurrency']:>3}: "
+              f"{level['executions_per_second']:8.1f} executions/s "
+              f"({level['executions']} in {level['wall_seconds']:.2f}s, "
+              f"{level['failed']} failed)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--concurrency", default="1,4,16",
+                        help="comma-separated numbers of concurrent executions")
+    parser.add_argument("--executions", type=int, default=64,
+                        help="executions run at each concurrency level")
+    parser.add_argument("--steps", type=int, default=3)
+    parser.add_argument("--stream", action="store_true",
+                        help="stream replies, exercising partial-output writes")
+    parser.add_argument("--database-url", help="default: a fresh temporary SQLite file")
+    parser.add_argument("--compare-untuned", action="store_true",
+                        help="repeat the run with SQLITE_TUNING=0")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    parser.add_argument("--output", help="write results JSON here")
+    args = parser.parse_args()
+    args.concurrency = [int(c) for c in args.concurrency.split(",")]
+
+    # database reads DATABASE_URL at import, so set it before anything imports it.
+    os.environ["DATABASE_URL"] = args.database_url or "sqlite:///" + os.path.join(
+        tempfile.mkdtemp(prefix="bench_db-"), "bench.db")
+    results = {"tuned": run(args)}
+
+    if args.compare_untuned:
+        command = [sys.executable, __file__, "--json",
+                   "--concurrency", ",".join(map(str, args.concurrency)),
+                   "--executions", str(args.executions), "--steps", str(args.steps)]
+        if args.stream:
+            command.append("--stream")
+        output = subprocess.run(
+            command, env={**os.environ, "SQLITE_TUNING": "0"},
+            capture_output=True, text=True, check=True,
+        ).stdout
+        results["untuned"] = json.loads(output)["tuned"]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for name, result in results.items():
+            print(f"[{name}]")
+            _print(result)
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Content-addressed storage for step outputs.
+
+Finished outputs are stored once per distinct text in `output_blobs`,
+zlib-compressed under the SHA-256 of their UTF-8 bytes. Step logs keep
+just the hash and the size, so identical outputs (cached or repeated
+answers, batch runs over the same inputs) share one row.
+"""
+
+import hashlib
+import zlib
+
+from sqlalchemy.orm import Session
+
+from models import ExecutionStepLog, OutputBlob
+
+COMPRESSION_LEVEL = 6
+
+
+def output_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def store_output(session: Session, text: str) -> tuple[str, int]:
+    """
+    Store `text` if it is not stored yet and return (hash, size in bytes).
+    Runs in the session's transaction; concurrent writers of the same
+    text do not conflict.
+    """
+    data = text.encode("utf-8")
+    digest = output_hash(data)
+    values = {
+        "hash": digest,
+        "size": len(data),
+        "data": zlib.compress(data, COMPRESSION_LEVEL),
+    }
+    dialect = session.get_bind().dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        if dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        session.execute(
+            insert(OutputBlob).values(**values).on_conflict_do_nothing(
+                index_elements=["hash"]))
+    elif session.get(OutputBlob, digest) is None:
+        session.add(OutputBlob(**values))
+    return digest, len(data)
+
+
+def read_blob(blob: OutputBlob) -> bytes:
+    return zlib.decompress(blob.data)
+
+
+def log_output(log: ExecutionStepLog) -> str | None:
+    """
+    The log's output: the stored blob once the step has completed, else
+    whatever partial text was written while it ran.
+    """
+    if log.output_hash is not None and log.output_blob is not None:
+        return read_blob(log.output_blob).decode("utf-8")
+    return log.output
@@ -0,0 +1,172 @@
+"""
+Record/replay of LLM calls.
+
+A cassette is a gzip file of JSON lines, one per completed call, holding
+the request (model and prompt), the response content, its latency and
+token usage. In record mode every call is appended; in replay mode calls
+are answered from the cassette without touching the network, either at
+once ("replay") or after the recorded latency ("replay_timed").
+
+A cassette applies process-wide through LLM_CASSETTE_MODE and
+LLM_CASSETTE_PATH, or to a single execution through `use_cassette`,
+which the runner enters for executions started with a cassette mode.
+"""
+
+import asyncio
+import atexit
+import contextvars
+import gzip
+import json
+import os
+import threading
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+from llm_cache import cache_key
+from retry_policy import Deadline, NonRetryableLLMError
+
+MODES = ("record", "replay", "replay_timed")
+CASSETTE_DIR = os.getenv("LLM_CASSETTE_DIR", "cassettes")
+# Buffered records are compressed and appended as one gzip member.
+FLUSH_EVERY = 50
+
+
+def execution_cassette_path(execution_id: int) -> str:
+    return os.path.join(CASSETTE_DIR, f"execution-{execution_id}.jsonl.gz")
+
+
+class CassetteMiss(NonRetryableLLMError):
+    """A replayed call has no matching recording."""
+
+
+class Cassette:
+    def __init__(self, path: str, mode: str):
+        if mode not in MODES:
+            raise ValueError(f"Unknown cassette mode {mode!r}, expected one of {MODES}")
+        self.path = path
+        self.mode = mode
+        self._buffer: list[str] = []
+        self._entries: dict[str, deque[dict]] = defaultdict(deque)
+        self._lock = threading.Lock()
+        if self.replaying:
+            self._load()
+
+    @property
+    def recording(self) -> bool:
+        return self.mode == "record"
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode != "record"
+
+    def _load(self) -> None:
+        if not os.path.exists(self.path):
+            raise FileNotFoundError(f"Cassette not found: {self.path}")
+        with gzip.open(self.path, "rt", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self._entries[entry["key"]].append(entry)
+
+    def record(
+        self,
+        model: str,
+        prompt: str,
+        temperature: float,
+        max_tokens: int,
+        content: str,
+        latency: float,
+        usage: dict | None = None,
+    ) -> None:
+        line = json.dumps({
+            "key": cache_key(model, prompt, temperature, max_tokens),
+            "model": model,
+            "prompt": prompt,
+            "content": content,
+            "latency": round(latency, 4),
+            "usage": usage,
+        }, separators=(",", ":"))
+        with self._lock:
+            self._buffer.append(line)
+            if len(self._buffer) >= FLUSH_EVERY:
+                self._flush_locked()
+
+    async def replay(
+        self,
+        model: str,
+        prompt: str,
+        temperature: float,
+        max_tokens: int,
+        deadline: Deadline | None = None,
+    ) -> dict:
+        """
+        The next recorded entry for this call. Repeated identical calls get
+        the recordings in order, and the last one once they run out.
+        """
+        key = cache_key(model, prompt, temperature, max_tokens)
+        with self._lock:
+            entries = self._entries.get(key)
+            if not entries:
+                raise CassetteMiss(
+                    f"No recording for {model} call in cassette {self.path}")
+            entry = entries.popleft() if len(entries) > 1 else entries[0]
+
+        if self.mode == "replay_timed":
+            delay = entry["latency"]
+            remaining = deadline.remaining() if deadline else None
+            if remaining is not None:
+                delay = min(delay, max(0.0, remaining))
+            await asyncio.sleep(delay)
+        return entry
+
+    def _flush_locked(self) -> None:
+        if not self._buffer:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        data = gzip.compress(("\n".join(self._buffer) + "\n").encode("utf-8"))
+        with open(self.path, "ab") as f:
+            f.write(data)
+        self._buffer.clear()
+
+    def close(self) -> None:
+        """Write out buffered recordings."""
+        with self._lock:
+            self._flush_locked()
+
+
+_current: contextvars.ContextVar[Cassette | None] = contextvars.ContextVar(
+    "cassette", default=None)
+_default: Cassette | None = None
+_default_lock = threading.Lock()
+_default_loaded = False
+
+
+def _default_cassette() -> Cassette | None:
+    global _default, _default_loaded
+    with _default_lock:
+        if not _default_loaded:
+            _default_loaded = True
+            mode = os.getenv("LLM_CASSETTE_MODE")
+            if mode:
+                _default = Cassette(
+                    os.getenv("LLM_CASSETTE_PATH", os.path.join(CASSETTE_DIR, "llm.jsonl.gz")),
+                    mode,
+                )
+                atexit.register(_default.close)
+        return _default
+
+
+def current_cassette() -> Cassette | None:
+    """The execution's cassette, else the process-wide one, if any."""
+    return _current.get() or _default_cassette()
+
+
+@contextmanager
+def use_cassette(cassette: Cassette):
+    """Route LLM calls made in this context (and tasks it starts) through `cassette`."""
+    token = _current.set(cassette)
+    try:
+        yield cassette
+    finally:
+        _current.reset(token)
+        cassette.close()
@@ -0,0 +1,103 @@
+"""Per-model circuit breakers for LLM calls."""
+
+import os
+import threading
+import time
+
+from retry_policy import CircuitOpenError
+
+CLOSED = "CLOSED"
+OPEN = "OPEN"
+HALF_OPEN = "HALF_OPEN"
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive provider failures and
+    rejects calls for `reset_timeout` seconds. After that a single probe
+    call is let through (half-open); its outcome closes or re-opens the
+    breaker.
+    """
+
+    def __init__(self, model: str, failure_threshold: int, reset_timeout: float):
+        self.model = model
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == OPEN and self._cooled_down():
+                return HALF_OPEN
+            return self._state
+
+    def _cooled_down(self) -> bool:
+        return time.monotonic() - self._opened_at >= self.reset_timeout
+
+    def before_call(self) -> None:
+        """Raise CircuitOpenError unless the call may go ahead."""
+        with self._lock:
+            if self._state == CLOSED:
+                return
+            if self._state == OPEN and self._cooled_down():
+                self._state = HALF_OPEN
+            if self._state == HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return
+            error = CircuitOpenError(
+                f"Circuit breaker open for model {self.model}")
+            error.breaker_state = self._state
+            raise error
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._state = CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+            self._probe_in_flight = False
+
+    def release(self) -> None:
+        """End a call whose outcome says nothing about the model's health."""
+        with self._lock:
+            self._probe_in_flight = False
+
+
+class BreakerRegistry:
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._breakers: dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "BreakerRegistry":
+        return cls(
+            failure_threshold=int(os.getenv("LLM_BREAKER_THRESHOLD", "5")),
+            reset_timeout=float(os.getenv("LLM_BREAKER_RESET", "30")),
+        )
+
+    def get(self, model: str) -> CircuitBreaker:
+        with self._lock:
+            breaker = self._breakers.get(model)
+            if breaker is None:
+                breaker = CircuitBreaker(
+                    model, self.failure_threshold, self.reset_timeout)
+                self._breakers[model] = breaker
+            return breaker
+
+    def states(self) -> dict[str, str]:
+        with self._lock:
+            breakers = list(self._breakers.values())
+        return {b.model: b.state for b in breakers}
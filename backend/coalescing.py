@@ -0,0 +1,126 @@
+"""Single-flight coalescing: identical concurrent LLM calls share one request."""
+
+import asyncio
+import os
+import threading
+from collections.abc import Awaitable, Hashable
+from typing import Any, Callable
+
+from retry_policy import Deadline, DeadlineExceeded
+
+Call = Callable[[Any], Awaitable[Any]]
+"""Makes the shared request: (delta callback) -> LLMResponse."""
+
+
+class _Flight:
+    """One shared request, its waiters and the text streamed so far."""
+
+    def __init__(self):
+        self.task: asyncio.Task | None = None
+        self.listeners: list[Callable[[str, str], None]] = []
+        self.text = ""
+        self.waiters = 0
+        self.shared = False
+
+    def report(self, delta: str, text: str) -> None:
+        self.text = text
+        for listener in list(self.listeners):
+            listener(delta, text)
+
+
+class SingleFlight:
+    """
+    Runs each distinct key's call once at a time: a call whose key is
+    already in flight waits for that request instead of sending its own,
+    and gets its result or its error. The request runs in a task of its
+    own, so a caller that is cancelled or runs out of time leaves it
+    running for the others; it is cancelled only when nobody is left
+    waiting. Flights live on the loop that started them.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.started = 0
+        self.joined = 0
+        self._flights: dict[Hashable, _Flight] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "SingleFlight":
+        return cls(enabled=os.getenv("LLM_COALESCE", "1").lower() not in ("0", "false", "no"))
+
+    def _forget(self, key: Hashable, flight: _Flight) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    def _finished(self, key: Hashable, flight: _Flight) -> None:
+        self._forget(key, flight)
+        # Its waiters may all have gone: the error is theirs to see, not asyncio's to log.
+        if not flight.task.cancelled():
+            flight.task.exception()
+
+    async def run(
+        self,
+        key: Hashable,
+        call: Call,
+        on_delta: Callable[[str, str], None] | None = None,
+        deadline: Deadline | None = None,
+    ) -> tuple[Any, bool]:
+        """
+        `call(report)` for the first caller with `key`, shared with every
+        caller that arrives before it finishes. Deltas are reported to all
+        of them; a late joiner first gets the text streamed so far as one
+        delta. Each caller waits within its own `deadline`, and a joiner
+        whose request ran out of the first caller's deadline while its own
+        has time left starts over. Returns (result, joined).
+        """
+        while True:
+            flight = self._flights.get(key)
+            joined = flight is not None
+            if flight is None:
+                flight = self._flights[key] = _Flight()
+                flight.task = asyncio.create_task(call(flight.report))
+                flight.task.add_done_callback(
+                    lambda _, key=key, flight=flight: self._finished(key, flight))
+                with self._lock:
+                    self.started += 1
+            else:
+                with self._lock:
+                    self.joined += 1
+                flight.shared = True
+                if on_delta is not None and flight.text:
+                    on_delta(flight.text, flight.text)
+            if on_delta is not None:
+                flight.listeners.append(on_delta)
+            flight.waiters += 1
+            try:
+                done, _ = await asyncio.wait(
+                    {flight.task}, timeout=deadline.remaining() if deadline else None)
+                if not done:
+                    expired = DeadlineExceeded(
+                        "Step deadline exceeded waiting for a shared LLM call" if flight.shared
+                        else "Step deadline exceeded during LLM call")
+                    expired.attempts = 0
+                    raise expired
+            finally:
+                flight.waiters -= 1
+                if on_delta is not None:
+                    flight.listeners.remove(on_delta)
+                if flight.waiters == 0 and not flight.task.done():
+                    self._forget(key, flight)
+                    flight.task.cancel()
+            error = None if flight.task.cancelled() else flight.task.exception()
+            if (joined and isinstance(error, DeadlineExceeded)
+                    and (deadline is None or deadline.allows(0))):
+                self._forget(key, flight)
+                continue
+            return flight.task.result(), joined
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "in_flight": len(self._flights),
+                "started": self.started,
+                "joined": self.joined,
+            }
@@ -0,0 +1,90 @@
+import asyncio
+import json
+import os
+import tempfile
+
+import httpx
+import pytest
+
+# Point database.py at a throwaway SQLite file before any test imports it.
+os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/test.db"
+
+# test_llm.py and test_runner.py are scripts that call the live LLM API
+# when imported; run them by hand, not under pytest.
+collect_ignore = ["test_llm.py", "test_runner.py"]
+
+
+@pytest.fixture(scope="session", autouse=True)
+def schema():
+    from database import engine
+    from migrations import upgrade
+
+    upgrade(engine)
+
+
+def completion(content: str) -> httpx.Response:
+    return httpx.Response(200, json={
+        "choices": [{"message": {"content": content}}],
+        "usage": {"prompt_tokens": 3, "completion_tokens": 2},
+    })
+
+
+class Gateway:
+    """
+    A chat completions endpoint for LLMClient, served through an
+    httpx.MockTransport. Each request is recorded and answered by
+    `handler(payload)`, which by default echoes the prompt. While `gate`
+    is set, requests wait for it first.
+    """
+
+    def __init__(self):
+        self.requests: list[dict] = []
+        self.cancelled = 0
+        self.gate: asyncio.Event | None = None
+        self.handler = self.echo
+
+    @staticmethod
+    async def echo(payload: dict) -> httpx.Response:
+        return completion(f"{payload['model']}: {payload['messages'][0]['content']}")
+
+    def hold(self) -> asyncio.Event:
+        self.gate = asyncio.Event()
+        return self.gate
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        payload = json.loads(request.content)
+        self.requests.append(payload)
+        try:
+            if self.gate is not None:
+                await self.gate.wait()
+            return await self.handler(payload)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+
+    def client(self, **kwargs):
+        from circuit_breaker import BreakerRegistry
+        from coalescing import SingleFlight
+        from hedging import Hedger
+        from llm_cache import ResponseCache
+        from llm_client import LLMClient, LLMConfig
+        from rate_limit import RateLimiter
+        from retry_policy import RetryPolicy
+
+        options = {
+            "config": LLMConfig(api_key="test", api_url="http://llm.test/v1/chat/completions"),
+            "transport": httpx.MockTransport(self.handle),
+            "cache": ResponseCache(64, 60, 60),
+            "retry_policy": RetryPolicy(base_delay=0.01, jitter=False),
+            "breakers": BreakerRegistry(failure_threshold=5, reset_timeout=30),
+            "limiter": RateLimiter({}),
+            "hedger": Hedger(),
+            "coalescer": SingleFlight(),
+        }
+        options.update(kwargs)
+        return LLMClient(**options)
+
+
+@pytest.fixture
+def gateway() -> Gateway:
+    return Gateway()
@@ -0,0 +1,247 @@
+"""
+Context assembly: which earlier outputs go into a step's prompt, and how
+much of each.
+
+A step's `context` says how each output is cut down:
+
+    full                    the whole output (the default)
+    tail:<n>                its last n tokens
+    tail_chars:<n>          its last n characters
+    head_tail:<n>           its first and last n/2 tokens
+    head_tail_chars:<n>     its first and last n/2 characters
+    regex:<pattern>         the pattern's matches (group 1 if it has groups), one per line
+    json:<path>             the value at a dotted path into the output parsed
+                            as JSON, e.g. json:items.0.name
+
+By default the outputs are those of the step's parents; `context_steps`
+names other earlier steps (by step_order) to take them from instead.
+`context_max_tokens` (or CONTEXT_MAX_TOKENS) is a hard budget on the
+whole prompt: outputs are trimmed to their tails, the largest first,
+until it fits, and a prompt that cannot fit fails the step before any
+LLM call. Token counts are tokens.estimate_tokens approximations.
+"""
+
+import json
+import os
+import re
+from collections.abc import Sequence
+from dataclasses import dataclass
+from functools import lru_cache
+
+from criteria import parse_json_output
+from graph import resolve_dependencies
+from tokens import estimate_tokens, head_tokens, tail_tokens
+
+CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", "0")) or None
+OMITTED = "[...]"
+_OMITTED_TOKENS = estimate_tokens(OMITTED) + 1
+
+
+def format_prompt(prompt: str, outputs: Sequence[tuple[int, str]]) -> str:
+    """Prefix the prompt with (step_order, output) pairs; empty outputs are left out."""
+    outputs = [(order, out) for order, out in outputs
+               if out is not None and out.strip() != ""]
+    if not outputs:
+        return prompt
+    if len(outputs) == 1:
+        return f"Previous step output:\n{outputs[0][1]}\n\nCurrent step:\n{prompt}"
+    sections = "\n\n".join(
+        f"Output of step {order}:\n{out}" for order, out in outputs)
+    return f"{sections}\n\nCurrent step:\n{prompt}"
+
+
+class Extractor:
+    """Cuts one output down to what goes into the prompt; the base keeps it whole."""
+
+    def apply(self, output: str) -> str:
+        return output
+
+
+class Truncate(Extractor):
+    def __init__(self, limit: int, chars: bool, keep_head: bool):
+        if limit < (2 if keep_head else 1):
+            raise ValueError(f"Context size must be at least {2 if keep_head else 1}")
+        self.limit = limit
+        self.chars = chars
+        self.keep_head = keep_head
+
+    def _head(self, text: str, limit: int) -> str:
+        return text[:limit] if self.chars else head_tokens(text, limit)
+
+    def _tail(self, text: str, limit: int) -> str:
+        return text[max(0, len(text) - limit):] if self.chars else tail_tokens(text, limit)
+
+    def apply(self, output: str) -> str:
+        if not self.keep_head:
+            tail = self._tail(output, self.limit)
+            if len(tail) == len(output):
+                return output
+            cut = f"{OMITTED}\n{tail.lstrip()}"
+        else:
+            half = self.limit // 2
+            head = self._head(output, half)
+            tail = self._tail(output, self.limit - half)
+            if len(head) + len(tail) >= len(output):
+                return output
+            cut = f"{head.rstrip()}\n{OMITTED}\n{tail.lstrip()}"
+        # Barely over the limit, the marker would cost more than it saves.
+        return cut if estimate_tokens(cut) < estimate_tokens(output) else output
+
+
+class RegexExtract(Extractor):
+    def __init__(self, pattern: str):
+        try:
+            self._pattern = re.compile(pattern)
+        except re.error as e:
+            raise ValueError(f"Invalid context regex: {e}")
+
+    def apply(self, output: str) -> str:
+        group = 1 if self._pattern.groups else 0
+        return "\n".join(
+            match.group(group) or "" for match in self._pattern.finditer(output))
+
+
+class JsonPath(Extractor):
+    def __init__(self, path: str):
+        self.path = [part for part in path.strip().removeprefix("$").split(".") if part]
+
+    def apply(self, output: str) -> str:
+        try:
+            value = parse_json_output(output)
+        except ValueError:
+            return ""
+        for part in self.path:
+            if isinstance(value, list) and part.lstrip("-").isdigit():
+                index = int(part)
+                value = value[index] if -len(value) <= index < len(value) else None
+            elif isinstance(value, dict):
+                value = value.get(part)
+            else:
+                value = None
+            if value is None:
+                return ""
+        return value if isinstance(value, str) else json.dumps(value, ensure_ascii=False)
+
+
+def _parse_size(arg: str) -> int:
+    try:
+        return int(arg.strip())
+    except ValueError:
+        raise ValueError(f"Invalid context size: {arg!r}")
+
+
+@lru_cache(maxsize=1024)
+def compile_context(context: str | None) -> Extractor:
+    """
+    Parse a context string (see the module docstring). Results are cached
+    per distinct string. Raises ValueError for malformed ones.
+    """
+    if not context or not context.strip() or context.strip().lower() == "full":
+        return Extractor()
+    kind, sep, arg = context.strip().partition(":")
+    kind = kind.strip().lower()
+    if not sep:
+        raise ValueError(f"Unknown context mode: {context!r}")
+    if kind in ("tail", "tail_chars", "head_tail", "head_tail_chars"):
+        return Truncate(_parse_size(arg), chars=kind.endswith("_chars"),
+                        keep_head=kind.startswith("head_tail"))
+    if kind == "regex":
+        return RegexExtract(arg)
+    if kind == "json":
+        return JsonPath(arg)
+    raise ValueError(f"Unknown context mode: {context!r}")
+
+
+@dataclass(frozen=True)
+class AssembledPrompt:
+    """A prompt with its context, and estimated token counts."""
+
+    text: str
+    tokens: int
+    full_tokens: int  # had every output gone in whole
+
+
+class ContextPolicy:
+    """A step's compiled context settings."""
+
+    def __init__(self, context: str | None = None, max_tokens: int | None = None):
+        self.extractor = compile_context(context)
+        self.max_tokens = max_tokens or CONTEXT_MAX_TOKENS
+
+    def assemble(self, prompt: str, outputs: Sequence[tuple[int, str]]) -> AssembledPrompt:
+        """
+        The prompt with `outputs` (step_order, output pairs) as context.
+        Raises ValueError if it cannot be brought under the token budget.
+        """
+        full = format_prompt(prompt, outputs)
+        full_tokens = estimate_tokens(full)
+        if type(self.extractor) is Extractor and (
+                self.max_tokens is None or full_tokens <= self.max_tokens):
+            return AssembledPrompt(full, full_tokens, full_tokens)
+
+        outputs = [(order, self.extractor.apply(out)) for order, out in outputs]
+        text = format_prompt(prompt, outputs)
+        tokens = estimate_tokens(text)
+        if self.max_tokens is not None and tokens > self.max_tokens:
+            text = self._fit(prompt, outputs)
+            tokens = estimate_tokens(text)
+        return AssembledPrompt(text, tokens, full_tokens)
+
+    def _fit(self, prompt: str, outputs: list[tuple[int, str]]) -> str:
+        """Trim outputs to their tails, sharing the budget left after the prompt."""
+        outputs = [(order, out) for order, out in outputs if out and out.strip()]
+        frame = estimate_tokens(format_prompt(prompt, [(order, OMITTED) for order, _ in outputs]))
+        available = self.max_tokens - frame
+        if available < 0 or (outputs and available < len(outputs)):
+            raise ValueError(
+                f"Prompt needs about {frame} tokens before any context, over the "
+                f"budget of {self.max_tokens}")
+        sizes = [estimate_tokens(out) for _, out in outputs]
+        # The smallest outputs take what they need; the rest share the remainder.
+        shares = [0] * len(outputs)
+        remaining = available
+        by_size = sorted(range(len(outputs)), key=sizes.__getitem__)
+        for position, index in enumerate(by_size):
+            shares[index] = min(sizes[index], remaining // (len(outputs) - position))
+            remaining -= shares[index]
+        trimmed = []
+        for (order, out), size, share in zip(outputs, sizes, shares):
+            if size > share:
+                out = f"{OMITTED}\n{tail_tokens(out, max(0, share - _OMITTED_TOKENS)).lstrip()}"
+            trimmed.append((order, out))
+        return format_prompt(prompt, trimmed)
+
+
+def resolve_context_steps(
+    step_orders: Sequence[int],
+    kinds: Sequence[str],
+    context_steps: Sequence[Sequence[int] | None],
+    parents: Sequence[Sequence[int]],
+) -> list[list[int]]:
+    """
+    Map each step (by position) to the positions whose outputs form its
+    context: its parents, or the steps it names. Named steps must be
+    ancestors of the step, so their outputs exist when it runs; map steps
+    take their context from their items and cannot name any.
+    """
+    named = resolve_dependencies(step_orders, context_steps)
+    sources = []
+    for index, declared in enumerate(context_steps):
+        if declared is None:
+            sources.append(list(parents[index]))
+            continue
+        if kinds[index] == "map":
+            raise ValueError(f"Map step {step_orders[index]} cannot set context_steps")
+        ancestors, stack = set(), list(parents[index])
+        while stack:
+            parent = stack.pop()
+            if parent not in ancestors:
+                ancestors.add(parent)
+                stack.extend(parents[parent])
+        for source in named[index]:
+            if source not in ancestors:
+                raise ValueError(
+                    f"Step {step_orders[index]} takes context from step "
+                    f"{step_orders[source]}, which it does not depend on")
+        sources.append(named[index])
+    return sources
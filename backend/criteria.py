@@ -0,0 +1,301 @@
+"""
+Completion criteria: parsed once into Criterion objects and cached.
+
+A step's criteria string takes one of these forms:
+
+    HELLO                      case-insensitive substring (the default)
+    regex:<pattern>            re.search on the output
+    any:word1, word2           at least one keyword, case-insensitive
+    all:word1, word2           every keyword, case-insensitive
+    len:<min>..<max>           output length in characters; either bound optional
+    json                       output parses as JSON (a ```json fence is allowed)
+    json_schema:<schema>       output parses and matches a JSON Schema subset
+
+Prefixing substring, keyword and regex criteria with `stop:` makes them
+terminating: a streamed completion is cut off as soon as the text received
+so far matches. That is only safe when more text cannot un-match it, which
+holds for substrings and keywords but not for regexes that look at what
+follows the match, so `stop:regex:` rejects patterns with end anchors,
+word boundaries or negative lookaheads.
+"""
+
+import json
+import re
+from functools import lru_cache
+from typing import Any, Callable
+
+StreamCheck = Callable[[str], bool]
+"""Called with the text streamed so far; True once the criterion is met."""
+
+
+class Criterion:
+    """A compiled completion criterion."""
+
+    # Whether a match on a prefix of the output ends generation.
+    early_stop = False
+
+    def check(self, output: str) -> bool:
+        raise NotImplementedError
+
+    def stream_check(self) -> StreamCheck:
+        """A fresh checker for one streamed completion."""
+        return self.check
+
+
+class Always(Criterion):
+    def check(self, output: str) -> bool:
+        return True
+
+
+class Keywords(Criterion):
+    """
+    Any-of or all-of keyword sets, found in one pass with a single compiled
+    alternation inside a lookahead, so it is tried at every position and
+    overlapping keywords ("ab" and "bc" in "abc") are all found. Longer
+    keywords are tried first, and a match also counts for every shorter
+    keyword it contains.
+    """
+
+    def __init__(self, keywords: list[str], require_all: bool, early_stop: bool = False):
+        keywords = list(dict.fromkeys(k.lower() for k in keywords))
+        if not keywords:
+            raise ValueError("Keyword criteria need at least one keyword")
+        self.keywords = keywords
+        self.require_all = require_all
+        self.early_stop = early_stop
+        alternation = "|".join(
+            re.escape(k) for k in sorted(keywords, key=len, reverse=True))
+        self._pattern = re.compile(f"(?=({alternation}))", re.IGNORECASE)
+        self._implies = {k: {other for other in keywords if other in k} for k in keywords}
+        self._overlap = max(len(k) for k in keywords) - 1
+
+    def _satisfied(self, found: set[str]) -> bool:
+        return len(found) == len(self.keywords) if self.require_all else bool(found)
+
+    def _scan(self, text: str, start: int, found: set[str]) -> bool:
+        for match in self._pattern.finditer(text, start):
+            found |= self._implies.get(match.group(1).lower(), set())
+            if self._satisfied(found):
+                return True
+        return False
+
+    def check(self, output: str) -> bool:
+        return self._scan(output, 0, set())
+
+    def stream_check(self) -> StreamCheck:
+        found: set[str] = set()
+        scanned = 0
+
+        def check(text: str) -> bool:
+            # Only rescan the new text plus enough of the old to catch a
+            # keyword split across deltas.
+            nonlocal scanned
+            start = max(0, scanned - self._overlap)
+            scanned = len(text)
+            return self._scan(text, start, found)
+
+        return check
+
+
+# Regex syntax whose match can be undone by text arriving after it.
+_END_SENSITIVE = {"$", r"\Z", r"\b", r"\B", "(?!"}
+
+
+def _end_sensitive(pattern: str) -> bool:
+    # Conservative: a "$" inside a character class counts too.
+    return any(token in _END_SENSITIVE
+               for token in re.findall(r"\\.|\(\?!|.", pattern, re.DOTALL))
+
+
+class Regex(Criterion):
+    def __init__(self, pattern: str, early_stop: bool = False):
+        try:
+            self._pattern = re.compile(pattern)
+        except re.error as e:
+            raise ValueError(f"Invalid regex criteria: {e}")
+        if early_stop and _end_sensitive(pattern):
+            raise ValueError(
+                "stop: regex criteria cannot use $, \\Z, \\b, \\B or (?!...), "
+                "since later text could undo the match")
+        self.early_stop = early_stop
+
+    def check(self, output: str) -> bool:
+        return self._pattern.search(output) is not None
+
+
+class Length(Criterion):
+    def __init__(self, minimum: int | None, maximum: int | None):
+        self.minimum = minimum
+        self.maximum = maximum
+
+    def check(self, output: str) -> bool:
+        length = len(output.strip())
+        if self.minimum is not None and length < self.minimum:
+            return False
+        return self.maximum is None or length <= self.maximum
+
+
+_FENCE = re.compile(r"^```(?:json)?\s*\n(.*?)\n?```$", re.DOTALL)
+
+
+def parse_json_output(output: str) -> Any:
+    """Parse an output as JSON, unwrapping a Markdown code fence if present."""
+    text = output.strip()
+    fenced = _FENCE.match(text)
+    if fenced:
+        text = fenced.group(1)
+    return json.loads(text)
+
+
+class Json(Criterion):
+    def __init__(self, schema: dict | None = None):
+        if schema is not None:
+            _check_schema(schema)
+        self.schema = schema
+
+    def check(self, output: str) -> bool:
+        try:
+            value = parse_json_output(output)
+        except ValueError:
+            return False
+        return self.schema is None or _matches(value, self.schema)
+
+
+_TYPES = {
+    "object": dict,
+    "array": list,
+    "string": str,
+    "integer": int,
+    "number": (int, float),
+    "boolean": bool,
+    "null": type(None),
+}
+_SUPPORTED_KEYWORDS = {
+    "type", "properties", "required", "additionalProperties", "items",
+    "enum", "const", "minLength", "maxLength", "minimum", "maximum",
+    "minItems", "maxItems", "pattern", "$schema", "title", "description",
+}
+
+
+def _check_schema(schema: Any) -> None:
+    """Reject schemas using keywords _matches does not implement."""
+    if not isinstance(schema, dict):
+        raise ValueError("JSON schema must be an object")
+    unsupported = set(schema) - _SUPPORTED_KEYWORDS
+    if unsupported:
+        raise ValueError(f"Unsupported JSON schema keywords: {sorted(unsupported)}")
+    types = schema.get("type", [])
+    for name in types if isinstance(types, list) else [types]:
+        if name not in _TYPES:
+            raise ValueError(f"Unknown JSON schema type: {name}")
+    for sub in schema.get("properties", {}).values():
+        _check_schema(sub)
+    for key in ("items", "additionalProperties"):
+        if isinstance(schema.get(key), dict):
+            _check_schema(schema[key])
+    if "pattern" in schema:
+        Regex(schema["pattern"])
+
+
+def _is_type(value: Any, name: str) -> bool:
+    # bool is a subclass of int, but not a JSON number.
+    if isinstance(value, bool) and name in ("integer", "number"):
+        return False
+    return isinstance(value, _TYPES[name])
+
+
+def _matches(value: Any, schema: dict) -> bool:
+    """Validate against the JSON Schema subset listed in _SUPPORTED_KEYWORDS."""
+    if "type" in schema:
+        types = schema["type"] if isinstance(schema["type"], list) else [schema["type"]]
+        if not any(_is_type(value, name) for name in types):
+            return False
+    if "enum" in schema and value not in schema["enum"]:
+        return False
+    if "const" in schema and value != schema["const"]:
+        return False
+
+    if isinstance(value, str):
+        if len(value) < schema.get("minLength", 0):
+            return False
+        if "maxLength" in schema and len(value) > schema["maxLength"]:
+            return False
+        if "pattern" in schema and not re.search(schema["pattern"], value):
+            return False
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        if "minimum" in schema and value < schema["minimum"]:
+            return False
+        if "maximum" in schema and value > schema["maximum"]:
+            return False
+    elif isinstance(value, list):
+        if len(value) < schema.get("minItems", 0):
+            return False
+        if "maxItems" in schema and len(value) > schema["maxItems"]:
+            return False
+        if "items" in schema and not all(_matches(v, schema["items"]) for v in value):
+            return False
+    elif isinstance(value, dict):
+        if any(key not in value for key in schema.get("required", [])):
+            return False
+        properties = schema.get("properties", {})
+        for key, item in value.items():
+            if key in properties:
+                if not _matches(item, properties[key]):
+                    return False
+                continue
+            extra = schema.get("additionalProperties", True)
+            if extra is False or (isinstance(extra, dict) and not _matches(item, extra)):
+                return False
+    return True
+
+
+def _parse_bound(text: str) -> int | None:
+    text = text.strip()
+    return int(text) if text else None
+
+
+@lru_cache(maxsize=1024)
+def compile_criteria(criteria: str | None) -> Criterion:
+    """
+    Parse a criteria string (see the module docstring). Results are cached,
+    so each distinct string is compiled once per process. Raises ValueError
+    for malformed criteria.
+    """
+    if not criteria or not criteria.strip():
+        return Always()
+    text = criteria.strip()
+
+    early_stop = False
+    if text.startswith("stop:"):
+        early_stop = True
+        text = text[len("stop:"):].strip()
+
+    kind, sep, arg = text.partition(":")
+    kind = kind.strip().lower() if sep else ""
+
+    if kind == "regex":
+        criterion = Regex(arg, early_stop)
+    elif kind in ("any", "all"):
+        keywords = [k.strip() for k in arg.split(",") if k.strip()]
+        criterion = Keywords(keywords, require_all=kind == "all", early_stop=early_stop)
+    elif kind == "len":
+        low, dots, high = arg.partition("..")
+        try:
+            criterion = Length(_parse_bound(low), _parse_bound(high) if dots else None)
+        except ValueError:
+            raise ValueError(f"Invalid length criteria: {arg!r}, expected <min>..<max>")
+    elif kind == "json_schema":
+        try:
+            schema = json.loads(arg)
+        except ValueError as e:
+            raise ValueError(f"Invalid JSON schema in criteria: {e}")
+        criterion = Json(schema)
+    elif text.lower() == "json":
+        criterion = Json()
+    else:
+        criterion = Keywords([text], require_all=True, early_stop=early_stop)
+
+    if early_stop and not criterion.early_stop:
+        raise ValueError(
+            "Only substring, keyword and regex criteria can stop generation early")
+    return criterion
@@ -1,14 +1,105 @@
-"""SQLAlchemy setup for SQLite database."""
+"""
+SQLAlchemy setup. SQLite by default; any URL via DATABASE_URL.
 
-from sqlalchemy import create_engine
-from sqlalchemy.orm import declarative_base, sessionmaker
+The sync engine serves the API and background threads. The runner uses
+the async engine, whose connections belong to the engine loop (see
+engine_loop.py): only use AsyncSessionLocal from coroutines running there.
+The async engine is created on first use, so tools that only use the sync
+engine do not need the async driver installed.
+"""
 
-DATABASE_URL = "sqlite:///workflow.db"
+import os
+import threading
 
-engine = create_engine(
-    DATABASE_URL,
-    connect_args={"check_same_thread": False},
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine,
 )
+from sqlalchemy.orm import declarative_base, sessionmaker
+
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///workflow.db")
+
+# SQLite: how long a writer waits for the lock before "database is locked".
+SQLITE_BUSY_TIMEOUT = float(os.getenv("SQLITE_BUSY_TIMEOUT", "30"))
+# Set SQLITE_TUNING=0 to keep SQLite's default rollback journal.
+SQLITE_TUNING = os.getenv("SQLITE_TUNING", "1").lower() in ("1", "true", "yes")
+
+
+# Async drivers for the sync URLs DATABASE_URL may use.
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg": "postgresql+psycopg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+}
+
+
+def async_url(url: str) -> str:
+    """DATABASE_URL with its driver swapped for an async one."""
+    scheme, sep, rest = url.partition("://")
+    return ASYNC_DRIVERS.get(scheme, scheme) + sep + rest
+
+
+def _create_engine(url: str, create=create_engine):
+    if url.startswith("sqlite"):
+        engine = create(
+            url,
+            connect_args={"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT},
+        )
+        if SQLITE_TUNING and ":memory:" not in url:
+            event.listen(getattr(engine, "sync_engine", engine), "connect", _tune_sqlite)
+        return engine
+    return create(
+        url,
+        pool_size=int(os.getenv("DB_POOL_SIZE", "10")),
+        max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "20")),
+        pool_timeout=float(os.getenv("DB_POOL_TIMEOUT", "30")),
+        pool_pre_ping=True,
+    )
+
+
+def _tune_sqlite(dbapi_connection, connection_record) -> None:
+    """
+    WAL lets readers run alongside the single writer, and synchronous=NORMAL
+    only fsyncs at checkpoints, which is still crash-safe under WAL.
+    Incremental auto-vacuum (effective for new files, or after a VACUUM)
+    lets retention hand freed pages back without a blocking VACUUM.
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={int(SQLITE_BUSY_TIMEOUT * 1000)}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+
+engine = _create_engine(DATABASE_URL)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Runner objects stay readable after commit: reloading them would need I/O.
+_async_sessions = async_sessionmaker(autoflush=False, expire_on_commit=False)
 Base = declarative_base()
+
+_async_engine: AsyncEngine | None = None
+_async_engine_lock = threading.Lock()
+
+
+def get_async_engine() -> AsyncEngine:
+    """The async engine for DATABASE_URL, created on first use."""
+    global _async_engine
+    with _async_engine_lock:
+        if _async_engine is None:
+            url = async_url(DATABASE_URL)
+            try:
+                _async_engine = _create_engine(url, create_async_engine)
+            except ImportError as e:
+                raise RuntimeError(
+                    f"The async driver for {url.partition('://')[0]} is not installed "
+                    f"({e}); install it, see requirements.txt") from e
+        return _async_engine
+
+
+def AsyncSessionLocal() -> AsyncSession:
+    """A new session on the async engine."""
+    return _async_sessions(bind=get_async_engine())
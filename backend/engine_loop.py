@@ -0,0 +1,122 @@
+"""
+The process's execution event loop.
+
+Executions, their steps and their LLM calls are coroutines, and all of
+them run on one event loop in a background thread, so a process keeps
+hundreds of executions in flight without a thread each. The loop also
+owns the per-loop resources they share: the LLM client's HTTP connection
+pool and the async database engine's connections. Sync code hands work to
+it with `run` (blocking) or `submit` (a concurrent Future); async code on
+another loop, such as the API's, awaits `submit(...)` via
+asyncio.wrap_future.
+"""
+
+import asyncio
+import contextvars
+import logging
+import threading
+from collections.abc import Callable, Coroutine
+from concurrent.futures import Future
+from typing import Any, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class EngineLoop:
+    def __init__(self):
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        """The running loop, started on first use."""
+        with self._lock:
+            if self._loop is None or self._loop.is_closed():
+                ready = threading.Event()
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(
+                    target=self._run, args=(self._loop, ready),
+                    name="engine-loop", daemon=True)
+                self._thread.start()
+                ready.wait()
+            return self._loop
+
+    @staticmethod
+    def _run(loop: asyncio.AbstractEventLoop, ready: threading.Event) -> None:
+        asyncio.set_event_loop(loop)
+        loop.call_soon(ready.set)
+        try:
+            loop.run_forever()
+        finally:
+            loop.close()
+
+    def in_loop(self) -> bool:
+        return self._thread is not None and threading.current_thread() is self._thread
+
+    def submit(self, coro: Coroutine[Any, Any, T]) -> "Future[T]":
+        """
+        Schedule `coro` on the loop in a copy of the caller's context, so
+        an active cassette or span carries over. Cancelling the returned
+        Future cancels the coroutine.
+        """
+        return asyncio.run_coroutine_threadsafe(
+            _in_context(coro, contextvars.copy_context()), self.loop)
+
+    def call_soon(self, callback: Callable[..., Any], *args: Any) -> None:
+        """Call `callback(*args)` on the loop, from any thread."""
+        self.loop.call_soon_threadsafe(callback, *args)
+
+    def run(self, coro: Coroutine[Any, Any, T]) -> T:
+        """Run `coro` on the loop and wait for its result."""
+        if self.in_loop():
+            coro.close()
+            raise RuntimeError("EngineLoop.run() called from the engine loop itself")
+        return self.submit(coro).result()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Cancel whatever is still running, then stop the loop."""
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            self._loop = self._thread = None
+        if loop is None or loop.is_closed():
+            return
+
+        async def cancel_all() -> None:
+            tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await loop.shutdown_asyncgens()
+
+        try:
+            asyncio.run_coroutine_threadsafe(cancel_all(), loop).result(timeout)
+        except Exception:
+            logger.exception("Engine loop did not shut down cleanly")
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout)
+
+
+async def _in_context(coro: Coroutine[Any, Any, T], context: contextvars.Context) -> T:
+    return await asyncio.get_running_loop().create_task(coro, context=context)
+
+
+engine_loop = EngineLoop()
+
+
+def submit(coro: Coroutine[Any, Any, T]) -> "Future[T]":
+    return engine_loop.submit(coro)
+
+
+def run(coro: Coroutine[Any, Any, T]) -> T:
+    return engine_loop.run(coro)
+
+
+def call_soon(callback: Callable[..., Any], *args: Any) -> None:
+    engine_loop.call_soon(callback, *args)
+
+
+def stop_loop() -> None:
+    engine_loop.stop()
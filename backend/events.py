@@ -0,0 +1,71 @@
+"""In-process publish/subscribe of execution progress events."""
+
+import asyncio
+import threading
+from collections import defaultdict
+
+
+class Subscription:
+    """
+    An asyncio-side queue of events for one execution. Publishers run on
+    the engine loop, so events are handed to the subscriber's loop with
+    call_soon_threadsafe. A subscriber that falls more than `max_pending`
+    events behind is marked `lagged` and should resync from the database.
+    """
+
+    def __init__(self, execution_id: int, max_pending: int):
+        self.execution_id = execution_id
+        self.lagged = False
+        self._loop = asyncio.get_running_loop()
+        self._queue: asyncio.Queue[dict] = asyncio.Queue(maxsize=max_pending)
+
+    def _put(self, event: dict) -> None:
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.lagged = True
+
+    def deliver(self, event: dict) -> None:
+        self._loop.call_soon_threadsafe(self._put, event)
+
+    async def get(self, timeout: float) -> dict | None:
+        """Next event, or None if nothing arrived within `timeout` seconds."""
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class EventBus:
+    def __init__(self, max_pending: int = 1000):
+        self.max_pending = max_pending
+        self._subscribers: dict[int, set[Subscription]] = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, execution_id: int) -> Subscription:
+        """Must be called from the event loop that will consume events."""
+        subscription = Subscription(execution_id, self.max_pending)
+        with self._lock:
+            self._subscribers[execution_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.execution_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.execution_id]
+
+    def publish(self, execution_id: int, event: dict) -> None:
+        with self._lock:
+            subscribers = list(self._subscribers.get(execution_id, ()))
+        for subscription in subscribers:
+            try:
+                subscription.deliver(event)
+            except RuntimeError:
+                # The subscriber's event loop has already closed.
+                self.unsubscribe(subscription)
+
+
+bus = EventBus()
@@ -0,0 +1,252 @@
+"""
+Where queued executions run.
+
+With EXECUTION_QUEUE=local (the default) they run as coroutines on this
+process's engine loop, with a bounded backlog. With
+EXECUTION_QUEUE=database this process only enqueues them, and worker
+processes (worker.py) claim and run them. Either way an execution only
+runs while its runner holds the lease.
+"""
+
+import asyncio
+import logging
+import os
+import threading
+from collections.abc import Callable
+from concurrent import futures
+from datetime import datetime
+
+from sqlalchemy import func
+from sqlalchemy.orm import joinedload
+
+import engine_loop
+from database import AsyncSessionLocal, SessionLocal
+from leases import acquire, get_keeper, release
+from models import Execution
+from runner import cancel_execution, execute_async
+
+logger = logging.getLogger(__name__)
+
+EXECUTION_QUEUE = os.getenv("EXECUTION_QUEUE", "local")
+# Executions are coroutines, so running many at once costs little.
+DEFAULT_WORKERS = int(os.getenv("WORKFLOW_WORKERS", "64"))
+DEFAULT_QUEUE_SIZE = int(os.getenv("WORKFLOW_QUEUE_SIZE", "256"))
+# Database queue: most executions waiting for a worker, and how often to poll.
+DATABASE_QUEUE_SIZE = int(os.getenv("DATABASE_QUEUE_SIZE", "1000"))
+QUEUE_POLL_INTERVAL = float(os.getenv("QUEUE_POLL_INTERVAL", "0.5"))
+FINISHED_STATUSES = ("SUCCESS", "FAILED", "CANCELLED", "TIMED_OUT")
+
+
+class QueueFullError(Exception):
+    """Raised when the pool has no free worker or queue slot."""
+
+
+async def run_execution(execution_id: int, claimed: bool = False) -> None:
+    """
+    Run a queued execution with its own database session, holding its
+    lease throughout. Unless already `claimed`, the lease is taken first,
+    and the execution skipped if another process holds it.
+    """
+    keeper = get_keeper()
+    async with AsyncSessionLocal() as db:
+        try:
+            if not claimed and not await db.run_sync(acquire, execution_id, keeper.owner):
+                logger.info("Execution %s is leased by another process or no longer queued",
+                            execution_id)
+                return
+            keeper.hold(execution_id, cancel_execution)
+            # The workflow row comes along; its steps only load on a plan miss.
+            execution = await db.get(
+                Execution, execution_id, options=[joinedload(Execution.workflow)])
+            if execution is not None:
+                await execute_async(execution, db)
+        except Exception as e:
+            logger.exception("Execution %s crashed: %s", execution_id, e)
+        finally:
+            keeper.drop(execution_id)
+            try:
+                await db.rollback()
+                await db.run_sync(release, execution_id, keeper.owner)
+            except Exception:
+                logger.exception("Could not release the lease on execution %s", execution_id)
+
+
+class ExecutionPool:
+    """
+    Runs executions on the engine loop with a bounded backlog. At most
+    `max_workers` executions run at once and at most `max_queued` more
+    wait for a turn; anything beyond that is rejected with QueueFullError
+    so callers can apply backpressure.
+    """
+
+    def __init__(self, max_workers: int, max_queued: int):
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self._running = asyncio.Semaphore(max_workers)
+        self._slots = threading.BoundedSemaphore(max_workers + max_queued)
+        self._futures: set[futures.Future] = set()
+        self._waiting: dict[int, futures.Future] = {}
+        self._lock = threading.Lock()
+
+    async def _run(self, execution_id: int) -> None:
+        async with self._running:
+            with self._lock:
+                self._waiting.pop(execution_id, None)
+            await run_execution(execution_id)
+
+    def submit(
+        self,
+        execution_id: int,
+        block: bool = False,
+        on_done: Callable[[], None] | None = None,
+    ) -> None:
+        """
+        Queue an execution. With `block` the caller waits for a free slot
+        instead of getting QueueFullError; `on_done` runs once the
+        execution has finished, whatever its outcome.
+        """
+        if not self._slots.acquire(blocking=block):
+            raise QueueFullError("Execution queue is full")
+        try:
+            future = engine_loop.submit(self._run(execution_id))
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._futures.add(future)
+            self._waiting[execution_id] = future
+
+        def release(_) -> None:
+            with self._lock:
+                self._futures.discard(future)
+                if self._waiting.get(execution_id) is future:
+                    del self._waiting[execution_id]
+            self._slots.release()
+            if on_done is not None:
+                on_done()
+
+        future.add_done_callback(release)
+
+    def cancel(self, execution_id: int) -> bool:
+        """Drop an execution still waiting for its turn, freeing its slot."""
+        with self._lock:
+            future = self._waiting.pop(execution_id, None)
+        return future is not None and future.cancel()
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Wait for queued and running executions, or cancel them."""
+        with self._lock:
+            pending = list(self._futures)
+        if wait:
+            futures.wait(pending)
+        else:
+            for future in pending:
+                future.cancel()
+
+
+class DatabaseQueue:
+    """
+    Same interface as ExecutionPool, but `submit` only marks the execution
+    as enqueued for worker processes. Backpressure counts everything still
+    waiting in the table; `on_done` callbacks fire once a poll sees the
+    execution finished.
+    """
+
+    def __init__(self, max_queued: int, poll_interval: float = QUEUE_POLL_INTERVAL):
+        self.max_queued = max_queued
+        self.poll_interval = poll_interval
+        self._watched: dict[int, Callable[[], None]] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def submit(
+        self,
+        execution_id: int,
+        block: bool = False,
+        on_done: Callable[[], None] | None = None,
+    ) -> None:
+        while not self._enqueue(execution_id):
+            if not block:
+                raise QueueFullError("Execution queue is full")
+            if self._stop.wait(self.poll_interval):
+                raise QueueFullError("Execution queue is shutting down")
+        if on_done is not None:
+            with self._lock:
+                self._watched[execution_id] = on_done
+                if self._thread is None:
+                    self._thread = threading.Thread(
+                        target=self._watch, name="queue-watch", daemon=True)
+                    self._thread.start()
+
+    def cancel(self, execution_id: int) -> bool:
+        """Nothing to drop: workers do not claim cancelled executions."""
+        return False
+
+    def _enqueue(self, execution_id: int) -> bool:
+        db = SessionLocal()
+        try:
+            waiting = db.query(func.count(Execution.id)).filter(
+                Execution.status == "QUEUED",
+                Execution.enqueued_at.is_not(None),
+            ).scalar()
+            if waiting >= self.max_queued:
+                return False
+            db.query(Execution).filter(Execution.id == execution_id).update(
+                {Execution.enqueued_at: datetime.utcnow()}, synchronize_session=False)
+            db.commit()
+            return True
+        finally:
+            db.close()
+
+    def _watch(self) -> None:
+        while not self._stop.wait(self.poll_interval):
+            with self._lock:
+                ids = list(self._watched)
+            if not ids:
+                continue
+            db = SessionLocal()
+            try:
+                finished = [
+                    row.id for row in db.query(Execution.id).filter(
+                        Execution.id.in_(ids),
+                        Execution.status.in_(FINISHED_STATUSES),
+                    )
+                ]
+            except Exception:
+                logger.exception("Polling queued executions failed")
+                continue
+            finally:
+                db.close()
+            for execution_id in finished:
+                with self._lock:
+                    on_done = self._watched.pop(execution_id, None)
+                if on_done is not None:
+                    on_done()
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._stop.set()
+
+
+_pool: ExecutionPool | DatabaseQueue | None = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ExecutionPool | DatabaseQueue:
+    """Return the process-wide execution pool, creating it on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            if EXECUTION_QUEUE == "database":
+                _pool = DatabaseQueue(DATABASE_QUEUE_SIZE)
+            else:
+                _pool = ExecutionPool(DEFAULT_WORKERS, DEFAULT_QUEUE_SIZE)
+        return _pool
+
+
+def shutdown_pool(wait: bool = True) -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=wait)
+            _pool = None
@@ -0,0 +1,102 @@
+"""
+Map (fan-out) steps: split the upstream output into items and run the
+step's prompt over each.
+
+A map step has exactly one parent. Its output is split by line, as a
+JSON array, or on a delimiter; consecutive items are grouped into chunks
+of `chunk_size`, and each chunk is one LLM call, given to the prompt as
+its previous step output. The step's own output is the JSON array of the
+chunk results in order, which a downstream (reduce) step receives like
+any other parent output.
+"""
+
+import json
+import os
+from collections.abc import Sequence
+from typing import Any
+
+KINDS = ("prompt", "map")
+SPLIT_MODES = ("lines", "json", "delimiter")
+
+MAP_CONCURRENCY = int(os.getenv("MAP_CONCURRENCY", "4"))
+MAP_MAX_ITEMS = int(os.getenv("MAP_MAX_ITEMS", "500"))
+
+
+def split_output(text: str, mode: str = "lines", delimiter: str | None = None) -> list[Any]:
+    """
+    The items of `text`. Lines and delimited pieces are stripped and empty
+    ones dropped; JSON array elements are returned parsed, for chunk_items
+    to encode. Raises ValueError if the text cannot be split that way.
+    """
+    if mode == "lines":
+        pieces = text.splitlines()
+    elif mode == "delimiter":
+        if not delimiter:
+            raise ValueError("Splitting on a delimiter needs a delimiter")
+        pieces = text.split(delimiter)
+    elif mode == "json":
+        try:
+            value = json.loads(_strip_fence(text))
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Upstream output is not valid JSON: {e}") from None
+        if not isinstance(value, list):
+            raise ValueError("Upstream output is not a JSON array")
+        return value
+    else:
+        raise ValueError(f"Unknown split mode: {mode}")
+    return [piece.strip() for piece in pieces if piece.strip()]
+
+
+def _strip_fence(text: str) -> str:
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.split("\n", 1)[1] if "\n" in text else ""
+        text = text.rsplit("```", 1)[0]
+    return text
+
+
+def chunk_items(
+    items: Sequence[Any], chunk_size: int = 1, mode: str = "lines",
+    delimiter: str | None = None,
+) -> list[str]:
+    """
+    Group `items` into chunks of up to `chunk_size`, joined back the way
+    they were split: with a chunk_size of 1 a JSON item is the string
+    itself or the JSON of anything else, and larger JSON chunks are
+    arrays, each encoded once.
+    """
+    if chunk_size <= 1:
+        if mode != "json":
+            return list(items)
+        return [item if isinstance(item, str) else json.dumps(item) for item in items]
+    chunks = []
+    for start in range(0, len(items), chunk_size):
+        group = items[start:start + chunk_size]
+        if mode == "json":
+            chunks.append(json.dumps(list(group)))
+        else:
+            chunks.append((delimiter if mode == "delimiter" else "\n").join(group))
+    return chunks
+
+
+def map_chunks(
+    text: str, mode: str | None, delimiter: str | None, chunk_size: int | None
+) -> list[str]:
+    """The chunks a map step runs over, capped at MAP_MAX_ITEMS."""
+    mode = mode or "lines"
+    chunks = chunk_items(
+        split_output(text, mode, delimiter), chunk_size or 1, mode, delimiter)
+    if len(chunks) > MAP_MAX_ITEMS:
+        raise ValueError(
+            f"Upstream output splits into {len(chunks)} items, "
+            f"more than MAP_MAX_ITEMS ({MAP_MAX_ITEMS}); raise chunk_size")
+    return chunks
+
+
+def check_map_steps(
+    step_orders: Sequence[int], kinds: Sequence[str], parents: Sequence[Sequence[int]]
+) -> None:
+    """Raise ValueError unless every map step has exactly one parent."""
+    for order, kind, step_parents in zip(step_orders, kinds, parents):
+        if kind == "map" and len(step_parents) != 1:
+            raise ValueError(f"Map step {order} must depend on exactly one step")
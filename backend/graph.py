@@ -0,0 +1,63 @@
+"""Dependency graph helpers for workflow steps."""
+
+from collections.abc import Sequence
+
+
+class CycleError(ValueError):
+    """Raised when step dependencies form a cycle."""
+
+
+def resolve_dependencies(
+    step_orders: Sequence[int], depends_on: Sequence[Sequence[int] | None]
+) -> list[list[int]]:
+    """
+    Map each step (by position) to the positions of its parents.
+
+    `step_orders` are the steps' step_order values sorted ascending and
+    `depends_on` holds each step's declared parent step_orders. A step
+    without a declaration depends on the step before it, which keeps
+    plain linear workflows working unchanged.
+    """
+    position = {}
+    for index, order in enumerate(step_orders):
+        position.setdefault(order, index)
+
+    parents: list[list[int]] = []
+    for index, declared in enumerate(depends_on):
+        if declared is None:
+            parents.append([index - 1] if index > 0 else [])
+            continue
+        resolved = []
+        for order in declared:
+            if order not in position:
+                raise ValueError(
+                    f"Step {step_orders[index]} depends on unknown step {order}")
+            if position[order] == index:
+                raise CycleError(f"Step {order} depends on itself")
+            if position[order] not in resolved:
+                resolved.append(position[order])
+        parents.append(resolved)
+    return parents
+
+
+def topological_order(parents: Sequence[Sequence[int]]) -> list[int]:
+    """Return positions in dependency order, raising CycleError on cycles."""
+    remaining = [len(p) for p in parents]
+    children: list[list[int]] = [[] for _ in parents]
+    for child, step_parents in enumerate(parents):
+        for parent in step_parents:
+            children[parent].append(child)
+
+    ready = [i for i, count in enumerate(remaining) if count == 0]
+    order = []
+    while ready:
+        node = ready.pop(0)
+        order.append(node)
+        for child in children[node]:
+            remaining[child] -= 1
+            if remaining[child] == 0:
+                ready.append(child)
+
+    if len(order) != len(parents):
+        raise CycleError("Step dependencies contain a cycle")
+    return order
@@ -0,0 +1,211 @@
+"""Hedged LLM requests: race a duplicate call against a slow one."""
+
+import asyncio
+import os
+import threading
+from collections import deque
+from collections.abc import Awaitable
+from typing import Any, Callable
+
+from retry_policy import Deadline
+
+# Never hedge sooner than this, whatever the observed latencies say.
+MIN_HEDGE_DELAY = 0.05
+
+Call = Callable[[str, Any], Awaitable[Any]]
+"""Runs one contender: (model, delta callback) -> LLMResponse."""
+
+
+class LatencyTracker:
+    """Recent successful call latencies per model."""
+
+    def __init__(self, window: int):
+        self._samples: dict[str, deque[float]] = {}
+        self._window = window
+        self._lock = threading.Lock()
+
+    def record(self, model: str, latency: float) -> None:
+        with self._lock:
+            samples = self._samples.get(model)
+            if samples is None:
+                samples = self._samples[model] = deque(maxlen=self._window)
+            samples.append(latency)
+
+    def percentile(self, model: str, percentile: float, min_samples: int) -> float | None:
+        """Nearest-rank percentile, or None with too few samples."""
+        with self._lock:
+            samples = sorted(self._samples.get(model, ()))
+        if not samples or len(samples) < min_samples:
+            return None
+        rank = max(0, min(len(samples) - 1, round(percentile / 100 * len(samples)) - 1))
+        return samples[rank]
+
+    def models(self) -> list[str]:
+        with self._lock:
+            return list(self._samples)
+
+
+class HedgeBudget:
+    """
+    Caps hedges at a fraction of calls: every hedged-mode call earns `ratio`
+    credits (up to `burst`), and sending a hedge spends one.
+    """
+
+    def __init__(self, ratio: float, burst: float):
+        self.ratio = ratio
+        self.burst = burst
+        self._credits = burst
+        self._lock = threading.Lock()
+
+    def deposit(self) -> None:
+        with self._lock:
+            self._credits = min(self.burst, self._credits + self.ratio)
+
+    def withdraw(self) -> bool:
+        with self._lock:
+            if self._credits < 1:
+                return False
+            self._credits -= 1
+            return True
+
+    @property
+    def credits(self) -> float:
+        with self._lock:
+            return self._credits
+
+
+class Hedger:
+    """
+    Sends a duplicate request when the first has not answered within the
+    model's recent latency percentile, keeps whichever finishes first and
+    cancels the other. Streaming calls are decided by the first delta: the
+    contender that starts streaming first wins and owns the callback.
+    """
+
+    def __init__(
+        self,
+        percentile: float = 95,
+        default_delay: float = 2.0,
+        budget_ratio: float = 0.1,
+        budget_burst: float = 5,
+        window: int = 200,
+        min_samples: int = 20,
+    ):
+        self.percentile = percentile
+        self.default_delay = default_delay
+        self.min_samples = min_samples
+        self.latencies = LatencyTracker(window)
+        self.budget = HedgeBudget(budget_ratio, budget_burst)
+        self.sent = 0
+        self.won = 0
+        self.denied = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "Hedger":
+        return cls(
+            percentile=float(os.getenv("LLM_HEDGE_PERCENTILE", "95")),
+            default_delay=float(os.getenv("LLM_HEDGE_DELAY", "2.0")),
+            budget_ratio=float(os.getenv("LLM_HEDGE_BUDGET", "0.1")),
+            budget_burst=float(os.getenv("LLM_HEDGE_BURST", "5")),
+            window=int(os.getenv("LLM_HEDGE_WINDOW", "200")),
+            min_samples=int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20")),
+        )
+
+    def delay_for(self, model: str) -> float:
+        """How long to wait for `model` before sending a hedge."""
+        observed = self.latencies.percentile(model, self.percentile, self.min_samples)
+        delay = observed if observed is not None else self.default_delay
+        return max(MIN_HEDGE_DELAY, delay)
+
+    async def run(
+        self,
+        model: str,
+        call: Call,
+        hedge_model: str | None = None,
+        on_delta: Any = None,
+        deadline: Deadline | None = None,
+    ) -> Any:
+        """
+        Race `call(model, ...)` against a delayed `call(hedge_model or
+        model, ...)`. The winning response's `hedge_winner` is set to
+        "primary" or "hedge" when a hedge was sent, and the loser's task
+        is cancelled. If every contender fails, the primary's error is
+        raised.
+        """
+        self.budget.deposit()
+        tasks: dict[asyncio.Task, str] = {}
+        streaming_owner: list[str] = []
+
+        def reporter(label: str):
+            if on_delta is None:
+                return None
+
+            def report(delta: str, text: str) -> None:
+                if not streaming_owner:
+                    streaming_owner.append(label)
+                    for task, other in tasks.items():
+                        if other != label:
+                            task.cancel()
+                if streaming_owner[0] != label:
+                    return
+                on_delta(delta, text)
+
+            return report
+
+        primary = asyncio.create_task(call(model, reporter("primary")))
+        tasks[primary] = "primary"
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=self.delay_for(model))
+
+            remaining = deadline.remaining() if deadline else None
+            if not done and not streaming_owner and (remaining is None or remaining > 0):
+                if self.budget.withdraw():
+                    hedge = asyncio.create_task(
+                        call(hedge_model or model, reporter("hedge")))
+                    tasks[hedge] = "hedge"
+                    with self._lock:
+                        self.sent += 1
+                else:
+                    with self._lock:
+                        self.denied += 1
+
+            hedged = len(tasks) > 1
+            errors: dict[str, BaseException] = {}
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    label = tasks[task]
+                    if task.cancelled():
+                        continue
+                    error = task.exception()
+                    if error is not None:
+                        errors[label] = error
+                        continue
+                    response = task.result()
+                    if hedged:
+                        response.hedge_winner = label
+                        if label == "hedge":
+                            with self._lock:
+                                self.won += 1
+                    return response
+            raise errors.get("primary") or errors["hedge"]
+        finally:
+            # The loser, or both contenders if this call itself was cancelled.
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            counts = {"sent": self.sent, "won": self.won, "denied": self.denied}
+        return {
+            **counts,
+            "budget_credits": self.budget.credits,
+            "percentile": self.percentile,
+            "delays": {
+                model: self.delay_for(model) for model in self.latencies.models()
+            },
+        }
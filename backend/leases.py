@@ -0,0 +1,196 @@
+"""
+Execution leases: which process is running an execution, and until when.
+
+Whoever runs an execution first takes its lease with a compare-and-set
+UPDATE, so two processes sharing the database never run it at once. The
+holder renews the lease every HEARTBEAT_INTERVAL; if the process dies the
+lease runs out after LEASE_SECONDS and the execution can be claimed
+again, resuming from its last completed step. Lease times come from each
+process's clock, so hosts sharing a database need roughly synced clocks
+(well within LEASE_SECONDS).
+"""
+
+import logging
+import os
+import socket
+import threading
+from collections.abc import Callable
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, or_, select, update
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from models import Execution
+
+logger = logging.getLogger(__name__)
+
+LEASE_SECONDS = float(os.getenv("LEASE_SECONDS", "30"))
+HEARTBEAT_INTERVAL = float(os.getenv("LEASE_HEARTBEAT_INTERVAL", "10"))
+CLAIMABLE_STATUSES = ("QUEUED", "RUNNING")
+
+
+def default_owner() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def claimable(now: datetime):
+    """Waiting executions, and running ones whose lease has run out."""
+    return and_(
+        Execution.status.in_(CLAIMABLE_STATUSES),
+        or_(Execution.lease_expires_at.is_(None), Execution.lease_expires_at < now),
+    )
+
+
+def acquire(session: Session, execution_id: int, owner: str) -> bool:
+    """Take the lease on one execution; False if it is not claimable."""
+    now = datetime.utcnow()
+    result = session.execute(
+        update(Execution)
+        .where(Execution.id == execution_id, claimable(now))
+        .values(lease_owner=owner, lease_expires_at=now + timedelta(seconds=LEASE_SECONDS))
+    )
+    session.commit()
+    return result.rowcount == 1
+
+
+def claim(session: Session, owner: str, limit: int) -> list[int]:
+    """
+    Lease up to `limit` enqueued executions, oldest first. Candidates are
+    re-checked by each UPDATE, so a row another worker took in between is
+    simply skipped; on Postgres, rows being claimed elsewhere are skipped
+    up front with SKIP LOCKED.
+    """
+    now = datetime.utcnow()
+    query = (
+        select(Execution.id)
+        .where(claimable(now), Execution.enqueued_at.is_not(None))
+        .order_by(Execution.enqueued_at, Execution.id)
+        .limit(limit)
+    )
+    if session.get_bind().dialect.name == "postgresql":
+        query = query.with_for_update(skip_locked=True)
+    expires = now + timedelta(seconds=LEASE_SECONDS)
+    claimed = []
+    for execution_id in session.execute(query).scalars().all():
+        result = session.execute(
+            update(Execution)
+            .where(Execution.id == execution_id, claimable(now))
+            .values(lease_owner=owner, lease_expires_at=expires)
+        )
+        if result.rowcount == 1:
+            claimed.append(execution_id)
+    session.commit()
+    return claimed
+
+
+def release(session: Session, execution_id: int, owner: str) -> None:
+    session.execute(
+        update(Execution)
+        .where(Execution.id == execution_id, Execution.lease_owner == owner)
+        .values(lease_owner=None, lease_expires_at=None)
+    )
+    session.commit()
+
+
+class LeaseKeeper:
+    """
+    Renews the leases this process holds, all in one UPDATE per
+    heartbeat. A lease that could not be renewed (it expired and another
+    process claimed the execution) is logged and dropped, and so is one
+    whose execution was cancelled from elsewhere; either way the holder's
+    `on_lost` callback, if any, is called with the execution id and
+    "CANCELLED", or None for a lost lease, to stop the run.
+    """
+
+    def __init__(self, owner: str, interval: float = HEARTBEAT_INTERVAL,
+                 session_factory=SessionLocal):
+        self.owner = owner
+        self.interval = interval
+        self._session_factory = session_factory
+        self._held: dict[int, Callable[[int, str | None], None] | None] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self.lost = 0
+
+    def hold(
+        self,
+        execution_id: int,
+        on_lost: Callable[[int, str | None], None] | None = None,
+    ) -> None:
+        with self._lock:
+            if on_lost is not None or execution_id not in self._held:
+                self._held[execution_id] = on_lost
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="lease-heartbeat", daemon=True)
+                self._thread.start()
+
+    def drop(self, execution_id: int) -> None:
+        with self._lock:
+            self._held.pop(execution_id, None)
+
+    def held(self) -> list[int]:
+        with self._lock:
+            return sorted(self._held)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.renew()
+            except Exception:
+                logger.exception("Lease heartbeat failed")
+
+    def renew(self) -> None:
+        held = self.held()
+        if not held:
+            return
+        db = self._session_factory()
+        try:
+            db.execute(
+                update(Execution)
+                .where(Execution.id.in_(held), Execution.lease_owner == self.owner)
+                .values(lease_expires_at=datetime.utcnow()
+                        + timedelta(seconds=LEASE_SECONDS))
+            )
+            rows = db.execute(
+                select(Execution.id, Execution.status).where(
+                    Execution.id.in_(held), Execution.lease_owner == self.owner)
+            ).all()
+            db.commit()
+        finally:
+            db.close()
+        still_held = {row.id for row in rows}
+        cancelled = {row.id for row in rows if row.status == "CANCELLED"}
+        with self._lock:
+            # Ignore executions that finished while this ran.
+            lost = (set(held) - still_held) & self._held.keys()
+            stopped = {
+                execution_id: self._held.pop(execution_id)
+                for execution_id in sorted(lost | (cancelled & self._held.keys()))
+            }
+            self.lost += len(lost)
+        for execution_id, on_lost in stopped.items():
+            if execution_id in lost:
+                logger.warning("Lost the lease on execution %s", execution_id)
+            else:
+                logger.info("Execution %s was cancelled, stopping it", execution_id)
+            if on_lost is not None:
+                on_lost(execution_id, None if execution_id in lost else "CANCELLED")
+
+    def stop(self) -> None:
+        self._stop.set()
+
+
+_keeper: LeaseKeeper | None = None
+_keeper_lock = threading.Lock()
+
+
+def get_keeper() -> LeaseKeeper:
+    """This process's lease keeper, owning leases as host:pid."""
+    global _keeper
+    with _keeper_lock:
+        if _keeper is None:
+            _keeper = LeaseKeeper(default_owner())
+        return _keeper
@@ -0,0 +1,154 @@
+"""Two-tier response cache for LLM calls: in-process LRU backed by SQLite."""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+
+from database import SessionLocal
+from models import LLMCacheEntry
+
+logger = logging.getLogger(__name__)
+
+
+def cache_key(model: str, prompt: str, temperature: float, max_tokens: int) -> str:
+    """Stable hash of everything that determines an LLM response."""
+    raw = json.dumps(
+        [model, prompt, temperature, max_tokens], ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class LRUCache:
+    """Thread-safe LRU map with a per-entry time-to-live."""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> str | None:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            stored_at, value = item
+            if time.monotonic() - stored_at > self.ttl:
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class ResponseCache:
+    """
+    Memory tier in front of the `llm_cache` table. Database hits are
+    promoted into memory; expired rows are pruned every `prune_every`
+    writes so the table does not grow without bound.
+    """
+
+    def __init__(
+        self,
+        max_entries: int,
+        ttl: float,
+        persistent_ttl: float,
+        session_factory=SessionLocal,
+        prune_every: int = 100,
+    ):
+        self.memory = LRUCache(max_entries, ttl)
+        self.persistent_ttl = persistent_ttl
+        self._session_factory = session_factory
+        self._prune_every = prune_every
+        self._writes = 0
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def get(self, key: str) -> str | None:
+        value = self.memory.get(key)
+        if value is not None:
+            self._count("memory_hits")
+            return value
+
+        cutoff = datetime.utcnow() - timedelta(seconds=self.persistent_ttl)
+        db = self._session_factory()
+        try:
+            entry = db.get(LLMCacheEntry, key)
+            if entry is not None and entry.created_at >= cutoff:
+                value = entry.response
+        finally:
+            db.close()
+
+        if value is None:
+            self._count("misses")
+            return None
+        self._count("persistent_hits")
+        self.memory.set(key, value)
+        return value
+
+    def set(self, key: str, model: str, value: str) -> None:
+        """Store a response; a failed database write only loses the persistent copy."""
+        self.memory.set(key, value)
+        db = self._session_factory()
+        try:
+            db.merge(LLMCacheEntry(
+                key=key, model=model, response=value,
+                created_at=datetime.utcnow()))
+            with self._lock:
+                self._writes += 1
+                prune = self._writes % self._prune_every == 0
+            if prune:
+                cutoff = datetime.utcnow() - timedelta(seconds=self.persistent_ttl)
+                db.query(LLMCacheEntry).filter(
+                    LLMCacheEntry.created_at < cutoff).delete()
+            db.commit()
+        except IntegrityError:
+            # Another worker stored the same key concurrently.
+            db.rollback()
+        except SQLAlchemyError:
+            # The response was paid for; failing the call would only buy it again.
+            db.rollback()
+            logger.warning("Could not store LLM response in the cache", exc_info=True)
+        finally:
+            db.close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = self.memory_hits + self.persistent_hits
+            total = hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "persistent_hits": self.persistent_hits,
+                "misses": self.misses,
+                "hit_rate": hits / total if total else 0.0,
+                "memory_entries": len(self.memory),
+            }
+
+
+def cache_from_env() -> ResponseCache:
+    return ResponseCache(
+        max_entries=int(os.getenv("LLM_CACHE_SIZE", "1024")),
+        ttl=float(os.getenv("LLM_CACHE_TTL", "3600")),
+        persistent_ttl=float(os.getenv("LLM_CACHE_DB_TTL", "86400")),
+    )
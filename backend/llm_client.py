@@ -1,56 +1,573 @@
+"""HTTP client for the Unbound chat completions gateway."""
 
+import asyncio
+import json
+import logging
 import os
+import threading
 import time
-import requests
+from collections.abc import Callable
+from dataclasses import dataclass, replace
+
+import httpx
 from dotenv import load_dotenv
 
+import engine_loop
+from cassette import Cassette, current_cassette
+from circuit_breaker import BreakerRegistry
+from coalescing import SingleFlight
+from hedging import Hedger
+from llm_cache import ResponseCache, cache_from_env, cache_key
+from observability import (
+    LLM_COALESCED, LLM_REQUEST_SECONDS, LLM_RETRIES, LLM_TOKENS, span,
+)
+from rate_limit import RateLimiter
+from retry_policy import Deadline, DeadlineExceeded, LLMError, RetryPolicy, classify
+from tokens import estimate_tokens
+
 load_dotenv()
 
+logger = logging.getLogger(__name__)
 
-def call_llm(model: str, prompt: str) -> str:
 
-    api_key = os.getenv("UNBOUND_API_KEY")
-    api_url = os.getenv("UNBOUND_API_URL")
+@dataclass(frozen=True)
+class LLMConfig:
+    """Gateway settings, read once from the environment."""
 
-    if not api_key:
-        raise ValueError("UNBOUND_API_KEY environment variable is not set")
-    if not api_url:
-        raise ValueError("UNBOUND_API_URL environment variable is not set")
+    api_key: str | None
+    api_url: str | None
+    temperature: float = 0.7
+    max_tokens: int = 512
+    timeout: float = 60.0
+    pool_size: int = 10
+    stream: bool = False
 
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json",
-        "Connection": "close"  # Prevents stale connection reuse
-    }
+    @classmethod
+    def from_env(cls) -> "LLMConfig":
+        return cls(
+            api_key=os.getenv("UNBOUND_API_KEY"),
+            api_url=os.getenv("UNBOUND_API_URL"),
+            timeout=float(os.getenv("LLM_TIMEOUT", "60")),
+            pool_size=int(os.getenv("LLM_POOL_SIZE", "10")),
+            stream=os.getenv("LLM_STREAM", "").lower() in ("1", "true", "yes"),
+        )
 
-    payload = {
-        "model": model,
-        "messages": [
-            {"role": "user", "content": prompt}
-        ],
-        "temperature": 0.7,
-        "max_tokens": 512
-    }
+    def validate(self) -> None:
+        if not self.api_key:
+            raise ValueError("UNBOUND_API_KEY environment variable is not set")
+        if not self.api_url:
+            raise ValueError("UNBOUND_API_URL environment variable is not set")
 
-    MAX_RETRIES = 3
 
-    for attempt in range(MAX_RETRIES):
-        try:
-            response = requests.post(
-                api_url,
-                headers=headers,
-                json=payload,
-                timeout=60
+@dataclass
+class LLMResponse:
+    """A completed LLM call."""
+
+    content: str
+    model: str
+    latency: float
+    attempts: int = 1
+    cached: bool = False
+    breaker_state: str | None = None
+    queue_wait: float = 0.0
+    stopped_early: bool = False
+    hedge_winner: str | None = None
+    prompt_tokens: int | None = None
+    completion_tokens: int | None = None
+    replayed: bool = False
+    coalesced: bool = False
+
+
+DeltaCallback = Callable[[str, str], None]
+"""Called with (delta, text_so_far) as streamed content arrives."""
+
+StopCheck = Callable[[str], bool]
+"""Called with the text streamed so far; True ends the stream."""
+
+
+class LLMClient:
+    """
+    Long-lived gateway client. Calls are coroutines on the engine loop
+    (see engine_loop.py) sharing one keep-alive connection pool, so steps
+    and retries reuse TCP/TLS connections instead of reconnecting, and a
+    call waiting on the network holds no thread. `complete` and
+    `complete_hedged` are blocking wrappers for sync callers.
+
+    `transport` is an httpx transport for the pool, e.g. an
+    httpx.MockTransport, which lets tests point the client at a local
+    stand-in.
+    """
+
+    def __init__(
+        self,
+        config: LLMConfig | None = None,
+        transport: httpx.AsyncBaseTransport | None = None,
+        cache: ResponseCache | None = None,
+        retry_policy: RetryPolicy | None = None,
+        breakers: BreakerRegistry | None = None,
+        limiter: RateLimiter | None = None,
+        hedger: Hedger | None = None,
+        coalescer: SingleFlight | None = None,
+    ):
+        self.config = config or LLMConfig.from_env()
+        self._transport = transport
+        self._http: httpx.AsyncClient | None = None
+        self._http_loop: asyncio.AbstractEventLoop | None = None
+        self.cache = cache or cache_from_env()
+        self.retry_policy = retry_policy or RetryPolicy.from_env()
+        self.breakers = breakers or BreakerRegistry.from_env()
+        self.limiter = limiter or RateLimiter.from_env()
+        self.hedger = hedger or Hedger.from_env()
+        self.coalescer = coalescer or SingleFlight.from_env()
+
+    @property
+    def _client(self) -> httpx.AsyncClient:
+        """The connection pool, created on the loop that uses it."""
+        loop = asyncio.get_running_loop()
+        if self._http is None or self._http_loop is not loop:
+            self._http = httpx.AsyncClient(
+                transport=self._transport,
+                limits=httpx.Limits(
+                    max_connections=None,
+                    max_keepalive_connections=self.config.pool_size,
+                ),
             )
+            self._http_loop = loop
+        return self._http
 
+    @property
+    def _headers(self) -> dict:
+        return {
+            "Authorization": f"Bearer {self.config.api_key}",
+            "Content-Type": "application/json",
+        }
+
+    async def _post(
+        self, payload: dict, timeout: float, stream: bool = False
+    ) -> httpx.Response:
+        """
+        POST once, transparently replaying the request a single time if it
+        went out on a keep-alive connection the server had already closed.
+        """
+        client = self._client
+        request = client.build_request(
+            "POST", self.config.api_url,
+            headers=self._headers, json=payload, timeout=timeout)
+        try:
+            response = await client.send(request, stream=stream)
+        except httpx.RemoteProtocolError:
+            response = await client.send(request, stream=stream)
+        try:
             response.raise_for_status()
+        except httpx.HTTPStatusError:
+            await response.aclose()
+            raise
+        return response
+
+    @staticmethod
+    async def _read_stream(
+        response: httpx.Response,
+        on_delta: DeltaCallback,
+        stop: StopCheck | None = None,
+    ) -> tuple[str, bool, dict | None]:
+        """
+        Consume an SSE completion stream, reporting each content delta.
+        Returns (content, stopped_early, usage); when `stop` accepts the
+        text so far the connection is closed without reading the rest, as
+        it is when the calling task is cancelled.
+        """
+        parts: list[str] = []
+        usage = None
+        try:
+            async for line in response.aiter_lines():
+                if not line or not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                chunk = json.loads(data)
+                usage = chunk.get("usage") or usage
+                if not chunk.get("choices"):
+                    continue
+                delta = chunk["choices"][0].get("delta", {}).get("content")
+                if delta:
+                    parts.append(delta)
+                    text = "".join(parts)
+                    on_delta(delta, text)
+                    if stop is not None and stop(text):
+                        return text, True, usage
+        finally:
+            await response.aclose()
+        return "".join(parts), False, usage
+
+    def complete(self, model: str, prompt: str, **kwargs) -> LLMResponse:
+        """Blocking `acomplete`, run on the engine loop."""
+        return engine_loop.run(self.acomplete(model, prompt, **kwargs))
+
+    def complete_hedged(self, model: str, prompt: str, **kwargs) -> LLMResponse:
+        """Blocking `acomplete_hedged`, run on the engine loop."""
+        return engine_loop.run(self.acomplete_hedged(model, prompt, **kwargs))
+
+    async def acomplete(
+        self,
+        model: str,
+        prompt: str,
+        use_cache: bool = False,
+        refresh_cache: bool = False,
+        on_delta: DeltaCallback | None = None,
+        deadline: Deadline | None = None,
+        stop: StopCheck | None = None,
+        coalesce: bool = True,
+    ) -> LLMResponse:
+        """
+        Run a chat completion. With `use_cache` the response cache is read
+        and written; `refresh_cache` skips the read but still stores the
+        fresh response, replacing whatever was cached for the same call.
+
+        When `on_delta` is given and streaming is enabled the completion is
+        requested with `stream: true` and each content delta is reported as
+        it arrives; otherwise `on_delta` is called once with the full text.
+        A stream that fails after emitting content is not retried here,
+        since the caller has already seen part of it. If `stop` returns
+        True for the text streamed so far, generation is cut off there.
+        Cancelling the calling task abandons the call at once, closing its
+        connection and returning its rate-limit capacity.
+
+        Every HTTP attempt first takes capacity from the model's rate
+        limits, queueing (within the deadline) until it fits.
+
+        Retryable failures (timeouts, connection errors, 408/429/5xx) are
+        retried with capped exponential backoff, honouring Retry-After,
+        within the time left on `deadline`, which also bounds each whole
+        attempt. Anything else, or an open circuit breaker for the model,
+        raises an LLMError at once.
+
+        With `coalesce`, a call identical to one already in flight (same
+        model, prompt, parameters and cache use) waits for that request and
+        shares its response, marked `coalesced`; see SingleFlight. Calls
+        with a `stop` check never share, since it cuts off their own text.
 
-            data = response.json()
+        While a cassette is active (see cassette.py) calls are recorded to
+        it or replayed from it; a replayed call never reaches the network.
+        """
+        cassette = current_cassette()
+        if cassette is not None and cassette.replaying:
+            return await self._replay(cassette, model, prompt, on_delta, deadline)
+        if coalesce and stop is None and self.coalescer.enabled:
+            response = await self._coalesced(
+                ("complete", *self._flight_key(model, prompt, use_cache, refresh_cache)),
+                lambda report: self._complete_live(
+                    model, prompt, use_cache, refresh_cache, report, deadline, None),
+                model, on_delta, deadline)
+        else:
+            response = await self._complete_live(
+                model, prompt, use_cache, refresh_cache, on_delta, deadline, stop)
+        if cassette is not None:
+            self._record(cassette, prompt, response)
+        return response
 
-            return data["choices"][0]["message"]["content"]
+    def _record(self, cassette: Cassette, prompt: str, response: LLMResponse) -> None:
+        cassette.record(
+            response.model, prompt, self.config.temperature, self.config.max_tokens,
+            response.content, response.latency,
+            {"prompt_tokens": response.prompt_tokens,
+             "completion_tokens": response.completion_tokens},
+        )
 
-        except requests.exceptions.RequestException as e:
-            print(f"LLM call failed (attempt {attempt + 1}): {e}")
-            time.sleep(2)
+    async def _replay(
+        self,
+        cassette: Cassette,
+        model: str,
+        prompt: str,
+        on_delta: DeltaCallback | None,
+        deadline: Deadline | None,
+    ) -> LLMResponse:
+        start = time.monotonic()
+        entry = await cassette.replay(
+            model, prompt, self.config.temperature, self.config.max_tokens, deadline)
+        content = entry["content"]
+        if on_delta is not None:
+            on_delta(content, content)
+        usage = entry.get("usage") or {}
+        return LLMResponse(
+            content=content,
+            model=model,
+            latency=time.monotonic() - start,
+            prompt_tokens=usage.get("prompt_tokens"),
+            completion_tokens=usage.get("completion_tokens"),
+            replayed=True,
+        )
 
-    raise RuntimeError("LLM call failed after retries")
+    async def _complete_live(
+        self,
+        model: str,
+        prompt: str,
+        use_cache: bool,
+        refresh_cache: bool,
+        on_delta: DeltaCallback | None,
+        deadline: Deadline | None,
+        stop: StopCheck | None,
+    ) -> LLMResponse:
+        key = None
+        if use_cache or refresh_cache:
+            key = self._cache_key(model, prompt)
+        if use_cache and not refresh_cache:
+            cached = await self._cached_response(key, model, on_delta)
+            if cached is not None:
+                return cached
+
+        self.config.validate()
+        payload = {
+            "model": model,
+            "messages": [
+                {"role": "user", "content": prompt}
+            ],
+            "temperature": self.config.temperature,
+            "max_tokens": self.config.max_tokens,
+        }
+        stream = on_delta is not None and self.config.stream
+        deadline = deadline or Deadline(None)
+        breaker = self.breakers.get(model)
+        cost = estimate_tokens(prompt) + self.config.max_tokens
+        queue_wait = 0.0
+        emitted = False
+        stopped_early = False
+
+        def report(delta: str, text: str) -> None:
+            nonlocal emitted
+            emitted = True
+            on_delta(delta, text)
+
+        start = time.monotonic()
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                deadline.timeout(self.config.timeout)
+                breaker.before_call()
+            except LLMError as e:
+                e.attempts = attempt - 1
+                raise
+            lease = None
+            try:
+                lease = await self.limiter.acquire(model, cost, deadline)
+                # Queueing may have used part of the budget.
+                timeout = deadline.timeout(self.config.timeout)
+            except LLMError as e:
+                breaker.release()
+                if lease is not None:
+                    await lease.release()
+                e.attempts = attempt - 1
+                e.breaker_state = breaker.state
+                raise
+            except asyncio.CancelledError:
+                breaker.release()
+                raise
+            queue_wait += lease.waited
+            sent_at = time.monotonic()
+            outcome = "error"
+            retry_delay = None
+            try:
+                with span("llm.http", model=model, attempt=attempt):
+                    async with asyncio.timeout(deadline.remaining()):
+                        if stream:
+                            response = await self._post(
+                                {**payload, "stream": True}, timeout, stream=True)
+                            content, stopped_early, usage = await self._read_stream(
+                                response, report, stop)
+                        else:
+                            response = await self._post(payload, timeout)
+                            data = response.json()
+                            content = data["choices"][0]["message"]["content"]
+                            usage = data.get("usage")
+                outcome = "success"
+            except asyncio.CancelledError:
+                outcome = "cancelled"
+                breaker.release()
+                raise
+            except TimeoutError as e:
+                # The deadline ran out mid-attempt.
+                breaker.release()
+                expired = DeadlineExceeded("Step deadline exceeded during LLM call")
+                expired.attempts = attempt
+                expired.breaker_state = breaker.state
+                raise expired from e
+            except (httpx.HTTPError, KeyError, IndexError, ValueError) as e:
+                error = classify(e)
+                if error.provider_failure:
+                    breaker.record_failure()
+                elif error.status is not None and error.status != 429:
+                    # A 4xx answer means the model is up.
+                    breaker.record_success()
+                else:
+                    breaker.release()
+                error.attempts = attempt
+                error.breaker_state = breaker.state
+                if (emitted or not error.retryable
+                        or attempt >= self.retry_policy.max_attempts):
+                    raise error from e
+                delay = self.retry_policy.backoff(attempt - 1, error.retry_after)
+                if not deadline.allows(delay):
+                    expired = DeadlineExceeded(
+                        f"Step deadline leaves no time to retry: {error}")
+                    expired.attempts = attempt
+                    expired.breaker_state = error.breaker_state
+                    raise expired from e
+                logger.warning("LLM call to %s failed (attempt %d), retrying in %.1fs: %s",
+                               model, attempt, delay, error)
+                LLM_RETRIES.inc(model=model)
+                retry_delay = delay
+            finally:
+                await lease.release()
+                LLM_REQUEST_SECONDS.observe(
+                    time.monotonic() - sent_at, model=model, outcome=outcome)
+            if retry_delay is not None:
+                # Backoff is neither request time nor rate-limit capacity.
+                await asyncio.sleep(retry_delay)
+                continue
+
+            breaker.record_success()
+            usage = usage or {}
+            prompt_tokens = usage.get("prompt_tokens")
+            completion_tokens = usage.get("completion_tokens")
+            if prompt_tokens is not None:
+                LLM_TOKENS.inc(prompt_tokens, model=model, kind="prompt")
+            if completion_tokens is not None:
+                LLM_TOKENS.inc(completion_tokens, model=model, kind="completion")
+            if not stopped_early:
+                self.hedger.latencies.record(model, time.monotonic() - sent_at)
+            if on_delta is not None and not stream:
+                on_delta(content, content)
+            if key is not None:
+                await asyncio.to_thread(self.cache.set, key, model, content)
+            return LLMResponse(
+                content=content,
+                model=model,
+                latency=time.monotonic() - start,
+                attempts=attempt,
+                breaker_state=breaker.state,
+                queue_wait=queue_wait,
+                stopped_early=stopped_early,
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens,
+            )
+
+    def _cache_key(self, model: str, prompt: str) -> str:
+        return cache_key(
+            model, prompt, self.config.temperature, self.config.max_tokens)
+
+    def _flight_key(
+        self, model: str, prompt: str, use_cache: bool, refresh_cache: bool
+    ) -> tuple:
+        # Whether the call reads and writes the cache changes what it returns.
+        return (self._cache_key(model, prompt),
+                use_cache and not refresh_cache, use_cache or refresh_cache)
+
+    async def _coalesced(
+        self,
+        key: tuple,
+        call,
+        model: str,
+        on_delta: DeltaCallback | None,
+        deadline: Deadline | None,
+    ) -> LLMResponse:
+        response, joined = await self.coalescer.run(key, call, on_delta, deadline)
+        if not joined:
+            return response
+        LLM_COALESCED.inc(model=model)
+        return replace(response, coalesced=True)
+
+    async def _cached_response(
+        self, key: str, model: str, on_delta: DeltaCallback | None
+    ) -> LLMResponse | None:
+        # Misses in memory go to the database.
+        cached = await asyncio.to_thread(self.cache.get, key)
+        if cached is None:
+            return None
+        if on_delta is not None:
+            on_delta(cached, cached)
+        return LLMResponse(
+            content=cached, model=model, latency=0.0, attempts=0, cached=True)
+
+    async def acomplete_hedged(
+        self,
+        model: str,
+        prompt: str,
+        hedge_model: str | None = None,
+        use_cache: bool = False,
+        refresh_cache: bool = False,
+        on_delta: DeltaCallback | None = None,
+        deadline: Deadline | None = None,
+        stop: StopCheck | None = None,
+        coalesce: bool = True,
+    ) -> LLMResponse:
+        """
+        Like `acomplete`, but if the model is slower than its recent latency
+        percentile a duplicate request is sent (to `hedge_model` if given)
+        and the first to finish wins; see Hedger. The hedge budget caps
+        how many duplicates are sent. Replayed calls are never hedged.
+        Identical hedged calls are coalesced as a whole, never with each
+        other's contenders.
+        """
+        cassette = current_cassette()
+        if cassette is not None and cassette.replaying:
+            return await self._replay(cassette, model, prompt, on_delta, deadline)
+        if use_cache and not refresh_cache:
+            cached = await self._cached_response(
+                self._cache_key(model, prompt), model, on_delta)
+            if cached is not None:
+                return cached
+
+        async def call(call_model: str, report) -> LLMResponse:
+            # The cache was read above; each contender still stores its answer.
+            return await self.acomplete(
+                call_model, prompt,
+                refresh_cache=use_cache or refresh_cache,
+                on_delta=report, deadline=deadline, stop=stop, coalesce=False,
+            )
+
+        if coalesce and stop is None and self.coalescer.enabled:
+            response = await self._coalesced(
+                ("hedged", hedge_model,
+                 *self._flight_key(model, prompt, use_cache, refresh_cache)),
+                lambda report: self.hedger.run(model, call, hedge_model, report, deadline),
+                model, on_delta, deadline)
+            # Only the first caller's contenders recorded to its cassette.
+            if response.coalesced and cassette is not None:
+                self._record(cassette, prompt, response)
+            return response
+        return await self.hedger.run(model, call, hedge_model, on_delta, deadline)
+
+    async def aclose(self) -> None:
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    def close(self) -> None:
+        if self._http is not None:
+            engine_loop.run(self.aclose())
+
+
+_client: LLMClient | None = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> LLMClient:
+    """Return the process-wide client, creating it on first use."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = LLMClient()
+        return _client
+
+
+def set_client(client: LLMClient | None) -> LLMClient | None:
+    """Replace the process-wide client and return the previous one."""
+    global _client
+    with _client_lock:
+        previous, _client = _client, client
+        return previous
+
+
+def call_llm(model: str, prompt: str) -> str:
+    return get_client().complete(model, prompt).content
@@ -0,0 +1,269 @@
+"""
+End-to-end load generator for the workflow API.
+
+    python loadtest.py --api http://127.0.0.1:8000 --rate 5 --duration 60 \
+        --steps 3 --output results/loadtest.json
+
+Each iteration creates a workflow (POST /workflow), queues a run
+(POST /workflow/run/{id}) and polls GET /execution/{id} until it
+finishes. Iterations start at a fixed rate (open loop), so a slow server
+shows up as latency and backlog rather than as a lower request rate.
+
+Results are written as JSON with the git commit, the settings and
+p50/p95/p99 per endpoint, per step and end to end. Pass --compare with an
+earlier results file to print the change in each percentile.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import requests
+from requests.adapters import HTTPAdapter
+
+FINISHED_STATUSES = ("SUCCESS", "FAILED", "CANCELLED", "TIMED_OUT")
+
+
+def percentile(values: list[float], pct: float) -> float | None:
+    """Nearest-rank percentile of `values`."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def summarize(values: list[float]) -> dict:
+    return {
+        "count": len(values),
+        "mean": sum(values) / len(values) if values else None,
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": max(values) if values else None,
+    }
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _parse_time(value: str | None) -> datetime | None:
+    return datetime.fromisoformat(value) if value else None
+
+
+class LoadTest:
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_maxsize=args.concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.statuses: dict[str, dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self.step_seconds: dict[int, list[float]] = defaultdict(list)
+        self.executions: dict[str, int] = defaultdict(int)
+        self.end_to_end: list[float] = []
+        self.errors: list[str] = []
+        self.late_starts = 0
+        self._lock = threading.Lock()
+
+    def _request(self, endpoint: str, method: str, path: str, **kwargs) -> requests.Response:
+        start = time.perf_counter()
+        try:
+            response = self.session.request(
+                method, self.args.api + path, timeout=self.args.timeout, **kwargs)
+        except requests.RequestException:
+            with self._lock:
+                self.statuses[endpoint]["error"] += 1
+            raise
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.latencies[endpoint].append(elapsed)
+            self.statuses[endpoint][str(response.status_code)] += 1
+        return response
+
+    def _workflow_payload(self, iteration: int) -> dict:
+        steps = [
+            {
+                "step_order": order,
+                "model": self.args.model,
+                "prompt": f"Load test {iteration} step {order}: summarise the input.",
+                "criteria": self.args.criteria,
+                "retry_limit": 1,
+            }
+            for order in range(1, self.args.steps + 1)
+        ]
+        return {"name": f"loadtest-{iteration}", "steps": steps}
+
+    def iteration(self, iteration: int) -> None:
+        try:
+            start = time.perf_counter()
+            response = self._request(
+                "POST /workflow", "POST", "/workflow",
+                json=self._workflow_payload(iteration))
+            response.raise_for_status()
+            workflow_id = response.json()["workflow_id"]
+
+            response = self._request(
+                "POST /workflow/run/{id}", "POST", f"/workflow/run/{workflow_id}")
+            if response.status_code == 429:
+                with self._lock:
+                    self.executions["rejected"] += 1
+                return
+            response.raise_for_status()
+            execution_id = response.json()["execution_id"]
+
+            deadline = time.monotonic() + self.args.execution_timeout
+            while True:
+                time.sleep(self.args.poll_interval)
+                response = self._request(
+                    "GET /execution/{id}", "GET", f"/execution/{execution_id}")
+                response.raise_for_status()
+                detail = response.json()
+                if detail["status"] in FINISHED_STATUSES:
+                    break
+                if time.monotonic() > deadline:
+                    with self._lock:
+                        self.executions["timed_out"] += 1
+                    return
+
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.executions[detail["status"].lower()] += 1
+                self.end_to_end.append(elapsed)
+                for log in detail["step_logs"]:
+                    started = _parse_time(log.get("started_at"))
+                    finished = _parse_time(log.get("finished_at"))
+                    if started and finished:
+                        self.step_seconds[log["step_order"]].append(
+                            (finished - started).total_seconds())
+        except (requests.RequestException, KeyError, ValueError) as e:
+            with self._lock:
+                self.executions["client_errors"] += 1
+                if len(self.errors) < 20:
+                    self.errors.append(f"{type(e).__name__}: {e}")
+
+    def run(self) -> dict:
+        interval = 1 / self.args.rate
+        total = int(self.args.rate * self.args.duration)
+        started_at = datetime.now(timezone.utc)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.args.concurrency) as pool:
+            for i in range(total):
+                due = start + i * interval
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                elif -delay > interval:
+                    self.late_starts += 1
+                pool.submit(self.iteration, i)
+        wall = time.perf_counter() - start
+
+        finished = sum(self.executions[s] for s in ("success", "failed"))
+        return {
+            "commit": _git_commit(),
+            "started_at": started_at.isoformat(),
+            "settings": {
+                key: value for key, value in vars(self.args).items()
+                if key not in ("output", "compare")
+            },
+            "wall_seconds": wall,
+            "iterations": total,
+            "late_starts": self.late_starts,
+            "throughput": {
+                "executions_per_second": finished / wall if wall else 0.0,
+                "requests_per_second": {
+                    endpoint: len(values) / wall
+                    for endpoint, values in self.latencies.items()
+                },
+            },
+            "executions": dict(self.executions),
+            "status_codes": {k: dict(v) for k, v in self.statuses.items()},
+            "endpoints": {k: summarize(v) for k, v in self.latencies.items()},
+            "steps": {str(k): summarize(v) for k, v in sorted(self.step_seconds.items())},
+            "end_to_end": summarize(self.end_to_end),
+            "errors": self.errors,
+        }
+
+
+def compare(current: dict, baseline: dict) -> list[str]:
+    """Lines describing how each percentile moved against `baseline`."""
+    lines = [f"Compared with {baseline.get('commit') or 'baseline'}:"]
+    sections = [("endpoints", current["endpoints"], baseline.get("endpoints", {})),
+                ("steps", current["steps"], baseline.get("steps", {})),
+                ("end_to_end", {"all": current["end_to_end"]},
+                 {"all": baseline.get("end_to_end", {})})]
+    for section, now, before in sections:
+        for name, stats in now.items():
+            old = before.get(name, {})
+            for key in ("p50", "p95", "p99"):
+                if stats.get(key) is None or not old.get(key):
+                    continue
+                change = (stats[key] - old[key]) / old[key] * 100
+                lines.append(
+                    f"  {section} {name} {key}: {old[key] * 1000:.0f}ms -> "
+                    f"{stats[key] * 1000:.0f}ms ({change:+.1f}%)")
+    before_tp = baseline.get("throughput", {}).get("executions_per_second")
+    if before_tp:
+        now_tp = current["throughput"]["executions_per_second"]
+        lines.append(f"  throughput: {before_tp:.2f} -> {now_tp:.2f} executions/s")
+    return lines
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--api", default="http://127.0.0.1:8000")
+    parser.add_argument("--rate", type=float, default=2.0,
+                        help="iterations started per second")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds")
+    parser.add_argument("--steps", type=int, default=3)
+    parser.add_argument("--model", default="mock-model")
+    parser.add_argument("--criteria", default="MOCK")
+    parser.add_argument("--concurrency", type=int, default=64,
+                        help="max iterations in flight")
+    parser.add_argument("--poll-interval", type=float, default=0.2)
+    parser.add_argument("--timeout", type=float, default=30.0,
+                        help="per-request timeout")
+    parser.add_argument("--execution-timeout", type=float, default=300.0)
+    parser.add_argument("--output", help="write results JSON here")
+    parser.add_argument("--compare", help="earlier results JSON to compare with")
+    args = parser.parse_args()
+    args.api = args.api.rstrip("/")
+
+    results = LoadTest(args).run()
+
+    print(f"{results['iterations']} iterations in {results['wall_seconds']:.1f}s, "
+          f"{results['throughput']['executions_per_second']:.2f} executions/s")
+    print(f"executions: {results['executions']}")
+    for name, stats in {**results["endpoints"],
+                        **{f"step {k}": v for k, v in results["steps"].items()},
+                        "end to end": results["end_to_end"]}.items():
+        if stats["count"]:
+            print(f"  {name:28} n={stats['count']:<6} p50={stats['p50'] * 1000:8.1f}ms "
+                  f"p95={stats['p95'] * 1000:8.1f}ms p99={stats['p99'] * 1000:8.1f}ms")
+
+    if args.compare:
+        with open(args.compare) as f:
+            print("\n".join(compare(results, json.load(f))))
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Write-behind buffer for streamed step-log output."""
+
+import logging
+import os
+import threading
+
+from sqlalchemy import bindparam, update
+
+from database import SessionLocal
+from models import ExecutionStepLog
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL = float(os.getenv("LOG_FLUSH_INTERVAL", "0.25"))
+
+
+class StepLogWriter:
+    """
+    Collects partial outputs of running steps and writes them from one
+    background thread, all pending logs in a single transaction per
+    FLUSH_INTERVAL. Only the latest text per log is kept, and the update
+    only touches logs still RUNNING, so a late flush never overwrites a
+    finished step. Status transitions do not go through here: the runner
+    commits them directly, so they are durable when published.
+    """
+
+    def __init__(self, session_factory=SessionLocal, interval: float = FLUSH_INTERVAL):
+        self._session_factory = session_factory
+        self._interval = interval
+        self._pending: dict[int, str] = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread: threading.Thread | None = None
+        self.flushes = 0
+        self.rows = 0
+
+    def write(self, log_id: int, output: str) -> None:
+        with self._lock:
+            self._pending[log_id] = output
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="step-log-writer", daemon=True)
+                self._thread.start()
+
+    def discard(self, log_id: int) -> None:
+        """Drop a pending partial output, e.g. once the step has finished."""
+        with self._lock:
+            self._pending.pop(log_id, None)
+
+    def _run(self) -> None:
+        while True:
+            self._wakeup.wait(self._interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Step log flush failed")
+
+    def flush(self) -> None:
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        statement = (
+            update(ExecutionStepLog)
+            .where(ExecutionStepLog.id == bindparam("log_id"),
+                   ExecutionStepLog.status == "RUNNING")
+            .values(output=bindparam("text"))
+        )
+        db = self._session_factory()
+        try:
+            db.connection().execute(
+                statement,
+                [{"log_id": log_id, "text": text} for log_id, text in pending.items()],
+            )
+            db.commit()
+        finally:
+            db.close()
+        self.flushes += 1
+        self.rows += len(pending)
+
+
+_writer: StepLogWriter | None = None
+_writer_lock = threading.Lock()
+
+
+def get_log_writer() -> StepLogWriter:
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = StepLogWriter()
+        return _writer
@@ -1,18 +1,55 @@
 """FastAPI application for workflow execution."""
 
+import asyncio
+import json
 from datetime import datetime
 from typing import Annotated
 
-from fastapi import Depends, FastAPI, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import Depends, FastAPI, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import ValidationError
+from sqlalchemy import func
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session, joinedload
 
-from database import Base, SessionLocal, engine
-from models import Execution, ExecutionStepLog, Step, Workflow
-from runner import run_workflow
-from schemas import StepCreate, WorkflowCreate
+import engine_loop
+from batch import (
+    DEFAULT_CONCURRENCY, add_inputs, batch_progress, chunked, create_batch,
+    discard_batch, start_batch, stream_results,
+)
+from blobs import log_output, read_blob
+from cassette import MODES as CASSETTE_MODES
+from database import SessionLocal, engine
+from events import bus
+from executor import EXECUTION_QUEUE, QueueFullError, get_pool, shutdown_pool
+from llm_client import get_client
+from migrations import upgrade
+from models import ArchivedExecution, Batch, Execution, ExecutionStepLog, Step, Workflow
+from observability import configure_logging, instrument_sessions, registry
+from pagination import after_cursor, encode_cursor, execution_filters
+from plan import invalidate_plan, plans
+from recovery import (
+    RESUMABLE_STATUSES, RESUME_ON_STARTUP, recover_interrupted, resume_execution,
+    start_reclaimer, stop_reclaimer,
+)
+from retention import read_archived, retention_stats, start_retention, stop_retention
+from runner import cancel_execution, create_execution, run_workflow_async
+from schemas import BatchCreate, StepCreate, WorkflowCreate
+
+configure_logging()
+instrument_sessions()
 
 app = FastAPI()
 
+FINISHED_STATUSES = ("SUCCESS", "FAILED", "CANCELLED", "TIMED_OUT")
+ACTIVE_STATUSES = ("QUEUED", "RUNNING")
+# Workers in other processes cannot publish to this process's bus, so
+# streams re-read the database more often when they run executions.
+SSE_IDLE_SECONDS = 1.0 if EXECUTION_QUEUE == "database" else 15.0
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
 
 def get_db():
     """Dependency for getting database session."""
@@ -25,8 +62,35 @@ def get_db():
 
 @app.on_event("startup")
 def create_tables():
-    """Create database tables on startup."""
-    Base.metadata.create_all(bind=engine)
+    """Create database tables, and add columns missing from older ones, on startup."""
+    upgrade(engine)
+
+
+@app.on_event("startup")
+def recover_executions():
+    """
+    Requeue executions and batches interrupted by the last shutdown, and
+    keep requeueing ones whose lease runs out later.
+    """
+    if RESUME_ON_STARTUP:
+        recover_interrupted()
+        start_reclaimer()
+
+
+@app.on_event("startup")
+def schedule_retention():
+    """Archive expired executions periodically if RETENTION_INTERVAL is set."""
+    start_retention()
+
+
+@app.on_event("shutdown")
+def stop_pool():
+    """Let running executions finish before the process exits."""
+    stop_retention()
+    stop_reclaimer()
+    shutdown_pool(wait=True)
+    get_client().close()
+    engine_loop.stop_loop()
 
 
 @app.post("/workflow")
@@ -34,92 +98,788 @@ def create_workflow(
     workflow_data: WorkflowCreate, db: Annotated[Session, Depends(get_db)]
 ) -> dict:
     """Create a workflow with steps."""
-    workflow = Workflow(name=workflow_data.name)
+    # Steps hang off the relationship so everything goes out in one flush.
+    workflow = Workflow(
+        name=workflow_data.name,
+        deadline_seconds=workflow_data.deadline_seconds,
+        steps=[_apply_step(Step(), step_data) for step_data in workflow_data.steps],
+    )
     db.add(workflow)
-    db.flush()
-
-    for step_data in workflow_data.steps:
-        step = Step(
-            workflow_id=workflow.id,
-            model=step_data.model,
-            prompt=step_data.prompt,
-            completion_criteria=step_data.criteria,
-            retry_limit=step_data.retry_limit,
-            step_order=step_data.step_order,
-        )
-        db.add(step)
-
     db.commit()
     return {"workflow_id": workflow.id}
 
 
-@app.post("/workflow/run/{workflow_id}")
-def run_workflow_endpoint(
-    workflow_id: int, db: Annotated[Session, Depends(get_db)]
+def _apply_step(step: Step, step_data: StepCreate) -> Step:
+    step.model = step_data.model
+    step.prompt = step_data.prompt
+    step.completion_criteria = step_data.criteria
+    step.retry_limit = step_data.retry_limit
+    step.step_order = step_data.step_order
+    step.cache = step_data.cache
+    step.hedge = step_data.hedge
+    step.hedge_model = step_data.hedge_model
+    step.coalesce = step_data.coalesce
+    step.kind = step_data.kind
+    step.split = step_data.split
+    step.split_delimiter = step_data.split_delimiter
+    step.chunk_size = step_data.chunk_size
+    step.map_concurrency = step_data.map_concurrency
+    step.deadline_seconds = step_data.deadline_seconds
+    step.context = step_data.context
+    step.context_steps = (
+        json.dumps(step_data.context_steps)
+        if step_data.context_steps is not None else None
+    )
+    step.context_max_tokens = step_data.context_max_tokens
+    step.depends_on = (
+        json.dumps(step_data.depends_on)
+        if step_data.depends_on is not None else None
+    )
+    return step
+
+
+@app.put("/workflow/{workflow_id}")
+def update_workflow(
+    workflow_id: int,
+    workflow_data: WorkflowCreate,
+    db: Annotated[Session, Depends(get_db)],
 ) -> dict:
-    """Run a workflow and return execution result."""
-    workflow = db.query(Workflow).filter(Workflow.id == workflow_id).first()
+    """
+    Replace a workflow's name and steps. Steps are matched by step_order:
+    matching steps are updated in place, so earlier step logs still point
+    at them, new ones are added and missing ones removed. Not allowed
+    while any of the workflow's executions are queued or running.
+    """
+    workflow = db.get(Workflow, workflow_id, options=[joinedload(Workflow.steps)])
     if not workflow:
         raise HTTPException(status_code=404, detail="Workflow not found")
+    active = db.query(Execution.id).filter(
+        Execution.workflow_id == workflow_id,
+        Execution.status.in_(ACTIVE_STATUSES),
+    ).first()
+    if active:
+        raise HTTPException(
+            status_code=409,
+            detail="Workflow has queued or running executions, try again later")
 
-    execution_id, result = run_workflow(workflow, db)
+    existing = {step.step_order: step for step in workflow.steps}
+    for step_data in workflow_data.steps:
+        step = existing.pop(step_data.step_order, None)
+        if step is None:
+            step = Step()
+            workflow.steps.append(step)
+        _apply_step(step, step_data)
+    if existing:
+        removed = [step.id for step in existing.values()]
+        db.query(ExecutionStepLog).filter(
+            ExecutionStepLog.step_id.in_(removed)).update(
+                {ExecutionStepLog.step_id: None}, synchronize_session=False)
+        for step in existing.values():
+            workflow.steps.remove(step)
+            db.delete(step)
+    workflow.name = workflow_data.name
+    workflow.deadline_seconds = workflow_data.deadline_seconds
+    workflow.version = (workflow.version or 1) + 1
+    db.commit()
+    invalidate_plan(workflow_id)
+    return {"workflow_id": workflow.id, "version": workflow.version}
 
-    return {
-        "execution_id": execution_id,
-        "success": result.success,
-        "step_outputs": result.step_outputs,
-        "error_message": result.error_message,
-    }
 
+def _prepare_run(
+    workflow_id: int, cassette: str | None, replay_from: int | None
+) -> tuple[str | None, str | None]:
+    """Check a run request; returns its cassette mode and path."""
+    db = SessionLocal()
+    try:
+        if db.get(Workflow, workflow_id) is None:
+            raise HTTPException(status_code=404, detail="Workflow not found")
 
-@app.get("/executions")
-def list_executions(
-    db: Annotated[Session, Depends(get_db)]
-) -> list[dict]:
-    """List all executions."""
-    executions = db.query(Execution).order_by(
-        Execution.created_at.desc()).all()
-    return [
-        {
-            "id": exec.id,
-            "workflow_id": exec.workflow_id,
-            "status": exec.status,
-            "created_at": exec.created_at.isoformat() if exec.created_at else None,
+        cassette_path = None
+        if replay_from is not None:
+            cassette = cassette or "replay"
+            source = db.get(Execution, replay_from)
+            if source is None or not source.cassette_path or source.cassette_mode != "record":
+                raise HTTPException(
+                    status_code=404,
+                    detail=f"Execution {replay_from} has no recorded cassette")
+            cassette_path = source.cassette_path
+    finally:
+        db.close()
+    if cassette is not None:
+        if cassette not in CASSETTE_MODES:
+            raise HTTPException(
+                status_code=400,
+                detail=f"cassette must be one of {', '.join(CASSETTE_MODES)}")
+        if cassette != "record" and cassette_path is None:
+            raise HTTPException(
+                status_code=400, detail="Replaying needs replay_from")
+        if cassette == "record" and replay_from is not None:
+            raise HTTPException(
+                status_code=400, detail="Cannot record while replaying")
+    return cassette, cassette_path
+
+
+def _queue_run(
+    workflow_id: int, cassette: str | None, cassette_path: str | None
+) -> tuple[int, str]:
+    db = SessionLocal()
+    try:
+        execution = create_execution(
+            db.get(Workflow, workflow_id), db,
+            cassette_mode=cassette, cassette_path=cassette_path)
+        try:
+            get_pool().submit(execution.id)
+        except QueueFullError:
+            db.delete(execution)
+            db.commit()
+            raise HTTPException(
+                status_code=429,
+                detail="Execution queue is full, try again later",
+                headers={"Retry-After": "5"},
+            )
+        except SQLAlchemyError:
+            # The database queue could not mark it enqueued (e.g. the database
+            # stayed locked); drop it rather than leave it waiting for no worker.
+            db.rollback()
+            db.delete(execution)
+            db.commit()
+            raise HTTPException(
+                status_code=503,
+                detail="Execution queue is unavailable, try again later",
+                headers={"Retry-After": "5"},
+            )
+        return execution.id, execution.status
+    finally:
+        db.close()
+
+
+@app.post("/workflow/run/{workflow_id}")
+async def run_workflow_endpoint(
+    workflow_id: int,
+    response: Response,
+    wait: bool = False,
+    cassette: str | None = None,
+    replay_from: int | None = None,
+    preview: Annotated[int | None, Query(ge=0)] = None,
+) -> dict:
+    """
+    Queue a workflow run on the background pool and return its execution id.
+    Pass `wait=true` to run it now and return the full result instead, with
+    each step output cut to `preview` characters if given. Either way the
+    run is a coroutine on the engine loop: a waiting request holds no thread.
+
+    `cassette=record` records the run's LLM calls; `replay_from=<execution
+    id>` replays those recorded by an earlier execution with no network
+    calls, instantly or, with `cassette=replay_timed`, at recorded speed.
+    """
+    cassette, cassette_path = await run_in_threadpool(
+        _prepare_run, workflow_id, cassette, replay_from)
+
+    if wait:
+        # A client that stops waiting does not cancel the run.
+        execution_id, result = await asyncio.shield(asyncio.wrap_future(
+            engine_loop.submit(run_workflow_async(workflow_id, cassette, cassette_path))))
+        step_outputs = result.step_outputs
+        if preview is not None:
+            step_outputs = [output[:preview] for output in step_outputs]
+        return {
+            "execution_id": execution_id,
+            "success": result.success,
+            "status": result.status,
+            "step_outputs": step_outputs,
+            "error_message": result.error_message,
         }
-        for exec in executions
-    ]
 
+    execution_id, status = await run_in_threadpool(
+        _queue_run, workflow_id, cassette, cassette_path)
+    response.status_code = 202
+    return {"execution_id": execution_id, "status": status}
 
-@app.get("/execution/{execution_id}")
-def get_execution(
+
+@app.post("/execution/{execution_id}/resume", status_code=202)
+def resume_execution_endpoint(
     execution_id: int, db: Annotated[Session, Depends(get_db)]
 ) -> dict:
-    """Get execution details with step logs."""
-    execution = db.query(Execution).filter(
-        Execution.id == execution_id).first()
+    """
+    Re-run a failed, cancelled or timed-out execution from its first
+    unfinished step. Steps that already completed keep their outputs and
+    are not called again.
+    """
+    execution = db.get(Execution, execution_id)
     if not execution:
         raise HTTPException(status_code=404, detail="Execution not found")
+    if execution.status not in RESUMABLE_STATUSES:
+        raise HTTPException(
+            status_code=409,
+            detail=f"Only {', '.join(RESUMABLE_STATUSES)} executions can be resumed, "
+                   f"this one is {execution.status}",
+        )
 
-    step_logs = (
-        db.query(ExecutionStepLog)
-        .filter(ExecutionStepLog.execution_id == execution_id)
-        .order_by(ExecutionStepLog.step_order)
+    try:
+        resume_execution(execution, db)
+    except QueueFullError:
+        raise HTTPException(
+            status_code=429,
+            detail="Execution queue is full, try again later",
+            headers={"Retry-After": "5"},
+        )
+    return {"execution_id": execution.id, "status": execution.status}
+
+
+@app.post("/execution/{execution_id}/cancel")
+def cancel_execution_endpoint(
+    execution_id: int, db: Annotated[Session, Depends(get_db)]
+) -> dict:
+    """
+    Cancel a queued or running execution. It is marked CANCELLED at once,
+    so no worker picks it up and its queue slot is freed. If it runs in
+    this process its in-flight LLM requests are aborted right away; a
+    worker process running it stops it at its next lease heartbeat.
+    """
+    execution = db.get(Execution, execution_id)
+    if not execution:
+        raise HTTPException(status_code=404, detail="Execution not found")
+    cancelled = db.query(Execution).filter(
+        Execution.id == execution_id,
+        Execution.status.in_(ACTIVE_STATUSES),
+    ).update({Execution.status: "CANCELLED", Execution.finished_at: datetime.utcnow(),
+              Execution.error_message: "Execution cancelled"},
+             synchronize_session=False)
+    db.commit()
+    if not cancelled:
+        db.refresh(execution)
+        raise HTTPException(
+            status_code=409,
+            detail=f"Only queued or running executions can be cancelled, "
+                   f"this one is {execution.status}",
+        )
+
+    if not get_pool().cancel(execution_id):
+        cancel_execution(execution_id)
+    bus.publish(execution_id, {"type": "execution", "status": "CANCELLED"})
+    return {"execution_id": execution_id, "status": "CANCELLED"}
+
+
+async def _ndjson_inputs(request: Request):
+    """Parse a streamed NDJSON body into input dicts, one line at a time."""
+    buffer = b""
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield _parse_input_line(line)
+    if buffer.strip():
+        yield _parse_input_line(buffer)
+
+
+def _parse_input_line(line: bytes) -> dict:
+    try:
+        value = json.loads(line)
+    except json.JSONDecodeError as e:
+        raise HTTPException(status_code=422, detail=f"Invalid NDJSON line: {e}")
+    if not isinstance(value, dict):
+        raise HTTPException(
+            status_code=422, detail="Each NDJSON line must be a JSON object")
+    return value
+
+
+@app.post("/workflow/{workflow_id}/batch", status_code=202)
+async def create_batch_endpoint(
+    workflow_id: int,
+    request: Request,
+    concurrency: Annotated[int, Query(ge=1)] = DEFAULT_CONCURRENCY,
+) -> dict:
+    """
+    Run a workflow once per input set. The body is either JSON
+    `{"inputs": [{...}, ...]}` or NDJSON (`application/x-ndjson`) with one
+    input object per line; NDJSON is read and stored incrementally, and
+    if any line is invalid nothing of the batch is kept. Input values
+    replace `{{ name }}` placeholders in step prompts.
+    """
+    def workflow_exists() -> bool:
+        db = SessionLocal()
+        try:
+            return db.get(Workflow, workflow_id) is not None
+        finally:
+            db.close()
+
+    if not await run_in_threadpool(workflow_exists):
+        raise HTTPException(status_code=404, detail="Workflow not found")
+
+    ndjson = request.headers.get("content-type", "").startswith("application/x-ndjson")
+    if not ndjson:
+        try:
+            payload = BatchCreate.model_validate(await request.json())
+        except (ValueError, ValidationError) as e:
+            raise HTTPException(status_code=422, detail=str(e))
+
+    batch_id = await run_in_threadpool(create_batch, workflow_id, concurrency)
+    total = 0
+    try:
+        if ndjson:
+            chunk = []
+            async for variables in _ndjson_inputs(request):
+                chunk.append(variables)
+                if len(chunk) >= 500:
+                    await run_in_threadpool(add_inputs, batch_id, workflow_id, chunk)
+                    total += len(chunk)
+                    chunk = []
+            await run_in_threadpool(add_inputs, batch_id, workflow_id, chunk)
+            total += len(chunk)
+        else:
+            for chunk in chunked(payload.inputs):
+                await run_in_threadpool(add_inputs, batch_id, workflow_id, chunk)
+                total += len(chunk)
+    except BaseException:
+        # Nothing dispatches a batch that was never started: drop what was
+        # stored so it does not sit QUEUED or get run by recovery.
+        await run_in_threadpool(discard_batch, batch_id)
+        raise
+
+    start_batch(batch_id, concurrency)
+    return {"batch_id": batch_id, "total": total, "status": "QUEUED"}
+
+
+@app.get("/batch/{batch_id}")
+def get_batch(batch_id: int, db: Annotated[Session, Depends(get_db)]) -> dict:
+    """Aggregate progress of a batch."""
+    batch = db.get(Batch, batch_id)
+    if not batch:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return batch_progress(db, batch)
+
+
+@app.get("/batch/{batch_id}/results")
+def get_batch_results(
+    batch_id: int, db: Annotated[Session, Depends(get_db)], follow: bool = True
+) -> StreamingResponse:
+    """
+    Stream finished executions of a batch as NDJSON. With `follow` the
+    stream stays open until every execution has finished.
+    """
+    if not db.get(Batch, batch_id):
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return StreamingResponse(
+        stream_results(batch_id, follow=follow),
+        media_type="application/x-ndjson",
+    )
+
+
+@app.get("/executions")
+def list_executions(
+    db: Annotated[Session, Depends(get_db)],
+    limit: Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE)] = DEFAULT_PAGE_SIZE,
+    cursor: str | None = None,
+    status: str | None = None,
+    workflow_id: int | None = None,
+    created_after: datetime | None = None,
+    created_before: datetime | None = None,
+) -> dict:
+    """
+    List executions newest first, one page at a time. Pass the returned
+    `next_cursor` back as `cursor` to fetch the following page.
+    """
+    conditions = execution_filters(
+        status, workflow_id, created_after, created_before)
+    if cursor:
+        try:
+            conditions.append(after_cursor(cursor))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    executions = (
+        db.query(Execution)
+        .filter(*conditions)
+        .order_by(Execution.created_at.desc(), Execution.id.desc())
+        .limit(limit + 1)
         .all()
     )
+    page = executions[:limit]
+    next_cursor = None
+    if len(executions) > limit:
+        next_cursor = encode_cursor(page[-1].created_at, page[-1].id)
+
+    return {
+        "items": [
+            {
+                "id": exec.id,
+                "workflow_id": exec.workflow_id,
+                "status": exec.status,
+                "created_at": exec.created_at.isoformat() if exec.created_at else None,
+            }
+            for exec in page
+        ],
+        "next_cursor": next_cursor,
+    }
+
+
+@app.get("/executions/count")
+def count_executions(
+    db: Annotated[Session, Depends(get_db)],
+    status: str | None = None,
+    workflow_id: int | None = None,
+    created_after: datetime | None = None,
+    created_before: datetime | None = None,
+) -> dict:
+    """Count executions matching the same filters as GET /executions."""
+    conditions = execution_filters(
+        status, workflow_id, created_after, created_before)
+    count = db.query(func.count(Execution.id)).filter(*conditions).scalar()
+    return {"count": count}
+
+
+STEP_LOG_FIELDS = (
+    "status", "output", "output_hash", "output_size", "retry_count", "llm_retries",
+    "breaker_state", "hedge_winner", "prompt_tokens_estimate", "context_tokens_saved",
+    "started_at", "finished_at", "attempts", "items",
+)
+
+
+def _parse_fields(fields: str | None) -> frozenset[str]:
+    """The step-log fields named in a comma-separated `fields` parameter."""
+    if fields is None:
+        return frozenset(STEP_LOG_FIELDS)
+    requested = {name.strip() for name in fields.split(",") if name.strip()}
+    unknown = requested.difference(STEP_LOG_FIELDS)
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown step log fields: {', '.join(sorted(unknown))}; "
+                   f"expected any of {', '.join(STEP_LOG_FIELDS)}")
+    return frozenset(requested)
+
+
+def _step_log_detail(
+    log: ExecutionStepLog,
+    fields: frozenset[str],
+    preview: int | None,
+    items: list[ExecutionStepLog] | None = None,
+) -> dict:
+    detail = {
+        "id": log.id,
+        "step_order": log.step_order,
+        "item_index": log.item_index,
+        "status": log.status,
+        "output": None,
+        "output_hash": log.output_hash,
+        "output_size": log.output_size,
+        "retry_count": log.retry_count,
+        "llm_retries": log.llm_retries,
+        "breaker_state": log.breaker_state,
+        "hedge_winner": log.hedge_winner,
+        "prompt_tokens_estimate": log.prompt_tokens_estimate,
+        "context_tokens_saved": log.context_tokens_saved,
+        "started_at": log.started_at.isoformat() if log.started_at else None,
+        "finished_at": log.finished_at.isoformat() if log.finished_at else None,
+    }
+    if "output" in fields:
+        output = log_output(log)
+        if preview is not None:
+            truncated = output is not None and len(output) > preview
+            detail["output"] = output[:preview] if truncated else output
+            detail["output_truncated"] = truncated
+        else:
+            detail["output"] = output
+    if "attempts" in fields:
+        detail["attempts"] = [
+            {
+                "attempt": attempt.attempt,
+                "status": attempt.status,
+                "error": attempt.error,
+                "model": attempt.model,
+                "started_at": attempt.started_at.isoformat(),
+                "duration": attempt.duration,
+                "llm_seconds": attempt.llm_seconds,
+                "queue_wait": attempt.queue_wait,
+                "llm_retries": attempt.llm_retries,
+                "prompt_tokens": attempt.prompt_tokens,
+                "completion_tokens": attempt.completion_tokens,
+            }
+            for attempt in log.attempts
+        ]
+    if "items" in fields:
+        detail["items"] = [
+            _step_log_detail(item, fields - {"items"}, preview)
+            for item in sorted(items or [], key=lambda item: item.item_index)
+        ]
+    return {
+        key: value for key, value in detail.items()
+        if key in fields or key in ("id", "step_order", "output_truncated")
+        or (key == "item_index" and value is not None)
+    }
+
 
+def _execution_detail(
+    db: Session,
+    execution_id: int,
+    fields: frozenset[str] = frozenset(STEP_LOG_FIELDS),
+    preview: int | None = None,
+) -> dict | None:
+    """
+    The execution with its step logs, limited to `fields`, and outputs cut
+    to `preview` characters if given; logs of map items are nested under
+    their step's log. Only what is asked for is loaded, all in one query.
+    """
+    step_logs = joinedload(Execution.step_logs)
+    options = [step_logs]
+    if "attempts" in fields:
+        options.append(step_logs.joinedload(ExecutionStepLog.attempts))
+    if "output" in fields:
+        options.append(step_logs.joinedload(ExecutionStepLog.output_blob))
+    execution = db.get(Execution, execution_id, options=options)
+    if not execution:
+        return None
+
+    step_logs, items = [], {}
+    for log in sorted(execution.step_logs, key=lambda log: (log.step_order, log.id)):
+        if log.parent_log_id is None:
+            step_logs.append(log)
+        else:
+            items.setdefault(log.parent_log_id, []).append(log)
     return {
         "id": execution.id,
         "workflow_id": execution.workflow_id,
         "status": execution.status,
         "created_at": execution.created_at.isoformat() if execution.created_at else None,
+        "error_message": execution.error_message,
+        "cassette_mode": execution.cassette_mode,
         "step_logs": [
-            {
-                "id": log.id,
-                "step_order": log.step_order,
-                "status": log.status,
-                "output": log.output,
-                "retry_count": log.retry_count,
-            }
+            _step_log_detail(log, fields, preview, items.get(log.id, []))
             for log in step_logs
         ],
     }
+
+
+@app.get("/execution/{execution_id}")
+def get_execution(
+    execution_id: int,
+    db: Annotated[Session, Depends(get_db)],
+    fields: str | None = None,
+    preview: Annotated[int | None, Query(ge=0)] = None,
+) -> dict:
+    """
+    Get execution details with step logs. `fields` picks the step-log
+    fields to return (comma-separated, e.g. `status,output_size`) and
+    `preview` cuts each output to that many characters; fetch a full
+    output from /execution/{id}/steps/{step_order}/output.
+    """
+    detail = _execution_detail(db, execution_id, _parse_fields(fields), preview)
+    if detail is None:
+        if db.get(ArchivedExecution, execution_id) is not None:
+            raise HTTPException(
+                status_code=404,
+                detail=f"Execution archived, see /archive/executions/{execution_id}")
+        raise HTTPException(status_code=404, detail="Execution not found")
+    return detail
+
+
+@app.get("/archive/executions/{execution_id}")
+def get_archived_execution(execution_id: int) -> dict:
+    """An execution removed by retention, read back from its archive file."""
+    try:
+        record = read_archived(execution_id)
+    except OSError:
+        raise HTTPException(status_code=410, detail="Archive file is missing")
+    if record is None:
+        raise HTTPException(status_code=404, detail="Archived execution not found")
+    return record
+
+
+@app.get("/retention/stats")
+def retention_status() -> dict:
+    """Retention policy, schedule and the last periodic pass."""
+    return retention_stats()
+
+
+def _byte_range(header: str, size: int) -> tuple[int, int] | None:
+    """
+    Parse a single `bytes=` range into inclusive (start, end) offsets.
+    Returns None for anything but one byte range, so the whole body is
+    sent; raises ValueError when the range cannot be satisfied.
+    """
+    unit, _, spec = header.partition("=")
+    first, sep, last = spec.strip().partition("-")
+    if unit.strip() != "bytes" or not sep or not (first + last).isdigit():
+        return None
+    if not first:
+        start, end = max(0, size - int(last)), size - 1
+        if int(last) == 0:
+            raise ValueError("Empty suffix range")
+    else:
+        start = int(first)
+        if last and int(last) < start:
+            return None
+        end = min(int(last), size - 1) if last else size - 1
+    if start >= size:
+        raise ValueError("Range not satisfiable")
+    return start, end
+
+
+@app.get("/execution/{execution_id}/steps/{step_order}/output")
+def get_step_output(
+    execution_id: int,
+    step_order: int,
+    request: Request,
+    db: Annotated[Session, Depends(get_db)],
+    item: Annotated[int | None, Query(ge=0)] = None,
+) -> Response:
+    """
+    A step's full output as text, or with `item` that of one item of a
+    map step. Completed outputs are addressed by their hash, so they
+    carry a strong ETag and honour If-None-Match and single byte ranges
+    (`Range: bytes=0-1023`).
+    """
+    query = (
+        db.query(ExecutionStepLog)
+        .options(joinedload(ExecutionStepLog.output_blob))
+        .filter(ExecutionStepLog.execution_id == execution_id,
+                ExecutionStepLog.step_order == step_order)
+    )
+    if item is None:
+        query = query.filter(ExecutionStepLog.parent_log_id.is_(None))
+    else:
+        query = query.filter(ExecutionStepLog.parent_log_id.is_not(None),
+                             ExecutionStepLog.item_index == item)
+    log = query.order_by(ExecutionStepLog.id.desc()).first()
+    if log is None:
+        raise HTTPException(status_code=404, detail="Step log not found")
+
+    media_type = "text/plain; charset=utf-8"
+    if log.output_blob is None:
+        # Still running (or never finished): the partial text, uncached.
+        return Response((log.output or "").encode("utf-8"), media_type=media_type,
+                        headers={"Cache-Control": "no-store"})
+
+    etag = f'"{log.output_hash}"'
+    headers = {"ETag": etag, "Accept-Ranges": "bytes"}
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+
+    data = read_blob(log.output_blob)
+    range_header = request.headers.get("range")
+    if range_header:
+        try:
+            byte_range = _byte_range(range_header, len(data))
+        except ValueError:
+            return Response(status_code=416,
+                            headers={**headers, "Content-Range": f"bytes */{len(data)}"})
+        if byte_range is not None:
+            start, end = byte_range
+            return Response(
+                data[start:end + 1], status_code=206, media_type=media_type,
+                headers={**headers, "Content-Range": f"bytes {start}-{end}/{len(data)}"})
+    return Response(data, media_type=media_type, headers=headers)
+
+
+def _load_execution_detail(execution_id: int) -> dict | None:
+    db = SessionLocal()
+    try:
+        return _execution_detail(db, execution_id)
+    finally:
+        db.close()
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.get("/execution/{execution_id}/stream")
+async def stream_execution(execution_id: int, request: Request) -> StreamingResponse:
+    """
+    Server-Sent Events for one execution. The stream opens with a
+    `snapshot` event holding the same body as GET /execution/{id}, then
+    pushes `execution`, `step`, `attempt` and `delta` events as they
+    happen, and closes once the execution has finished. Executions run by
+    another process are followed by re-reading the database on idle.
+    """
+    subscription = bus.subscribe(execution_id)
+    snapshot = await run_in_threadpool(_load_execution_detail, execution_id)
+    if snapshot is None:
+        bus.unsubscribe(subscription)
+        raise HTTPException(status_code=404, detail="Execution not found")
+
+    async def events():
+        nonlocal snapshot
+        try:
+            yield _sse("snapshot", snapshot)
+            while snapshot["status"] not in FINISHED_STATUSES:
+                if await request.is_disconnected():
+                    return
+                event = await subscription.get(timeout=SSE_IDLE_SECONDS)
+                if event is None or subscription.lagged:
+                    subscription.lagged = False
+                    latest = await run_in_threadpool(
+                        _load_execution_detail, execution_id)
+                    if latest is None:
+                        return
+                    if latest != snapshot:
+                        snapshot = latest
+                        yield _sse("snapshot", snapshot)
+                    else:
+                        yield ": keep-alive\n\n"
+                    continue
+                yield _sse(event["type"], event)
+                if event["type"] == "execution":
+                    snapshot["status"] = event["status"]
+            # Close with the final persisted state.
+            final = await run_in_threadpool(_load_execution_detail, execution_id)
+            if final is not None and final != snapshot:
+                yield _sse("snapshot", final)
+        finally:
+            bus.unsubscribe(subscription)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics() -> PlainTextResponse:
+    """Prometheus metrics in the text exposition format."""
+    return PlainTextResponse(
+        registry.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/llm/breakers")
+def breaker_states() -> dict:
+    """Current circuit breaker state per model."""
+    return get_client().breakers.states()
+
+
+@app.get("/llm/hedging")
+def hedging_stats() -> dict:
+    """Hedged request counts, remaining budget and current hedge delays."""
+    return get_client().hedger.stats()
+
+
+@app.get("/llm/coalescing")
+def coalescing_stats() -> dict:
+    """Shared (coalesced) LLM calls: requests started, callers that joined one."""
+    return get_client().coalescer.stats()
+
+
+@app.get("/llm/rate-limits")
+def rate_limit_stats() -> dict:
+    """Configured limits and queue-wait statistics per model."""
+    client = get_client()
+    return {
+        "limits": {
+            model: vars(limits) for model, limits in client.limiter.limits.items()
+        },
+        "queues": client.limiter.stats(),
+    }
+
+
+@app.get("/plans/stats")
+def plan_stats() -> dict:
+    """Entries and hit/miss counters of the compiled workflow plan cache."""
+    return plans.stats()
+
+
+@app.get("/cache/stats")
+def cache_stats() -> dict:
+    """Hit/miss counters for the LLM response cache."""
+    return get_client().cache.stats()
@@ -0,0 +1,115 @@
+"""
+Schema setup for new and existing databases.
+
+`create_all` only creates missing tables, so a database made by an older
+version keeps its old tables without the columns added since. `upgrade`
+creates what is missing, adds each missing column with ALTER TABLE ...
+ADD COLUMN, and creates missing indexes, including those declared in
+`__table_args__` for tables that already existed (which create_all
+skips), and on Postgres widens string columns the models have made
+longer (SQLite does not enforce lengths). It is
+idempotent and runs at every startup; building an index on a large table
+can take a while the first time.
+
+Added columns get the model's scalar default as a server default, so
+existing rows read as they would have been written today; NOT NULL is
+only kept when there is such a default, and foreign keys are not added
+to existing tables (SQLite cannot add them, and the ORM does not need
+them).
+"""
+
+import logging
+
+from sqlalchemy import Column, String, inspect, literal, text
+from sqlalchemy.engine import Connection, Engine
+
+# Importing Base from models registers every table on it.
+from models import Base
+
+logger = logging.getLogger(__name__)
+
+
+def _column_ddl(column: Column, connection: Connection) -> str:
+    dialect = connection.dialect
+    preparer = dialect.identifier_preparer
+    ddl = f"{preparer.format_column(column)} {column.type.compile(dialect=dialect)}"
+    default = column.default
+    if default is not None and default.is_scalar:
+        value = literal(default.arg, type_=column.type).compile(
+            dialect=dialect, compile_kwargs={"literal_binds": True})
+        ddl += f" DEFAULT {value}"
+        if not column.nullable:
+            ddl += " NOT NULL"
+    return ddl
+
+
+def add_missing_columns(connection: Connection) -> list[str]:
+    """Add model columns missing from existing tables; returns them as table.column."""
+    inspector = inspect(connection)
+    existing_tables = set(inspector.get_table_names())
+    added = []
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            connection.execute(text(
+                f"ALTER TABLE {connection.dialect.identifier_preparer.format_table(table)} "
+                f"ADD COLUMN {_column_ddl(column, connection)}"))
+            added.append(f"{table.name}.{column.name}")
+    return added
+
+
+def create_missing_indexes(connection: Connection) -> list[str]:
+    """Create model indexes the database does not have; returns their names."""
+    inspector = inspect(connection)
+    created = []
+    for table in Base.metadata.sorted_tables:
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in sorted(table.indexes, key=lambda index: index.name):
+            if index.name not in existing:
+                index.create(connection, checkfirst=True)
+                created.append(index.name)
+    return created
+
+
+def widen_string_columns(connection: Connection) -> list[str]:
+    """Lengthen Postgres string columns shorter than the model's; returns them as table.column."""
+    if connection.dialect.name != "postgresql":
+        return []
+    inspector = inspect(connection)
+    existing_tables = set(inspector.get_table_names())
+    preparer = connection.dialect.identifier_preparer
+    widened = []
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        lengths = {column["name"]: getattr(column["type"], "length", None)
+                   for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            length = lengths.get(column.name)
+            if (isinstance(column.type, String) and column.type.length
+                    and length is not None and length < column.type.length):
+                connection.execute(text(
+                    f"ALTER TABLE {preparer.format_table(table)} "
+                    f"ALTER COLUMN {preparer.format_column(column)} "
+                    f"TYPE {column.type.compile(dialect=connection.dialect)}"))
+                widened.append(f"{table.name}.{column.name}")
+    return widened
+
+
+def upgrade(bind: Engine) -> None:
+    """Bring the database's schema up to the models."""
+    Base.metadata.create_all(bind=bind)
+    with bind.begin() as connection:
+        added = add_missing_columns(connection)
+        indexes = create_missing_indexes(connection)
+        widened = widen_string_columns(connection)
+    if added:
+        logger.info("Added %d columns to existing tables: %s", len(added), ", ".join(added))
+    if indexes:
+        logger.info("Created %d indexes: %s", len(indexes), ", ".join(indexes))
+    if widened:
+        logger.info("Widened %d columns: %s", len(widened), ", ".join(widened))
@@ -0,0 +1,198 @@
+"""
+Mock OpenAI-compatible chat completions server for local benchmarks.
+
+    python mock_llm_server.py --port 9000 --latency lognormal:0.4,0.5 \
+        --error-rate 0.01 --rate-limit-rate 0.02 --seed 1
+
+Then point the backend at it:
+
+    UNBOUND_API_URL=http://127.0.0.1:9000/v1/chat/completions UNBOUND_API_KEY=mock
+
+Replies are deterministic: the same model and prompt always produce the
+same text. Latency, failures and 429s are drawn from a seeded generator.
+Every option can also be set through the MOCK_LLM_* environment variable
+named after it (e.g. MOCK_LLM_ERROR_RATE).
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import threading
+from collections import Counter
+from dataclasses import dataclass
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from tokens import estimate_tokens
+
+WORDS = (
+    "alpha", "bravo", "charlie", "delta", "echo", "foxtrot", "golf", "hotel",
+    "india", "juliet", "kilo", "lima", "mike", "november", "oscar", "papa",
+)
+
+
+def parse_latency(spec: str):
+    """
+    Build a sampler from a latency spec, in seconds:
+    fixed:S, uniform:LOW,HIGH, normal:MEAN,SD, lognormal:MEDIAN,SIGMA or exp:MEAN.
+    """
+    kind, _, args = spec.partition(":")
+    try:
+        values = [float(v) for v in args.split(",")] if args else []
+        if kind == "fixed":
+            (seconds,) = values
+            return lambda rng: seconds
+        if kind == "uniform":
+            low, high = values
+            return lambda rng: rng.uniform(low, high)
+        if kind == "normal":
+            mean, sd = values
+            return lambda rng: max(0.0, rng.gauss(mean, sd))
+        if kind == "lognormal":
+            median, sigma = values
+            return lambda rng: rng.lognormvariate(0, sigma) * median
+        if kind == "exp":
+            (mean,) = values
+            return lambda rng: rng.expovariate(1 / mean)
+    except ValueError:
+        pass
+    raise ValueError(f"Invalid latency spec: {spec!r}")
+
+
+@dataclass
+class MockConfig:
+    latency: str = "fixed:0.2"
+    error_rate: float = 0.0
+    rate_limit_rate: float = 0.0
+    retry_after: float = 1.0
+    reply_words: int = 30
+    chunk_delay: float = 0.01
+    seed: int | None = None
+
+
+def deterministic_reply(model: str, prompt: str, words: int) -> str:
+    """A reply that depends only on the model and the prompt."""
+    digest = hashlib.sha256(f"{model}\n{prompt}".encode()).digest()
+    picked = [WORDS[digest[i % len(digest)] % len(WORDS)] for i in range(words)]
+    return f"MOCK {digest.hex()[:8]}: " + " ".join(picked)
+
+
+def create_app(config: MockConfig) -> FastAPI:
+    app = FastAPI()
+    rng = random.Random(config.seed)
+    rng_lock = threading.Lock()
+    sample_latency = parse_latency(config.latency)
+    counts: Counter[str] = Counter()
+
+    def draw() -> tuple[float, float]:
+        with rng_lock:
+            return sample_latency(rng), rng.random()
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        model = body.get("model", "mock")
+        prompt = body["messages"][-1]["content"]
+        latency, roll = draw()
+        counts["requests"] += 1
+
+        if roll < config.rate_limit_rate:
+            counts["429"] += 1
+            await asyncio.sleep(min(latency, 0.05))
+            return JSONResponse(
+                {"error": {"message": "Rate limit exceeded (mock)"}},
+                status_code=429,
+                headers={"Retry-After": str(config.retry_after)},
+            )
+        if roll < config.rate_limit_rate + config.error_rate:
+            counts["500"] += 1
+            await asyncio.sleep(latency)
+            return JSONResponse(
+                {"error": {"message": "Internal error (mock)"}}, status_code=500)
+
+        content = deterministic_reply(model, prompt, config.reply_words)
+        usage = {
+            "prompt_tokens": estimate_tokens(prompt),
+            "completion_tokens": estimate_tokens(content),
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        counts["200"] += 1
+
+        if not body.get("stream"):
+            await asyncio.sleep(latency)
+            return {
+                "id": "mock",
+                "object": "chat.completion",
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": "stop",
+                }],
+                "usage": usage,
+            }
+
+        async def events():
+            # Time to first token is the sampled latency; then one word per chunk.
+            await asyncio.sleep(latency)
+            pieces = content.split(" ")
+            for i, word in enumerate(pieces):
+                delta = word if i == 0 else " " + word
+                chunk = {"choices": [{"index": 0, "delta": {"content": delta}}]}
+                yield f"data: {json.dumps(chunk)}\n\n"
+                await asyncio.sleep(config.chunk_delay)
+            yield f"data: {json.dumps({'choices': [], 'usage': usage})}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.get("/stats")
+    def stats() -> dict:
+        return dict(counts)
+
+    return app
+
+
+def main() -> None:
+    defaults = MockConfig()
+
+    def env(name: str, default):
+        return os.getenv(f"MOCK_LLM_{name.upper()}", default)
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default=env("host", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(env("port", 9000)))
+    parser.add_argument("--latency", default=env("latency", defaults.latency))
+    parser.add_argument("--error-rate", type=float,
+                        default=float(env("error_rate", defaults.error_rate)))
+    parser.add_argument("--rate-limit-rate", type=float,
+                        default=float(env("rate_limit_rate", defaults.rate_limit_rate)))
+    parser.add_argument("--retry-after", type=float,
+                        default=float(env("retry_after", defaults.retry_after)))
+    parser.add_argument("--reply-words", type=int,
+                        default=int(env("reply_words", defaults.reply_words)))
+    parser.add_argument("--chunk-delay", type=float,
+                        default=float(env("chunk_delay", defaults.chunk_delay)))
+    parser.add_argument("--seed", type=int, default=env("seed", None))
+    args = parser.parse_args()
+
+    parse_latency(args.latency)
+    config = MockConfig(
+        latency=args.latency,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        retry_after=args.retry_after,
+        reply_words=args.reply_words,
+        chunk_delay=args.chunk_delay,
+        seed=int(args.seed) if args.seed is not None else None,
+    )
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,9 @@
 from datetime import datetime
 
-from sqlalchemy import Column, DateTime, ForeignKey, Integer, String, Text
+from sqlalchemy import (
+    BigInteger, Boolean, Column, DateTime, Float, ForeignKey, Index, Integer,
+    LargeBinary, String, Text,
+)
 from sqlalchemy.orm import relationship
 
 from database import Base
@@ -11,9 +14,14 @@ class Workflow(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(255), nullable=False)
+    # Bumped on every update; cached execution plans are keyed by it.
+    version = Column(Integer, nullable=False, default=1)
+    # Time budget of each run, in seconds; past it the run is TIMED_OUT.
+    deadline_seconds = Column(Float, nullable=True)
 
     steps = relationship("Step", back_populates="workflow")
     executions = relationship("Execution", back_populates="workflow")
+    batches = relationship("Batch", back_populates="workflow")
 
 
 class Step(Base):
@@ -26,6 +34,23 @@ class Step(Base):
     completion_criteria = Column(Text, nullable=True)
     retry_limit = Column(Integer, nullable=False, default=0)
     step_order = Column(Integer)   # ⭐ THIS MUST EXIST
+    cache = Column(Boolean, nullable=False, default=False)
+    depends_on = Column(Text, nullable=True)  # JSON list of step_order values
+    hedge = Column(Boolean, nullable=False, default=False)
+    hedge_model = Column(String(255), nullable=True)
+    # Share identical in-flight LLM calls; off for steps needing independent samples.
+    coalesce = Column(Boolean, nullable=False, default=True)
+    # "prompt", or "map" to run the prompt over each item of the parent's output.
+    kind = Column(String(20), nullable=False, default="prompt")
+    split = Column(String(20), nullable=True)  # lines, json or delimiter
+    split_delimiter = Column(String(100), nullable=True)
+    chunk_size = Column(Integer, nullable=True)  # items per LLM call
+    map_concurrency = Column(Integer, nullable=True)
+    deadline_seconds = Column(Float, nullable=True)  # all attempts of the step
+    # How earlier outputs go into the prompt; see context.py.
+    context = Column(Text, nullable=True)
+    context_steps = Column(Text, nullable=True)  # JSON list of step_order values
+    context_max_tokens = Column(Integer, nullable=True)
     workflow = relationship("Workflow", back_populates="steps")
 
 
@@ -36,9 +61,44 @@ class Execution(Base):
     workflow_id = Column(Integer, ForeignKey("workflows.id"), nullable=False)
     status = Column(String(20), nullable=False, default="RUNNING")
     created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+    error_message = Column(Text, nullable=True)  # why it failed, timed out or was cancelled
+    batch_id = Column(Integer, ForeignKey("batches.id"), nullable=True)
+    inputs = Column(Text, nullable=True)  # JSON object of prompt variables
+    cassette_mode = Column(String(20), nullable=True)  # record, replay, replay_timed
+    cassette_path = Column(String(500), nullable=True)
+    # Database queue: set when handed to workers, and the current lease.
+    enqueued_at = Column(DateTime, nullable=True)
+    lease_owner = Column(String(255), nullable=True)
+    lease_expires_at = Column(DateTime, nullable=True)
 
     workflow = relationship("Workflow", back_populates="executions")
     step_logs = relationship("ExecutionStepLog", back_populates="execution")
+    batch = relationship("Batch", back_populates="executions")
+
+    __table_args__ = (
+        Index("ix_executions_batch_status", "batch_id", "status", "id"),
+        Index("ix_executions_created", "created_at", "id"),
+        Index("ix_executions_workflow_created",
+              "workflow_id", "created_at", "id"),
+        Index("ix_executions_status_created", "status", "created_at", "id"),
+        Index("ix_executions_status_enqueued", "status", "enqueued_at", "id"),
+    )
+
+
+class Batch(Base):
+    __tablename__ = "batches"
+
+    id = Column(Integer, primary_key=True, index=True)
+    workflow_id = Column(Integer, ForeignKey("workflows.id"), nullable=False)
+    status = Column(String(20), nullable=False, default="QUEUED")
+    total = Column(Integer, nullable=False, default=0)
+    concurrency = Column(Integer, nullable=False, default=1)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+
+    workflow = relationship("Workflow", back_populates="batches")
+    executions = relationship("Execution", back_populates="batch")
 
 
 class ExecutionStepLog(Base):
@@ -46,9 +106,113 @@ class ExecutionStepLog(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     execution_id = Column(Integer, ForeignKey("executions.id"), nullable=False)
+    step_id = Column(Integer, ForeignKey("steps.id"), nullable=True)
     step_order = Column(Integer, nullable=False)
+    # Items of a map step are logged as children of the step's log.
+    parent_log_id = Column(
+        Integer, ForeignKey("execution_step_logs.id"), nullable=True, index=True)
+    item_index = Column(Integer, nullable=True)
     status = Column(String(20), nullable=False, default="RUNNING")
+    # Partial output while the step runs; finished outputs live in output_blobs.
     output = Column(Text, nullable=True)
+    output_hash = Column(String(64), ForeignKey("output_blobs.hash"), nullable=True)
+    output_size = Column(Integer, nullable=True)  # bytes, UTF-8
     retry_count = Column(Integer, nullable=False, default=0)
+    llm_retries = Column(Integer, nullable=False, default=0)
+    breaker_state = Column(String(20), nullable=True)
+    hedge_winner = Column(String(20), nullable=True)  # "primary" or "hedge"
+    # Estimated tokens of the assembled prompt, and saved by context assembly.
+    prompt_tokens_estimate = Column(Integer, nullable=True)
+    context_tokens_saved = Column(Integer, nullable=True)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
 
     execution = relationship("Execution", back_populates="step_logs")
+    output_blob = relationship("OutputBlob")
+    attempts = relationship(
+        "ExecutionStepAttempt", back_populates="step_log",
+        order_by="ExecutionStepAttempt.id")
+
+    __table_args__ = (
+        Index("ix_step_logs_execution_order", "execution_id", "step_order"),
+    )
+
+
+class ExecutionStepAttempt(Base):
+    """Timing of one attempt at a step; durations are in seconds."""
+
+    __tablename__ = "execution_step_attempts"
+
+    id = Column(Integer, primary_key=True, index=True)
+    step_log_id = Column(
+        Integer, ForeignKey("execution_step_logs.id"), nullable=False, index=True)
+    attempt = Column(Integer, nullable=False)
+    status = Column(String(20), nullable=False)  # COMPLETED, CRITERIA_FAILED, ERROR
+    error = Column(Text, nullable=True)
+    model = Column(String(255), nullable=True)
+    started_at = Column(DateTime, nullable=False)
+    duration = Column(Float, nullable=False)
+    llm_seconds = Column(Float, nullable=True)
+    queue_wait = Column(Float, nullable=True)
+    llm_retries = Column(Integer, nullable=False, default=0)
+    prompt_tokens = Column(Integer, nullable=True)
+    completion_tokens = Column(Integer, nullable=True)
+
+    step_log = relationship("ExecutionStepLog", back_populates="attempts")
+
+
+class ArchivedExecution(Base):
+    """Where an execution removed by retention was archived."""
+
+    __tablename__ = "archived_executions"
+
+    execution_id = Column(Integer, primary_key=True)
+    workflow_id = Column(Integer, nullable=False, index=True)
+    status = Column(String(20), nullable=False)
+    created_at = Column(DateTime, nullable=False)
+    archived_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    path = Column(String(500), nullable=False)
+    offset = Column(BigInteger, nullable=False)  # start of its gzip member
+
+
+class OutputBlob(Base):
+    """A step output, zlib-compressed and keyed by the SHA-256 of its text."""
+
+    __tablename__ = "output_blobs"
+
+    hash = Column(String(64), primary_key=True)
+    size = Column(Integer, nullable=False)
+    data = Column(LargeBinary, nullable=False)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+
+class LLMCacheEntry(Base):
+    __tablename__ = "llm_cache"
+
+    key = Column(String(64), primary_key=True)
+    model = Column(String(255), nullable=False)
+    response = Column(Text, nullable=False)
+    created_at = Column(DateTime, nullable=False,
+                        default=datetime.utcnow, index=True)
+
+
+class RateLimitState(Base):
+    __tablename__ = "rate_limit_state"
+
+    model = Column(String(255), primary_key=True)
+    requests_left = Column(Float, nullable=False, default=0.0)
+    tokens_left = Column(Float, nullable=False, default=0.0)
+    in_flight = Column(Integer, nullable=False, default=0)  # live rate_limit_slots rows
+    updated_at = Column(Float, nullable=False)  # unix time, shared by processes
+
+
+class RateLimitSlot(Base):
+    """One call holding an in-flight slot, until released or expired."""
+
+    __tablename__ = "rate_limit_slots"
+    # Ids are never reused, so a late release cannot free another call's slot.
+    __table_args__ = {"sqlite_autoincrement": True}
+
+    id = Column(Integer, primary_key=True)
+    model = Column(String(255), nullable=False, index=True)
+    expires_at = Column(Float, nullable=False)  # unix time
@@ -0,0 +1,291 @@
+"""
+Logging, tracing spans and Prometheus metrics.
+
+Metrics live in a small in-process registry rendered in the Prometheus
+text format by GET /metrics, so no client library is needed. Spans time
+a block of work, feed the `workflow_span_duration_seconds` histogram and
+are logged at DEBUG on the "workflow.trace" logger with their trace and
+parent ids.
+"""
+
+import contextvars
+import logging
+import math
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+trace_log = logging.getLogger("workflow.trace")
+
+
+def configure_logging() -> None:
+    """Set up leveled logging from LOG_LEVEL (default INFO)."""
+    logging.basicConfig(
+        level=os.getenv("LOG_LEVEL", "INFO").upper(),
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+    )
+
+
+def _label_key(names: tuple[str, ...], labels: dict) -> tuple[str, ...]:
+    if set(labels) != set(names):
+        raise ValueError(f"Expected labels {names}, got {tuple(labels)}")
+    return tuple(str(labels[name]) for name in names)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self._lock = threading.Lock()
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> list[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, help_text, labels=()):
+        super().__init__(name, help_text, labels)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = _label_key(self.labels, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self) -> list[str]:
+        with self._lock:
+            values = dict(self._values)
+        return [
+            f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"
+            for key, value in sorted(values.items())
+        ]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets) + (math.inf,)
+        self._values: dict[tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = _label_key(self.labels, labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def _samples(self) -> list[str]:
+        with self._lock:
+            values = {key: (list(counts), total, count)
+                      for key, (counts, total, count) in self._values.items()}
+        lines = []
+        for key, (counts, total, count) in sorted(values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: list[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+LLM_REQUEST_SECONDS = registry.register(Histogram(
+    "llm_request_duration_seconds",
+    "Duration of LLM HTTP calls, by model and outcome.",
+    ("model", "outcome"),
+))
+LLM_RETRIES = registry.register(Counter(
+    "llm_retries_total", "Transport-level LLM retries, by model.", ("model",)))
+LLM_COALESCED = registry.register(Counter(
+    "llm_coalesced_calls_total",
+    "LLM calls that shared an identical request already in flight, by model.",
+    ("model",),
+))
+LLM_QUEUE_WAIT_SECONDS = registry.register(Histogram(
+    "llm_rate_limit_wait_seconds",
+    "Time LLM calls queued for rate-limit capacity, by model.",
+    ("model",),
+))
+LLM_TOKENS = registry.register(Counter(
+    "llm_tokens_total",
+    "Tokens reported in LLM response usage blocks, by model and kind.",
+    ("model", "kind"),
+))
+STEP_ATTEMPTS = registry.register(Counter(
+    "workflow_step_attempts_total",
+    "Step attempts, by outcome (completed, criteria_failed, error).",
+    ("outcome",),
+))
+CRITERIA_CHECKS = registry.register(Counter(
+    "workflow_criteria_checks_total",
+    "Completion criteria checks, by result (pass or fail).",
+    ("result",),
+))
+CONTEXT_TOKENS = registry.register(Counter(
+    "workflow_context_tokens_total",
+    "Estimated prompt tokens after context assembly (sent), and removed by it (saved).",
+    ("kind",),
+))
+EXECUTIONS_IN_FLIGHT = registry.register(Gauge(
+    "workflow_executions_in_flight", "Executions currently running."))
+EXECUTION_SECONDS = registry.register(Histogram(
+    "workflow_execution_duration_seconds",
+    "Duration of executions, by final status.",
+    ("status",),
+))
+SPAN_SECONDS = registry.register(Histogram(
+    "workflow_span_duration_seconds", "Duration of traced spans, by name.", ("span",)))
+DB_COMMIT_SECONDS = registry.register(Histogram(
+    "db_commit_duration_seconds",
+    "Duration of database commits.",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5),
+))
+
+
+@dataclass
+class Span:
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: str | None
+    attributes: dict = field(default_factory=dict)
+    start: float = 0.0
+    duration: float = 0.0
+
+
+_current_span: contextvars.ContextVar[Span | None] = contextvars.ContextVar(
+    "current_span", default=None)
+
+
+def _start_span(name: str, attributes: dict) -> Span:
+    parent = _current_span.get()
+    return Span(
+        name=name,
+        trace_id=parent.trace_id if parent else uuid.uuid4().hex,
+        span_id=uuid.uuid4().hex[:16],
+        parent_id=parent.span_id if parent else None,
+        attributes=attributes,
+        start=time.perf_counter(),
+    )
+
+
+def _finish_span(current: Span) -> None:
+    current.duration = time.perf_counter() - current.start
+    SPAN_SECONDS.observe(current.duration, span=current.name)
+    if trace_log.isEnabledFor(logging.DEBUG):
+        trace_log.debug(
+            "span=%s trace=%s id=%s parent=%s duration_ms=%.1f %s",
+            current.name, current.trace_id, current.span_id, current.parent_id,
+            current.duration * 1000,
+            " ".join(f"{k}={v}" for k, v in current.attributes.items()),
+        )
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    Time a block of work as a child of the current span. The span is
+    yielded so callers can add attributes; an exception marks it as an
+    error and propagates.
+    """
+    current = _start_span(name, attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.attributes["error"] = type(e).__name__
+        raise
+    finally:
+        _current_span.reset(token)
+        _finish_span(current)
+
+
+def current_span() -> Span | None:
+    return _current_span.get()
+
+
+def instrument_sessions() -> None:
+    """Trace every ORM commit as a db.commit span and time it."""
+    if getattr(instrument_sessions, "done", False):
+        return
+    instrument_sessions.done = True
+
+    @event.listens_for(Session, "before_commit")
+    def _before_commit(session):
+        session.info["commit_span"] = _start_span("db.commit", {})
+
+    @event.listens_for(Session, "after_commit")
+    def _after_commit(session):
+        current = session.info.pop("commit_span", None)
+        if current is not None:
+            _finish_span(current)
+            DB_COMMIT_SECONDS.observe(current.duration)
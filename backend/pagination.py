@@ -0,0 +1,52 @@
+"""Keyset (cursor) pagination helpers for execution history."""
+
+import base64
+import json
+from datetime import datetime
+
+from sqlalchemy import tuple_
+
+from models import Execution
+
+
+def encode_cursor(created_at: datetime, execution_id: int) -> str:
+    raw = json.dumps([created_at.isoformat(), execution_id])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    """Inverse of encode_cursor; raises ValueError on a malformed cursor."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, execution_id = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(created_at), int(execution_id)
+    except (TypeError, ValueError) as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def execution_filters(
+    status: str | None = None,
+    workflow_id: int | None = None,
+    created_after: datetime | None = None,
+    created_before: datetime | None = None,
+) -> list:
+    """
+    SQL conditions for the history filters. Each combination is served by
+    one of the (filter column, created_at, id) indexes on executions.
+    """
+    conditions = []
+    if status is not None:
+        conditions.append(Execution.status == status)
+    if workflow_id is not None:
+        conditions.append(Execution.workflow_id == workflow_id)
+    if created_after is not None:
+        conditions.append(Execution.created_at >= created_after)
+    if created_before is not None:
+        conditions.append(Execution.created_at < created_before)
+    return conditions
+
+
+def after_cursor(cursor: str):
+    """Condition selecting rows that sort after the cursor (newest first)."""
+    created_at, execution_id = decode_cursor(cursor)
+    return tuple_(Execution.created_at, Execution.id) < (created_at, execution_id)
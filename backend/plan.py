@@ -0,0 +1,193 @@
+"""
+Compiled, immutable execution plans for workflows.
+
+A plan holds a workflow's steps in run order with their criteria and
+prompt templates already compiled, and the dependency graph resolved.
+Plans are cached per workflow id and version: updating a workflow bumps
+its version, so processes that still hold the old plan miss on their
+next lookup, and `invalidate_plan` drops it right away in this one.
+"""
+
+import json
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+from context import ContextPolicy, resolve_context_steps
+from criteria import Criterion, compile_criteria
+from fanout import check_map_steps
+from graph import resolve_dependencies, topological_order
+from models import Step, Workflow
+from templating import PromptTemplate
+
+PLAN_CACHE_SIZE = int(os.getenv("PLAN_CACHE_SIZE", "256"))
+
+
+@dataclass(frozen=True)
+class StepSpec:
+    """
+    Detached copy of a Step. Step tasks read these instead of ORM
+    instances, which the runner's session may expire at any commit.
+    """
+
+    id: int
+    step_order: int
+    model: str
+    prompt: str
+    completion_criteria: str | None
+    retry_limit: int
+    cache: bool
+    depends_on: tuple[int, ...] | None
+    hedge: bool = False
+    hedge_model: str | None = None
+    coalesce: bool = True
+    kind: str = "prompt"
+    split: str | None = None
+    split_delimiter: str | None = None
+    chunk_size: int | None = None
+    map_concurrency: int | None = None
+    deadline_seconds: float | None = None
+    context: str | None = None
+    context_steps: tuple[int, ...] | None = None
+    context_max_tokens: int | None = None
+    criterion: Criterion = field(default=None, compare=False, repr=False)
+    template: PromptTemplate = field(default=None, compare=False, repr=False)
+    context_policy: ContextPolicy = field(default=None, compare=False, repr=False)
+
+    def __post_init__(self):
+        if self.criterion is None:
+            object.__setattr__(self, "criterion", compile_criteria(self.completion_criteria))
+        if self.template is None:
+            object.__setattr__(self, "template", PromptTemplate(self.prompt))
+        if self.context_policy is None:
+            object.__setattr__(self, "context_policy",
+                               ContextPolicy(self.context, self.context_max_tokens))
+
+    @classmethod
+    def from_step(cls, step: Step) -> "StepSpec":
+        depends_on = json.loads(step.depends_on) if step.depends_on else None
+        context_steps = json.loads(step.context_steps) if step.context_steps else None
+        return cls(
+            id=step.id,
+            step_order=step.step_order if step.step_order is not None else step.id,
+            model=step.model,
+            prompt=step.prompt,
+            completion_criteria=step.completion_criteria,
+            retry_limit=step.retry_limit,
+            cache=bool(step.cache),
+            depends_on=tuple(depends_on) if depends_on is not None else None,
+            hedge=bool(step.hedge),
+            hedge_model=step.hedge_model,
+            coalesce=step.coalesce is not False,
+            kind=step.kind or "prompt",
+            split=step.split,
+            split_delimiter=step.split_delimiter,
+            chunk_size=step.chunk_size,
+            map_concurrency=step.map_concurrency,
+            deadline_seconds=step.deadline_seconds,
+            context=step.context,
+            context_steps=tuple(context_steps) if context_steps is not None else None,
+            context_max_tokens=step.context_max_tokens,
+        )
+
+
+@dataclass(frozen=True)
+class ExecutionPlan:
+    """
+    Steps sorted by step_order, and for each the positions of its parents
+    and of the steps whose outputs make up its context, plus the
+    workflow's per-run deadline. A workflow whose steps or dependencies do not compile still gets a
+    plan, with no steps and `error` set, so its runs fail with that error.
+    """
+
+    workflow_id: int
+    version: int
+    steps: tuple[StepSpec, ...]
+    parents: tuple[tuple[int, ...], ...]
+    error: str | None = None
+    deadline_seconds: float | None = None
+    context_sources: tuple[tuple[int, ...], ...] = ()
+
+    @classmethod
+    def compile(
+        cls, workflow_id: int, version: int, steps: list[Step],
+        deadline_seconds: float | None = None,
+    ) -> "ExecutionPlan":
+        try:
+            specs = tuple(sorted(
+                (StepSpec.from_step(s) for s in steps), key=lambda s: s.step_order))
+            parents = resolve_dependencies(
+                [s.step_order for s in specs], [s.depends_on for s in specs])
+            topological_order(parents)
+            check_map_steps(
+                [s.step_order for s in specs], [s.kind for s in specs], parents)
+            sources = resolve_context_steps(
+                [s.step_order for s in specs], [s.kind for s in specs],
+                [s.context_steps for s in specs], parents)
+        except ValueError as e:
+            return cls(workflow_id, version, (), (), error=str(e))
+        return cls(workflow_id, version, specs, tuple(tuple(p) for p in parents),
+                   deadline_seconds=deadline_seconds,
+                   context_sources=tuple(tuple(s) for s in sources))
+
+
+class PlanCache:
+    """Thread-safe LRU of compiled plans keyed by (workflow id, version)."""
+
+    def __init__(self, max_entries: int = PLAN_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._plans: OrderedDict[tuple[int, int], ExecutionPlan] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, workflow: Workflow) -> ExecutionPlan:
+        """
+        The plan for `workflow` at its current version. Only a miss touches
+        `workflow.steps`, loading them if they were not eagerly loaded.
+        """
+        key = (workflow.id, workflow.version or 1)
+        with self._lock:
+            plan = self._plans.get(key)
+            if plan is not None:
+                self._plans.move_to_end(key)
+                self.hits += 1
+                return plan
+            self.misses += 1
+
+        plan = ExecutionPlan.compile(*key, workflow.steps, workflow.deadline_seconds)
+        with self._lock:
+            # Older versions of the workflow can never be asked for again.
+            for stale in [k for k in self._plans if k[0] == key[0] and k[1] < key[1]]:
+                del self._plans[stale]
+            self._plans[key] = plan
+            self._plans.move_to_end(key)
+            while len(self._plans) > self.max_entries:
+                self._plans.popitem(last=False)
+        return plan
+
+    def invalidate(self, workflow_id: int) -> None:
+        with self._lock:
+            for key in [k for k in self._plans if k[0] == workflow_id]:
+                del self._plans[key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._plans),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+plans = PlanCache()
+
+
+def get_plan(workflow: Workflow) -> ExecutionPlan:
+    return plans.get(workflow)
+
+
+def invalidate_plan(workflow_id: int) -> None:
+    plans.invalidate(workflow_id)
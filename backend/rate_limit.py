@@ -0,0 +1,403 @@
+"""Per-model rate limits and in-flight caps for LLM calls."""
+
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+
+from sqlalchemy import case, delete, literal, update
+from sqlalchemy.exc import IntegrityError
+
+from database import SessionLocal
+from models import RateLimitSlot, RateLimitState
+from observability import LLM_QUEUE_WAIT_SECONDS
+from retry_policy import DeadlineExceeded
+
+# How often a queued caller re-checks a shared (database) bucket that
+# another process may have refilled.
+POLL_INTERVAL = 0.25
+# A shared in-flight slot not released within this many seconds (its
+# process died mid-call) is taken back.
+SLOT_TTL = float(os.getenv("LLM_RATE_LIMIT_SLOT_TTL", "600"))
+
+
+@dataclass(frozen=True)
+class ModelLimits:
+    """Requests/min, tokens/min and concurrent calls allowed for a model."""
+
+    rpm: float | None = None
+    tpm: float | None = None
+    max_in_flight: int | None = None
+
+    @property
+    def unlimited(self) -> bool:
+        return self.rpm is None and self.tpm is None and self.max_in_flight is None
+
+
+def limits_from_env() -> dict[str, ModelLimits]:
+    """
+    Parse LLM_RATE_LIMITS, a JSON object keyed by model name, e.g.
+    {"gpt-4o": {"rpm": 60, "tpm": 90000, "max_in_flight": 4}, "*": {...}}.
+    The "*" entry applies to models without their own entry.
+    """
+    raw = os.getenv("LLM_RATE_LIMITS")
+    if not raw:
+        return {}
+    return {
+        model: ModelLimits(
+            rpm=values.get("rpm"),
+            tpm=values.get("tpm"),
+            max_in_flight=values.get("max_in_flight"),
+        )
+        for model, values in json.loads(raw).items()
+    }
+
+
+class MemoryBackend:
+    """Token buckets held in this process only."""
+
+    blocking = False
+
+    def __init__(self):
+        self._state: dict[str, list[float]] = {}
+        self._lock = threading.Lock()
+
+    def try_acquire(
+        self, model: str, limits: ModelLimits, tokens: float
+    ) -> tuple[float, int | None]:
+        """
+        Take capacity and return (0, slot), or return (seconds until it may
+        fit, None). `slot` identifies the call to `release`.
+        """
+        now = time.monotonic()
+        with self._lock:
+            state = self._state.setdefault(
+                model, [limits.rpm or 0.0, limits.tpm or 0.0, 0, now])
+            requests_left, tokens_left, in_flight, updated = state
+            elapsed = now - updated
+            if limits.rpm is not None:
+                requests_left = min(limits.rpm, requests_left + elapsed * limits.rpm / 60)
+            if limits.tpm is not None:
+                tokens_left = min(limits.tpm, tokens_left + elapsed * limits.tpm / 60)
+            state[:] = [requests_left, tokens_left, in_flight, now]
+
+            wait = _wait_for(limits, requests_left, tokens_left, in_flight, tokens)
+            if wait == 0:
+                state[0] = requests_left - 1
+                state[1] = tokens_left - tokens
+                state[2] = in_flight + 1
+            return wait, None
+
+    def release(self, model: str, slot: int | None) -> None:
+        with self._lock:
+            state = self._state.get(model)
+            if state is not None:
+                state[2] = max(0, state[2] - 1)
+
+
+class DatabaseBackend:
+    """
+    Token buckets in the rate_limit_state table, shared by every worker
+    process using the same database. Each acquire is a single conditional
+    UPDATE that refills and debits the buckets only if the call fits, so
+    concurrent processes cannot overdraw a bucket.
+
+    Under a max_in_flight cap each admitted call also gets a row in
+    rate_limit_slots, expiring after SLOT_TTL, and `in_flight` counts
+    those rows. Releasing deletes the row; when the cap is full, expired
+    rows (left by a process that died mid-call) are deleted and their
+    count given back, so a crash cannot shrink the cap for good. Either
+    way the counter only goes down for rows actually deleted.
+    """
+
+    # Does database I/O, so the limiter calls it off the event loop.
+    blocking = True
+
+    def __init__(self, session_factory=SessionLocal):
+        self._session_factory = session_factory
+
+    def _ensure_row(self, db, model: str, limits: ModelLimits) -> None:
+        if db.get(RateLimitState, model) is not None:
+            return
+        db.add(RateLimitState(
+            model=model,
+            requests_left=limits.rpm or 0.0,
+            tokens_left=limits.tpm or 0.0,
+            in_flight=0,
+            updated_at=time.time(),
+        ))
+        try:
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+
+    @staticmethod
+    def _refilled(column, capacity: float, elapsed):
+        level = column + elapsed * (capacity / 60)
+        return case((level > capacity, literal(capacity)), else_=level)
+
+    def try_acquire(
+        self, model: str, limits: ModelLimits, tokens: float
+    ) -> tuple[float, int | None]:
+        now = time.time()
+        db = self._session_factory()
+        try:
+            self._ensure_row(db, model, limits)
+            elapsed = literal(now) - RateLimitState.updated_at
+            values = {RateLimitState.updated_at: now}
+            conditions = [RateLimitState.model == model]
+            if limits.rpm is not None:
+                level = self._refilled(RateLimitState.requests_left, limits.rpm, elapsed)
+                values[RateLimitState.requests_left] = level - 1
+                conditions.append(level >= 1)
+            if limits.tpm is not None:
+                level = self._refilled(RateLimitState.tokens_left, limits.tpm, elapsed)
+                values[RateLimitState.tokens_left] = level - tokens
+                conditions.append(level >= tokens)
+            if limits.max_in_flight is not None:
+                conditions.append(RateLimitState.in_flight < limits.max_in_flight)
+                values[RateLimitState.in_flight] = RateLimitState.in_flight + 1
+
+            result = db.execute(
+                update(RateLimitState).where(*conditions).values(values))
+            if result.rowcount == 1:
+                slot = None
+                if limits.max_in_flight is not None:
+                    row = RateLimitSlot(model=model, expires_at=now + SLOT_TTL)
+                    db.add(row)
+                    db.flush()
+                    slot = row.id
+                db.commit()
+                return 0.0, slot
+            db.commit()
+
+            state = db.get(RateLimitState, model)
+            db.refresh(state)
+            elapsed = max(0.0, now - state.updated_at)
+            requests_left = state.requests_left
+            tokens_left = state.tokens_left
+            if limits.rpm is not None:
+                requests_left = min(limits.rpm, requests_left + elapsed * limits.rpm / 60)
+            if limits.tpm is not None:
+                tokens_left = min(limits.tpm, tokens_left + elapsed * limits.tpm / 60)
+            in_flight = state.in_flight
+            if limits.max_in_flight is not None and in_flight >= limits.max_in_flight:
+                in_flight -= self._expire_slots(db, model, now)
+            wait = _wait_for(limits, requests_left, tokens_left, in_flight, tokens)
+            return max(wait, 0.001), None
+        finally:
+            db.close()
+
+    @staticmethod
+    def _give_back(db, model: str, count: int) -> None:
+        db.execute(
+            update(RateLimitState)
+            .where(RateLimitState.model == model)
+            .values(in_flight=case(
+                (RateLimitState.in_flight > count, RateLimitState.in_flight - count),
+                else_=0))
+        )
+
+    def _expire_slots(self, db, model: str, now: float) -> int:
+        """Delete `model`'s expired slots and give their capacity back."""
+        result = db.execute(
+            delete(RateLimitSlot)
+            .where(RateLimitSlot.model == model, RateLimitSlot.expires_at < now))
+        expired = result.rowcount
+        if expired:
+            self._give_back(db, model, expired)
+        db.commit()
+        return expired
+
+    def release(self, model: str, slot: int | None) -> None:
+        if slot is None:
+            return
+        db = self._session_factory()
+        try:
+            result = db.execute(delete(RateLimitSlot).where(RateLimitSlot.id == slot))
+            # Already expired and given back if nothing was deleted.
+            if result.rowcount == 1:
+                self._give_back(db, model, 1)
+            db.commit()
+        finally:
+            db.close()
+
+
+def _wait_for(
+    limits: ModelLimits,
+    requests_left: float,
+    tokens_left: float,
+    in_flight: int,
+    tokens: float,
+) -> float:
+    """Seconds until a call costing `tokens` fits; POLL_INTERVAL if capped."""
+    wait = 0.0
+    if limits.rpm is not None and requests_left < 1:
+        wait = max(wait, (1 - requests_left) * 60 / limits.rpm)
+    if limits.tpm is not None and tokens_left < tokens:
+        wait = max(wait, (tokens - tokens_left) * 60 / limits.tpm)
+    if limits.max_in_flight is not None and in_flight >= limits.max_in_flight:
+        wait = max(wait, POLL_INTERVAL)
+    return wait
+
+
+class Lease:
+    """Capacity held for one call; release it when the call ends."""
+
+    def __init__(
+        self,
+        limiter: "RateLimiter | None",
+        model: str,
+        waited: float,
+        slot: int | None = None,
+    ):
+        self._limiter = limiter
+        self.model = model
+        self.waited = waited
+        self.slot = slot
+
+    async def release(self) -> None:
+        if self._limiter is not None:
+            limiter, self._limiter = self._limiter, None
+            await limiter._backend_call(limiter._backend.release, self.model, self.slot)
+            await limiter._wake(self.model)
+
+
+class _ModelQueue:
+    def __init__(self):
+        self.tickets: deque[object] = deque()
+        self.cond = asyncio.Condition()
+        self.waits = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+
+class RateLimiter:
+    """
+    Admits LLM calls under each model's limits. Callers that do not fit
+    queue in arrival order: only the head of a model's queue competes for
+    capacity, so a large request is not starved by a stream of small ones.
+    Callers are coroutines on the engine loop; a blocking (database)
+    backend is called from a worker thread.
+    """
+
+    def __init__(self, limits: dict[str, ModelLimits], backend=None):
+        self.limits = limits
+        self._backend = backend or MemoryBackend()
+        self._queues: dict[str, _ModelQueue] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "RateLimiter":
+        backend = None
+        if os.getenv("LLM_RATE_LIMIT_BACKEND", "memory") == "database":
+            backend = DatabaseBackend()
+        return cls(limits_from_env(), backend)
+
+    def limits_for(self, model: str) -> ModelLimits:
+        return self.limits.get(model) or self.limits.get("*") or ModelLimits()
+
+    def _queue(self, model: str) -> _ModelQueue:
+        with self._lock:
+            queue = self._queues.get(model)
+            if queue is None:
+                queue = self._queues[model] = _ModelQueue()
+            return queue
+
+    async def _backend_call(self, fn, *args):
+        if self._backend.blocking:
+            return await asyncio.to_thread(fn, *args)
+        return fn(*args)
+
+    async def _try_acquire(
+        self, model: str, limits: ModelLimits, tokens: float
+    ) -> tuple[float, int | None]:
+        if not self._backend.blocking:
+            return self._backend.try_acquire(model, limits, tokens)
+        attempt = asyncio.ensure_future(
+            asyncio.to_thread(self._backend.try_acquire, model, limits, tokens))
+        try:
+            return await asyncio.shield(attempt)
+        except asyncio.CancelledError:
+            # The thread runs on; give back whatever it takes for us.
+            attempt.add_done_callback(lambda _: self._abandon(model, attempt))
+            raise
+
+    def _abandon(self, model: str, attempt: asyncio.Future) -> None:
+        if attempt.cancelled() or attempt.exception() is not None:
+            return
+        wait, slot = attempt.result()
+        if wait == 0:
+            asyncio.get_running_loop().run_in_executor(
+                None, self._backend.release, model, slot)
+
+    async def _wake(self, model: str) -> None:
+        queue = self._queue(model)
+        async with queue.cond:
+            queue.cond.notify_all()
+
+    async def acquire(self, model: str, tokens: int, deadline=None) -> Lease:
+        """
+        Wait until the call fits, then return its Lease. Raises
+        DeadlineExceeded if `deadline` runs out while queued.
+        """
+        limits = self.limits_for(model)
+        if limits.unlimited:
+            return Lease(None, model, 0.0)
+        if limits.tpm is not None:
+            # A request larger than the bucket could never fit otherwise.
+            tokens = min(tokens, limits.tpm)
+
+        queue = self._queue(model)
+        ticket = object()
+        start = time.monotonic()
+        async with queue.cond:
+            queue.tickets.append(ticket)
+            try:
+                while True:
+                    if queue.tickets[0] is ticket:
+                        wait, slot = await self._try_acquire(model, limits, tokens)
+                        if wait == 0:
+                            break
+                    else:
+                        wait = POLL_INTERVAL
+                    remaining = deadline.remaining() if deadline else None
+                    if remaining is not None and remaining <= 0:
+                        raise DeadlineExceeded(
+                            f"Step deadline exceeded waiting for {model} rate limit")
+                    wait = min(wait, POLL_INTERVAL)
+                    if remaining is not None:
+                        wait = min(wait, remaining)
+                    try:
+                        await asyncio.wait_for(queue.cond.wait(), wait)
+                    except asyncio.TimeoutError:
+                        pass
+            finally:
+                queue.tickets.remove(ticket)
+                queue.cond.notify_all()
+
+            waited = time.monotonic() - start
+            queue.waits += 1
+            queue.total_wait += waited
+            queue.max_wait = max(queue.max_wait, waited)
+        LLM_QUEUE_WAIT_SECONDS.observe(waited, model=model)
+        return Lease(self, model, waited, slot)
+
+    def stats(self) -> dict[str, dict]:
+        with self._lock:
+            queues = dict(self._queues)
+        stats = {}
+        # Read from another thread without the loop's lock: a snapshot
+        # that may be a call or two behind.
+        for model, queue in queues.items():
+            stats[model] = {
+                "queued": len(queue.tickets),
+                "admitted": queue.waits,
+                "total_queue_wait": queue.total_wait,
+                "avg_queue_wait": queue.total_wait / queue.waits if queue.waits else 0.0,
+                "max_queue_wait": queue.max_wait,
+            }
+        return stats
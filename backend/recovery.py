@@ -0,0 +1,185 @@
+"""
+Resuming failed executions and recovering ones interrupted by a restart.
+
+At startup, executions whose runner is gone are requeued. One that was
+still leased by the previous process, because the restart came within
+LEASE_SECONDS of its last heartbeat, is picked up later by the reclaimer:
+in local mode it checks every LEASE_RECLAIM_INTERVAL seconds for
+unfinished executions whose lease has run out and requeues them. (With
+the database queue, workers claim those themselves.)
+"""
+
+import logging
+import os
+import threading
+from datetime import datetime
+
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from batch import start_batch
+from database import SessionLocal
+from executor import EXECUTION_QUEUE, QueueFullError, get_pool
+from leases import LEASE_SECONDS, claimable
+from models import Batch, Execution
+
+logger = logging.getLogger(__name__)
+
+RESUMABLE_STATUSES = ("FAILED", "CANCELLED", "TIMED_OUT")
+INTERRUPTED_STATUSES = ("QUEUED", "RUNNING")
+RESUME_ON_STARTUP = os.getenv("RESUME_ON_STARTUP", "1").lower() in ("1", "true", "yes")
+RECLAIM_INTERVAL = float(os.getenv("LEASE_RECLAIM_INTERVAL", str(LEASE_SECONDS)))
+
+
+def resume_execution(execution: Execution, session: Session) -> None:
+    """
+    Re-queue a stopped execution on the background pool. The runner skips
+    steps that already completed and restores their outputs as context.
+    Raises QueueFullError, leaving the execution as it was, if the pool is
+    full.
+    """
+    status, finished_at = execution.status, execution.finished_at
+    execution.status = "QUEUED"
+    execution.finished_at = None
+    session.commit()
+    try:
+        get_pool().submit(execution.id)
+    except QueueFullError:
+        execution.status = status
+        execution.finished_at = finished_at
+        session.commit()
+        raise
+
+
+def recover_interrupted() -> None:
+    """
+    Requeue work left behind by a crash or restart. Executions that are
+    QUEUED or RUNNING but hold no live lease lost their runner, so they
+    go back on the pool (and resume from their last completed step);
+    unfinished batches get a fresh dispatcher, which picks up their
+    queued executions.
+
+    Executions leased by a live process are left alone, so restarting one
+    of several processes sharing the database does not run them twice, and
+    ones already in the database queue are left to its workers.
+    Batch dispatchers are not leased, though: with several API processes,
+    each restart starts another dispatcher for unfinished batches, which
+    only raises their effective concurrency.
+    """
+    now = datetime.utcnow()
+    db = SessionLocal()
+    try:
+        db.query(Execution).filter(
+            Execution.status == "RUNNING", claimable(now),
+        ).update({Execution.status: "QUEUED"}, synchronize_session=False)
+        db.commit()
+
+        batches = [
+            (batch.id, batch.concurrency)
+            for batch in db.query(Batch).filter(
+                Batch.status.in_(INTERRUPTED_STATUSES))
+        ]
+        execution_ids = [
+            row.id
+            for row in db.query(Execution.id)
+            .filter(Execution.status == "QUEUED", Execution.batch_id.is_(None),
+                    Execution.enqueued_at.is_(None), claimable(now))
+            .order_by(Execution.id)
+        ]
+    finally:
+        db.close()
+
+    for batch_id, concurrency in batches:
+        start_batch(batch_id, concurrency)
+
+    if not execution_ids:
+        return
+    logger.info("Recovering %d interrupted executions", len(execution_ids))
+
+    def submit_all() -> None:
+        pool = get_pool()
+        for execution_id in execution_ids:
+            pool.submit(execution_id, block=True)
+
+    threading.Thread(target=submit_all, name="recovery", daemon=True).start()
+
+
+def reclaim_expired() -> list[int]:
+    """
+    Requeue locally run executions whose lease ran out before they
+    finished, which means their process died, and submit them to the pool.
+    Each is switched to QUEUED with a compare-and-set UPDATE, so of
+    several processes sharing the database only one takes it.
+    """
+    now = datetime.utcnow()
+    db = SessionLocal()
+    try:
+        candidates = [
+            row.id
+            for row in db.query(Execution.id)
+            .filter(Execution.status.in_(INTERRUPTED_STATUSES),
+                    Execution.enqueued_at.is_(None), Execution.lease_expires_at < now)
+            .order_by(Execution.id)
+        ]
+        reclaimed = []
+        for execution_id in candidates:
+            result = db.execute(
+                update(Execution)
+                .where(Execution.id == execution_id,
+                       Execution.status.in_(INTERRUPTED_STATUSES),
+                       Execution.lease_expires_at < now)
+                .values(status="QUEUED", lease_owner=None, lease_expires_at=None)
+            )
+            if result.rowcount == 1:
+                reclaimed.append(execution_id)
+        db.commit()
+    finally:
+        db.close()
+
+    if reclaimed:
+        logger.warning("Reclaiming %d executions whose lease expired: %s",
+                       len(reclaimed), reclaimed)
+        pool = get_pool()
+        for execution_id in reclaimed:
+            pool.submit(execution_id, block=True)
+    return reclaimed
+
+
+class Reclaimer:
+    """Runs `reclaim_expired` every `interval` seconds."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.reclaimed = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="lease-reclaim", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.reclaimed += len(reclaim_expired())
+            except Exception:
+                logger.exception("Reclaiming expired executions failed")
+
+
+_reclaimer: Reclaimer | None = None
+
+
+def start_reclaimer() -> Reclaimer | None:
+    """Start periodic reclaiming in local mode."""
+    global _reclaimer
+    if EXECUTION_QUEUE == "local" and RECLAIM_INTERVAL > 0 and _reclaimer is None:
+        _reclaimer = Reclaimer(RECLAIM_INTERVAL)
+        _reclaimer.start()
+    return _reclaimer
+
+
+def stop_reclaimer() -> None:
+    if _reclaimer is not None:
+        _reclaimer.stop()
@@ -0,0 +1,432 @@
+"""
+Retention: archive and remove old executions.
+
+    python retention.py               # one pass with the policy from the environment
+    python retention.py --dry-run     # only count what would be archived
+    python retention.py --vacuum      # also run a full VACUUM (SQLite, blocks writers)
+
+An execution expires once it is older than RETENTION_DAYS, or
+RETENTION_FAILED_DAYS if it failed, unless it is among the newest
+RETENTION_KEEP_LAST finished executions of its workflow. Executions that
+are still queued or running, or belong to an unfinished batch, are kept.
+
+Expired executions are written with their step logs, attempts and outputs
+to append-only gzip NDJSON files, one per day of creation, and then
+deleted, RETENTION_BATCH_SIZE at a time with a short pause in between so
+live writers are not starved. Each pass ends with an incremental vacuum
+and a WAL checkpoint on SQLite. `archived_executions` records where each
+execution went, which is how `read_archived` finds it again.
+
+Setting RETENTION_INTERVAL (seconds) runs a pass periodically in the API
+process.
+"""
+
+import argparse
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+import zlib
+from collections import defaultdict
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, delete, exists, func, or_, select
+from sqlalchemy.orm import joinedload, selectinload
+
+from blobs import log_output
+from database import SessionLocal, engine
+from models import (
+    ArchivedExecution, Batch, Execution, ExecutionStepAttempt, ExecutionStepLog,
+    OutputBlob,
+)
+from observability import configure_logging
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "archive")
+RETENTION_INTERVAL = float(os.getenv("RETENTION_INTERVAL", "0"))
+# Pause between batches, and pages freed per incremental vacuum.
+BATCH_PAUSE = float(os.getenv("RETENTION_BATCH_PAUSE", "0.1"))
+VACUUM_PAGES = int(os.getenv("RETENTION_VACUUM_PAGES", "2000"))
+
+TERMINAL_STATUSES = ("SUCCESS", "FAILED", "CANCELLED", "TIMED_OUT")
+FINISHED_BATCH_STATUSES = ("COMPLETED", "FAILED")
+
+
+@dataclass(frozen=True)
+class RetentionPolicy:
+    keep_days: float = 30.0
+    keep_failed_days: float = 90.0
+    keep_last: int = 10
+    batch_size: int = 200
+
+    @classmethod
+    def from_env(cls) -> "RetentionPolicy":
+        return cls(
+            keep_days=float(os.getenv("RETENTION_DAYS", "30")),
+            keep_failed_days=float(os.getenv("RETENTION_FAILED_DAYS", "90")),
+            keep_last=int(os.getenv("RETENTION_KEEP_LAST", "10")),
+            batch_size=int(os.getenv("RETENTION_BATCH_SIZE", "200")),
+        )
+
+
+def archive_path(day) -> str:
+    return os.path.join(ARCHIVE_DIR, f"executions-{day.isoformat()}.ndjson.gz")
+
+
+def still_expired(policy: RetentionPolicy, now: datetime) -> list:
+    """
+    Conditions an execution must still meet to be archived: finished and
+    past its age limit. Re-checked when archiving, since one may have been
+    resumed after `expired_ids` picked it.
+    """
+    cutoff = now - timedelta(days=policy.keep_days)
+    failed_cutoff = now - timedelta(days=policy.keep_failed_days)
+    return [
+        Execution.status.in_(TERMINAL_STATUSES),
+        or_(
+            and_(Execution.status == "FAILED", Execution.created_at < failed_cutoff),
+            and_(Execution.status != "FAILED", Execution.created_at < cutoff),
+        ),
+    ]
+
+
+def expired_ids(
+    db, policy: RetentionPolicy, now: datetime, limit: int | None = None
+) -> list[int]:
+    """Ids of expired executions, oldest first, at most `limit` of them."""
+    ranked = (
+        select(
+            Execution.id,
+            Execution.status,
+            Execution.created_at,
+            Execution.batch_id,
+            func.row_number().over(
+                partition_by=Execution.workflow_id,
+                order_by=(Execution.created_at.desc(), Execution.id.desc()),
+            ).label("rank"),
+        )
+        .where(Execution.status.in_(TERMINAL_STATUSES))
+        .subquery()
+    )
+    cutoff = now - timedelta(days=policy.keep_days)
+    failed_cutoff = now - timedelta(days=policy.keep_failed_days)
+    query = (
+        select(ranked.c.id)
+        .outerjoin(Batch, Batch.id == ranked.c.batch_id)
+        .where(
+            ranked.c.rank > policy.keep_last,
+            or_(
+                and_(ranked.c.status == "FAILED", ranked.c.created_at < failed_cutoff),
+                and_(ranked.c.status != "FAILED", ranked.c.created_at < cutoff),
+            ),
+            or_(ranked.c.batch_id.is_(None), Batch.status.in_(FINISHED_BATCH_STATUSES)),
+        )
+        .order_by(ranked.c.id)
+    )
+    if limit is not None:
+        query = query.limit(limit)
+    return list(db.execute(query).scalars())
+
+
+def _isoformat(value: datetime | None) -> str | None:
+    return value.isoformat() if value else None
+
+
+def execution_record(execution: Execution) -> dict:
+    """Everything stored about an execution, as archived."""
+    return {
+        "id": execution.id,
+        "workflow_id": execution.workflow_id,
+        "batch_id": execution.batch_id,
+        "status": execution.status,
+        "inputs": json.loads(execution.inputs) if execution.inputs else None,
+        "created_at": _isoformat(execution.created_at),
+        "finished_at": _isoformat(execution.finished_at),
+        "error_message": execution.error_message,
+        "cassette_mode": execution.cassette_mode,
+        "cassette_path": execution.cassette_path,
+        "step_logs": [
+            {
+                "id": log.id,
+                "step_id": log.step_id,
+                "step_order": log.step_order,
+                "parent_log_id": log.parent_log_id,
+                "item_index": log.item_index,
+                "status": log.status,
+                "output": log_output(log),
+                "output_hash": log.output_hash,
+                "output_size": log.output_size,
+                "retry_count": log.retry_count,
+                "llm_retries": log.llm_retries,
+                "breaker_state": log.breaker_state,
+                "hedge_winner": log.hedge_winner,
+                "prompt_tokens_estimate": log.prompt_tokens_estimate,
+                "context_tokens_saved": log.context_tokens_saved,
+                "started_at": _isoformat(log.started_at),
+                "finished_at": _isoformat(log.finished_at),
+                "attempts": [
+                    {
+                        "attempt": attempt.attempt,
+                        "status": attempt.status,
+                        "error": attempt.error,
+                        "model": attempt.model,
+                        "started_at": _isoformat(attempt.started_at),
+                        "duration": attempt.duration,
+                        "llm_seconds": attempt.llm_seconds,
+                        "queue_wait": attempt.queue_wait,
+                        "llm_retries": attempt.llm_retries,
+                        "prompt_tokens": attempt.prompt_tokens,
+                        "completion_tokens": attempt.completion_tokens,
+                    }
+                    for attempt in log.attempts
+                ],
+            }
+            for log in sorted(execution.step_logs, key=lambda log: (log.step_order, log.id))
+        ],
+    }
+
+
+def archive_batch(
+    execution_ids: list[int], policy: RetentionPolicy, now: datetime
+) -> dict:
+    """
+    Archive and delete those of these executions that are still expired
+    under `policy` (see `still_expired`); the rest are skipped. Archive
+    files are fsynced before the rows go, so a crash in between at worst
+    archives them twice. An execution that changes between being archived
+    and being deleted keeps its rows, and its stray archive record is
+    never looked up.
+    """
+    expired = still_expired(policy, now)
+    db = SessionLocal()
+    try:
+        executions = (
+            db.query(Execution)
+            .options(
+                selectinload(Execution.step_logs).selectinload(ExecutionStepLog.attempts),
+                selectinload(Execution.step_logs).joinedload(ExecutionStepLog.output_blob),
+            )
+            .filter(Execution.id.in_(execution_ids), *expired)
+            .with_for_update(of=Execution)
+            .all()
+        )
+        by_day: dict = defaultdict(list)
+        for execution in executions:
+            by_day[execution.created_at.date()].append(execution)
+
+        os.makedirs(ARCHIVE_DIR, exist_ok=True)
+        archived_at = datetime.utcnow()
+        entries = []
+        for day, group in by_day.items():
+            path = archive_path(day)
+            lines = "".join(
+                json.dumps(execution_record(e), separators=(",", ":")) + "\n"
+                for e in group)
+            # One gzip member per batch and day; concatenated members are
+            # still a valid gzip file, and the offset finds this one alone.
+            with open(path, "ab") as f:
+                offset = f.tell()
+                f.write(gzip.compress(lines.encode("utf-8")))
+                f.flush()
+                os.fsync(f.fileno())
+            entries.extend((e, path, offset) for e in group)
+
+        # Postgres holds the loaded rows FOR UPDATE; SQLite only locks at
+        # the first delete, so each statement re-checks `expired`, and from
+        # that first delete on the set cannot change under us.
+        current = select(Execution.id).where(
+            Execution.id.in_([e.id for e in executions]), *expired)
+        log_ids = select(ExecutionStepLog.id).where(ExecutionStepLog.execution_id.in_(current))
+        db.execute(delete(ExecutionStepAttempt).where(
+            ExecutionStepAttempt.step_log_id.in_(log_ids)))
+        db.execute(delete(ExecutionStepLog).where(ExecutionStepLog.execution_id.in_(current)))
+        ids = set(db.execute(
+            delete(Execution)
+            .where(Execution.id.in_([e.id for e in executions]), *expired)
+            .returning(Execution.id)
+        ).scalars())
+        db.add_all(
+            ArchivedExecution(
+                execution_id=e.id, workflow_id=e.workflow_id, status=e.status,
+                created_at=e.created_at, archived_at=archived_at,
+                path=path, offset=offset,
+            )
+            for e, path, offset in entries if e.id in ids)
+        hashes = {log.output_hash for e in executions if e.id in ids
+                  for log in e.step_logs if log.output_hash}
+        blobs = 0
+        if hashes:
+            blobs = db.execute(delete(OutputBlob).where(
+                OutputBlob.hash.in_(hashes),
+                ~exists().where(ExecutionStepLog.output_hash == OutputBlob.hash),
+            )).rowcount
+        db.commit()
+        return {"executions": len(ids), "blobs": blobs}
+    finally:
+        db.close()
+
+
+def compact() -> None:
+    """Return freed pages to the filesystem and trim the WAL (SQLite only)."""
+    if engine.dialect.name != "sqlite":
+        return
+    with engine.connect() as connection:
+        if connection.exec_driver_sql("PRAGMA auto_vacuum").scalar() == 2:
+            connection.exec_driver_sql(f"PRAGMA incremental_vacuum({VACUUM_PAGES})")
+        connection.exec_driver_sql("PRAGMA wal_checkpoint(PASSIVE)").fetchall()
+
+
+def vacuum() -> None:
+    """Full VACUUM; also switches an existing SQLite file to incremental auto-vacuum."""
+    if engine.dialect.name != "sqlite":
+        return
+    with engine.connect() as connection:
+        connection.exec_driver_sql("PRAGMA auto_vacuum=INCREMENTAL")
+        connection.exec_driver_sql("VACUUM")
+
+
+def run_retention(
+    policy: RetentionPolicy | None = None,
+    now: datetime | None = None,
+    dry_run: bool = False,
+) -> dict:
+    """One retention pass; returns what it archived."""
+    policy = policy or RetentionPolicy.from_env()
+    now = now or datetime.utcnow()
+    started = time.perf_counter()
+    totals = {"executions": 0, "blobs": 0, "batches": 0}
+
+    if dry_run:
+        db = SessionLocal()
+        try:
+            totals["executions"] = len(expired_ids(db, policy, now))
+        finally:
+            db.close()
+        return {**totals, "dry_run": True, "seconds": time.perf_counter() - started}
+
+    while True:
+        db = SessionLocal()
+        try:
+            ids = expired_ids(db, policy, now, policy.batch_size)
+        finally:
+            db.close()
+        if not ids:
+            break
+        result = archive_batch(ids, policy, now)
+        totals["executions"] += result["executions"]
+        totals["blobs"] += result["blobs"]
+        totals["batches"] += 1
+        if len(ids) < policy.batch_size:
+            break
+        time.sleep(BATCH_PAUSE)
+
+    if totals["executions"]:
+        compact()
+    totals["seconds"] = time.perf_counter() - started
+    logger.info("Retention archived %d executions in %d batches (%.1fs)",
+                totals["executions"], totals["batches"], totals["seconds"])
+    return totals
+
+
+def read_archived(execution_id: int) -> dict | None:
+    """An archived execution's record, with `archived_at` added, or None."""
+    db = SessionLocal()
+    try:
+        entry = db.get(ArchivedExecution, execution_id)
+    finally:
+        db.close()
+    if entry is None:
+        return None
+
+    decompressor = zlib.decompressobj(wbits=31)  # exactly one gzip member
+    chunks = []
+    with open(entry.path, "rb") as f:
+        f.seek(entry.offset)
+        while not decompressor.eof:
+            data = f.read(64 * 1024)
+            if not data:
+                break
+            chunks.append(decompressor.decompress(data))
+    prefix = f'{{"id":{execution_id},'.encode()
+    for line in b"".join(chunks).splitlines():
+        if line.startswith(prefix):
+            record = json.loads(line)
+            record["archived_at"] = entry.archived_at.isoformat()
+            return record
+    return None
+
+
+class RetentionThread:
+    """Runs a retention pass every `interval` seconds."""
+
+    def __init__(self, interval: float, policy: RetentionPolicy | None = None):
+        self.interval = interval
+        self.policy = policy or RetentionPolicy.from_env()
+        self.last_run: dict | None = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="retention", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.last_run = {
+                    **run_retention(self.policy),
+                    "finished_at": datetime.utcnow().isoformat(),
+                }
+            except Exception:
+                logger.exception("Retention pass failed")
+
+    def stats(self) -> dict:
+        return {"interval": self.interval, "policy": asdict(self.policy),
+                "last_run": self.last_run}
+
+
+_thread: RetentionThread | None = None
+
+
+def start_retention() -> RetentionThread | None:
+    """Start periodic retention if RETENTION_INTERVAL is set."""
+    global _thread
+    if RETENTION_INTERVAL > 0 and _thread is None:
+        _thread = RetentionThread(RETENTION_INTERVAL)
+        _thread.start()
+    return _thread
+
+
+def stop_retention() -> None:
+    if _thread is not None:
+        _thread.stop()
+
+
+def retention_stats() -> dict:
+    if _thread is None:
+        return {"interval": None, "policy": asdict(RetentionPolicy.from_env()),
+                "last_run": None}
+    return _thread.stats()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--vacuum", action="store_true",
+                        help="run a full VACUUM after the pass")
+    args = parser.parse_args()
+
+    configure_logging()
+    print(json.dumps(run_retention(dry_run=args.dry_run), indent=2))
+    if args.vacuum:
+        vacuum()
+
+
+if __name__ == "__main__":
+    main()
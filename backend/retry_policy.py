@@ -0,0 +1,149 @@
+"""Retry policy for LLM calls: error classification, backoff and deadlines."""
+
+import os
+import random
+import time
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+
+import httpx
+
+RETRYABLE_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+
+
+class LLMError(Exception):
+    """
+    A failed LLM call. `attempts` and `breaker_state` describe what the
+    client did before giving up and are copied into the step log.
+    """
+
+    retryable = False
+
+    def __init__(
+        self,
+        message: str,
+        status: int | None = None,
+        retry_after: float | None = None,
+    ):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+        self.attempts = 0
+        self.breaker_state: str | None = None
+
+    @property
+    def provider_failure(self) -> bool:
+        """Whether the error says the model itself is unhealthy."""
+        return self.retryable and self.status != 429
+
+
+class RetryableLLMError(LLMError):
+    retryable = True
+
+
+class NonRetryableLLMError(LLMError):
+    pass
+
+
+class CircuitOpenError(NonRetryableLLMError):
+    """The model's circuit breaker is open; the call was not attempted."""
+
+
+class DeadlineExceeded(NonRetryableLLMError):
+    """The step's time budget ran out."""
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date)."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+def classify(error: Exception) -> LLMError:
+    """Map a transport or decoding error onto the LLMError hierarchy."""
+    if isinstance(error, LLMError):
+        return error
+    if isinstance(error, httpx.HTTPStatusError):
+        status = error.response.status_code
+        retry_after = parse_retry_after(error.response.headers.get("Retry-After"))
+        if status in RETRYABLE_STATUSES:
+            return RetryableLLMError(str(error), status, retry_after)
+        return NonRetryableLLMError(str(error), status)
+    if isinstance(error, (httpx.TimeoutException, httpx.NetworkError,
+                          httpx.RemoteProtocolError)):
+        return RetryableLLMError(str(error) or type(error).__name__)
+    if isinstance(error, (KeyError, IndexError, ValueError)):
+        # Malformed response body: usually a gateway hiccup.
+        return RetryableLLMError(f"Malformed LLM response: {error!r}")
+    return NonRetryableLLMError(str(error))
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """Capped exponential backoff with full jitter."""
+
+    max_attempts: int = 3
+    base_delay: float = 0.5
+    max_delay: float = 20.0
+    multiplier: float = 2.0
+    jitter: bool = True
+
+    @classmethod
+    def from_env(cls) -> "RetryPolicy":
+        return cls(
+            max_attempts=int(os.getenv("LLM_MAX_RETRIES", "3")),
+            base_delay=float(os.getenv("LLM_BACKOFF_BASE", "0.5")),
+            max_delay=float(os.getenv("LLM_BACKOFF_MAX", "20")),
+        )
+
+    def backoff(self, retry: int, retry_after: float | None = None) -> float:
+        """Delay before retry number `retry` (0-based); Retry-After wins."""
+        if retry_after is not None:
+            return retry_after
+        delay = min(self.max_delay, self.base_delay * self.multiplier ** retry)
+        return random.uniform(0, delay) if self.jitter else delay
+
+
+class Deadline:
+    """A point in time after which a step must stop making calls."""
+
+    def __init__(self, seconds: float | None):
+        self.expires_at = time.monotonic() + seconds if seconds else None
+
+    def remaining(self) -> float | None:
+        if self.expires_at is None:
+            return None
+        return self.expires_at - time.monotonic()
+
+    def timeout(self, default: float) -> float:
+        """Request timeout capped by the remaining budget."""
+        remaining = self.remaining()
+        if remaining is None:
+            return default
+        if remaining <= 0:
+            raise DeadlineExceeded("Step deadline exceeded")
+        return min(default, remaining)
+
+    def earliest(self, other: "Deadline | None") -> "Deadline":
+        """Whichever of this deadline and `other` runs out first."""
+        if other is None or other.expires_at is None:
+            return self
+        if self.expires_at is None or other.expires_at < self.expires_at:
+            return other
+        return self
+
+    def allows(self, delay: float) -> bool:
+        remaining = self.remaining()
+        return remaining is None or remaining > delay
@@ -1,12 +1,41 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from contextlib import nullcontext
 from dataclasses import dataclass
+from datetime import datetime
 from typing import TYPE_CHECKING
 
-from llm_client import call_llm
-from models import Execution, ExecutionStepLog, Step, Workflow
+from sqlalchemy import select, update
+from sqlalchemy.orm import joinedload
+
+import engine_loop
+from blobs import log_output, store_output
+from cassette import Cassette, execution_cassette_path, use_cassette
+from context import AssembledPrompt
+from criteria import Criterion, compile_criteria
+from database import AsyncSessionLocal
+from events import bus
+from fanout import MAP_CONCURRENCY, map_chunks
+from leases import acquire, get_keeper, release
+from llm_client import LLMResponse, get_client
+from log_writer import get_log_writer
+from plan import StepSpec, get_plan
+from retry_policy import Deadline, DeadlineExceeded, LLMError
+from models import Execution, ExecutionStepAttempt, ExecutionStepLog, Workflow
+from observability import (
+    CONTEXT_TOKENS, CRITERIA_CHECKS, EXECUTION_SECONDS, EXECUTIONS_IN_FLIGHT,
+    STEP_ATTEMPTS, span,
+)
 
 if TYPE_CHECKING:
+    from sqlalchemy.ext.asyncio import AsyncSession
     from sqlalchemy.orm import Session
 
+logger = logging.getLogger(__name__)
+
 
 @dataclass
 class RunResult:
@@ -15,115 +44,805 @@ class RunResult:
     success: bool
     step_outputs: list[str]
     error_message: str | None = None
+    status: str | None = None  # the execution's final status
+
+
+def check_completion(
+    output: str, criteria: str | None, criterion: Criterion | None = None
+) -> bool:
+    """Check `output` against `criteria`, or its already compiled `criterion`."""
+    passed = (criterion or compile_criteria(criteria)).check(output)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Criteria %r %s on output %r",
+                     criteria, "passed" if passed else "failed", output)
+    return passed
+
+
+
+def _use_prompt(step_log: ExecutionStepLog, assembled: AssembledPrompt) -> str:
+    """Record an assembled prompt's size on its step log, and return its text."""
+    saved = assembled.full_tokens - assembled.tokens
+    step_log.prompt_tokens_estimate = assembled.tokens
+    step_log.context_tokens_saved = saved
+    CONTEXT_TOKENS.inc(assembled.tokens, kind="sent")
+    CONTEXT_TOKENS.inc(saved, kind="saved")
+    logger.debug("Step %s prompt: ~%d tokens, ~%d saved by context assembly",
+                 step_log.step_order, assembled.tokens, saved)
+    return assembled.text
+
 
-def check_completion(output: str, criteria: str | None) -> bool:
-    print("CHECKING COMPLETION")
-    print("OUTPUT:", output)
-    print("CRITERIA:", criteria)
+STEP_DEADLINE_SECONDS = float(os.getenv("STEP_DEADLINE_SECONDS", "300"))
+
+
+class StepProgress:
+    """
+    Reports a running step from its task: attempt starts and token
+    deltas go to the event bus, and the partial output is handed to the
+    write-behind StepLogWriter, which batches it into the step log. It also
+    totals the client's transport-level retries, remembers the model's
+    breaker state for the step log and collects a timing record per
+    attempt for execution_step_attempts.
+    """
+
+    def __init__(self, execution_id: int, log_id: int, step_order: int,
+                 item_index: int | None = None):
+        self.execution_id = execution_id
+        self.log_id = log_id
+        self.step_order = step_order
+        self.item_index = item_index
+        self.retries = 0
+        self.llm_retries = 0
+        self.breaker_state: str | None = None
+        self.hedge_winner: str | None = None
+        self.attempts: list[dict] = []
+        self._call: dict = {}
+
+    def record_call(self, result: LLMResponse | LLMError, model: str) -> None:
+        """Note a finished LLM call to `model` for the attempt in progress."""
+        self.llm_retries += max(0, result.attempts - 1)
+        if result.breaker_state is not None:
+            self.breaker_state = result.breaker_state
+        self._call = {"llm_retries": max(0, result.attempts - 1), "model": model}
+        if isinstance(result, LLMResponse):
+            self.hedge_winner = result.hedge_winner
+            self._call.update(
+                model=result.model,
+                llm_seconds=result.latency,
+                queue_wait=result.queue_wait,
+                prompt_tokens=result.prompt_tokens,
+                completion_tokens=result.completion_tokens,
+            )
 
-    if not criteria or not criteria.strip():
-        return True
+    def attempt(self, attempt: int) -> None:
+        self.retries = attempt
+        self._call = {}
+        self._publish("attempt", attempt=attempt)
 
-    return criteria.strip().lower() in output.lower()
+    def finish_attempt(
+        self,
+        attempt: int,
+        status: str,
+        error: str | None,
+        started_at: datetime,
+        duration: float,
+    ) -> None:
+        self.attempts.append({
+            "attempt": attempt,
+            "status": status,
+            "error": error,
+            "started_at": started_at,
+            "duration": duration,
+            **self._call,
+        })
 
+    def on_delta(self, delta: str, text: str) -> None:
+        self._publish("delta", delta=delta)
+        get_log_writer().write(self.log_id, text)
 
+    def _publish(self, kind: str, **fields) -> None:
+        # Events of map items are told apart from the step's own.
+        event = {"type": kind, "step_order": self.step_order, **fields}
+        if self.item_index is not None:
+            event.update(type=f"item_{kind}", item_index=self.item_index)
+        bus.publish(self.execution_id, event)
 
-def _build_prompt_with_context(prompt: str, previous_output: str | None) -> str:
-    if previous_output is None or previous_output.strip() == "":
-        return prompt
-    return f"Previous step output:\n{previous_output}\n\nCurrent step:\n{prompt}"
 
+def _publish_step(step_log: ExecutionStepLog) -> None:
+    event = {
+        "type": "step",
+        "log_id": step_log.id,
+        "step_order": step_log.step_order,
+        "status": step_log.status,
+        "retry_count": step_log.retry_count,
+    }
+    if step_log.item_index is not None:
+        event.update(type="item", item_index=step_log.item_index)
+    bus.publish(step_log.execution_id, event)
 
-def _run_single_step(step: Step, prompt_with_context: str) -> str:
-    return call_llm(step.model, prompt_with_context)
 
+def _publish_execution(execution_id: int, status: str) -> None:
+    bus.publish(execution_id, {
+        "type": "execution",
+        "status": status,
+    })
 
-def _execute_step_with_retries(step: Step, prompt_with_context: str) -> tuple[str, int]:
-    """Returns (output, retry_count). Raises on failure after retries exhausted."""
+
+async def _run_single_step(
+    step: StepSpec,
+    prompt_with_context: str,
+    refresh_cache: bool = False,
+    progress: StepProgress | None = None,
+    deadline: Deadline | None = None,
+) -> str:
+    criterion = step.criterion
+    client = get_client()
+    kwargs = {}
+    if step.hedge:
+        call = client.acomplete_hedged
+        kwargs["hedge_model"] = step.hedge_model
+    else:
+        call = client.acomplete
+    try:
+        response = await call(
+            step.model,
+            prompt_with_context,
+            use_cache=step.cache,
+            refresh_cache=step.cache and refresh_cache,
+            on_delta=progress.on_delta if progress is not None else None,
+            deadline=deadline,
+            stop=criterion.stream_check() if criterion.early_stop else None,
+            coalesce=step.coalesce,
+            **kwargs,
+        )
+    except LLMError as e:
+        if progress is not None:
+            progress.record_call(e, step.model)
+        raise
+    if progress is not None:
+        progress.record_call(response, step.model)
+    return response.content
+
+
+async def _execute_step_with_retries(
+    step: StepSpec,
+    prompt_with_context: str,
+    progress: StepProgress | None = None,
+    deadline: Deadline | None = None,
+) -> tuple[str, int]:
+    """
+    Returns (output, retry_count). Raises on failure after retries exhausted.
+
+    Step-level retries cover completion-criteria misses and retryable LLM
+    errors; the client has already retried transient failures itself, so
+    non-retryable errors (open breaker, 4xx, exhausted deadline) end the
+    step at once. All attempts share one budget: the step's
+    deadline_seconds (STEP_DEADLINE_SECONDS by default), cut short by the
+    execution's `deadline` if that comes first, and the remaining budget
+    bounds each LLM call. Cancelling the step's task abandons it mid-call.
+    """
+    with span("step", step_order=step.step_order, model=step.model):
+        return await _attempt_step(step, prompt_with_context, progress, deadline)
+
+
+def _finish_attempt(
+    progress: StepProgress | None,
+    attempt: int,
+    status: str,
+    error: Exception | None,
+    started_at: datetime,
+    started: float,
+) -> None:
+    STEP_ATTEMPTS.inc(outcome=status.lower())
+    if progress is not None:
+        progress.finish_attempt(
+            attempt, status, str(error) if error is not None else None,
+            started_at, time.perf_counter() - started)
+
+
+async def _attempt_step(
+    step: StepSpec,
+    prompt_with_context: str,
+    progress: StepProgress | None,
+    execution_deadline: Deadline | None = None,
+) -> tuple[str, int]:
     last_error = None
     attempts = step.retry_limit + 1
+    deadline = Deadline(step.deadline_seconds or STEP_DEADLINE_SECONDS).earliest(
+        execution_deadline)
+    # A cached answer that failed the criteria would fail again, so retries
+    # after a criteria miss go to the model and overwrite the cache entry.
+    criteria_failed = False
 
     for attempt in range(attempts):
+        if progress is not None:
+            progress.attempt(attempt)
+        started_at, started = datetime.utcnow(), time.perf_counter()
         try:
-            output = _run_single_step(step, prompt_with_context)
-            if check_completion(output, step.completion_criteria):
-                return output, attempt
-            last_error = RuntimeError("Completion criteria not met")
+            with span("attempt", step_order=step.step_order, attempt=attempt) as current:
+                output = await _run_single_step(
+                    step,
+                    prompt_with_context,
+                    refresh_cache=criteria_failed,
+                    progress=progress,
+                    deadline=deadline,
+                )
+                passed = check_completion(
+                    output, step.completion_criteria, step.criterion)
+                current.attributes["criteria"] = "pass" if passed else "fail"
+        except LLMError as e:
+            _finish_attempt(progress, attempt, "ERROR", e, started_at, started)
+            if not e.retryable:
+                raise
+            last_error = e
         except Exception as e:
+            _finish_attempt(progress, attempt, "ERROR", e, started_at, started)
             last_error = e
+        else:
+            CRITERIA_CHECKS.inc(result="pass" if passed else "fail")
+            if passed:
+                _finish_attempt(progress, attempt, "COMPLETED", None, started_at, started)
+                return output, attempt
+            criteria_failed = True
+            last_error = RuntimeError("Completion criteria not met")
+            _finish_attempt(
+                progress, attempt, "CRITERIA_FAILED", last_error, started_at, started)
         if attempt == attempts - 1:
             raise last_error
+        remaining = deadline.remaining()
+        if remaining is not None and remaining <= 0:
+            raise DeadlineExceeded(
+                f"Step deadline exceeded after {attempt + 1} attempts: {last_error}")
     raise last_error  # unreachable if attempts > 0
 
 
-def run_workflow(workflow: Workflow, session: "Session") -> tuple[int, RunResult]:
+def _start_log(step_log: ExecutionStepLog) -> None:
+    """Reset a new or reused step log for the run that starts now."""
+    step_log.status = "RUNNING"
+    step_log.output = None
+    step_log.output_hash = None
+    step_log.output_size = None
+    step_log.started_at = datetime.utcnow()
+    step_log.finished_at = None
+
+
+async def _finish_log(
+    session: "AsyncSession",
+    step_log: ExecutionStepLog,
+    progress: StepProgress,
+    task: asyncio.Task,
+) -> tuple[str | None, Exception | None]:
     """
-    Execute workflow with execution tracking. Creates an Execution and
-    ExecutionStepLog records, updates them as steps run, and returns
-    execution_id and the final RunResult.
+    Record the outcome of a finished step task on its log, in `session`
+    but not committed. Returns (output, None) or (None, error).
     """
-    ordered_steps = sorted(
-        workflow.steps, key=lambda s: getattr(s, "step_order", s.id))
-    for s in ordered_steps:
-        print("STEP CRITERIA DEBUG:", s.completion_criteria)
+    get_log_writer().discard(step_log.id)
+    step_log.finished_at = datetime.utcnow()
+    step_log.llm_retries = progress.llm_retries
+    step_log.breaker_state = progress.breaker_state
+    step_log.hedge_winner = progress.hedge_winner
+    session.add_all(
+        ExecutionStepAttempt(step_log_id=step_log.id, **record)
+        for record in progress.attempts)
+    try:
+        output, retry_count = task.result()
+    except Exception as e:
+        step_log.status = "TIMED_OUT" if isinstance(e, DeadlineExceeded) else "FAILED"
+        step_log.retry_count = progress.retries
+        return None, e
+    step_log.output = None
+    step_log.output_hash, step_log.output_size = await session.run_sync(
+        store_output, output)
+    step_log.retry_count = retry_count
+    step_log.status = "COMPLETED"
+    return output, None
 
-    step_outputs: list[str] = []
-    context: str | None = None
 
-    execution = Execution(workflow_id=workflow.id, status="RUNNING")
+async def _execute_map_step(
+    step: StepSpec,
+    prompt: str,
+    upstream: tuple[int, str],
+    progress: StepProgress,
+    deadline: Deadline | None = None,
+) -> tuple[str, int]:
+    """
+    Run a map step: its prompt over each chunk of the upstream (step
+    order, output), up to the step's map_concurrency chunks at a time,
+    each with the step's own retries and deadline. Returns the JSON array
+    of the chunk outputs, in order, and the highest retry count.
+
+    Items are logged as children of the step's log, in a session of this
+    task's own, and committed as they finish. Items completed by an
+    earlier run of the execution are not run again. Once an item fails no
+    more are started, but those running finish and are kept, so resuming
+    the execution runs only the items that are left.
+    """
+    order, text = upstream
+    chunks = map_chunks(text, step.split, step.split_delimiter, step.chunk_size)
+    # Every item's prompt is checked against the budget before any runs.
+    prompts = [step.context_policy.assemble(prompt, [(order, chunk)]) for chunk in chunks]
+    concurrency = step.map_concurrency or MAP_CONCURRENCY
+    results: dict[int, str] = {}
+    running: dict[asyncio.Task, tuple[int, ExecutionStepLog, StepProgress]] = {}
+    error: Exception | None = None
+
+    with span("map", step_order=step.step_order, items=len(chunks)):
+        async with AsyncSessionLocal() as session:
+            children = {
+                log.item_index: log for log in await session.scalars(
+                    select(ExecutionStepLog)
+                    .options(joinedload(ExecutionStepLog.output_blob))
+                    .where(ExecutionStepLog.parent_log_id == progress.log_id)
+                    .order_by(ExecutionStepLog.id))
+            }
+            for index, log in children.items():
+                if log.status == "COMPLETED" and index is not None:
+                    results[index] = log_output(log) or ""
+            pending = [i for i in range(len(chunks)) if i not in results]
+            try:
+                while pending or running:
+                    started = []
+                    if error is None:
+                        started = pending[:concurrency - len(running)]
+                        del pending[:len(started)]
+                    for index in started:
+                        if index not in children:
+                            children[index] = ExecutionStepLog(
+                                execution_id=progress.execution_id,
+                                step_id=step.id,
+                                step_order=step.step_order,
+                                parent_log_id=progress.log_id,
+                                item_index=index,
+                            )
+                            session.add(children[index])
+                        _start_log(children[index])
+                        _use_prompt(children[index], prompts[index])
+                    if started:
+                        await session.commit()
+                    for index in started:
+                        log = children[index]
+                        _publish_step(log)
+                        item_progress = StepProgress(
+                            progress.execution_id, log.id, step.step_order, index)
+                        task = asyncio.create_task(_execute_step_with_retries(
+                            step, prompts[index].text, item_progress, deadline))
+                        running[task] = (index, log, item_progress)
+
+                    if not running:
+                        break
+
+                    done, _ = await asyncio.wait(
+                        running, return_when=asyncio.FIRST_COMPLETED)
+                    finished = []
+                    for task in done:
+                        index, log, item_progress = running.pop(task)
+                        output, item_error = await _finish_log(
+                            session, log, item_progress, task)
+                        progress.llm_retries += item_progress.llm_retries
+                        progress.breaker_state = (
+                            item_progress.breaker_state or progress.breaker_state)
+                        progress.retries = max(progress.retries, log.retry_count)
+                        if item_error is not None:
+                            failure = (DeadlineExceeded if isinstance(
+                                item_error, DeadlineExceeded) else RuntimeError)
+                            error = error or failure(
+                                f"Map item {index} failed: {item_error}")
+                        else:
+                            results[index] = output
+                        finished.append(log)
+                    await session.commit()
+                    for log in finished:
+                        _publish_step(log)
+            except asyncio.CancelledError:
+                for task in running:
+                    task.cancel()
+                await asyncio.gather(*running, return_exceptions=True)
+                for _, log, _ in running.values():
+                    get_log_writer().discard(log.id)
+                raise
+
+    if error is not None:
+        raise error
+    return (json.dumps([results[i] for i in range(len(chunks))], ensure_ascii=False),
+            progress.retries)
+
+
+STEP_PARALLELISM = int(os.getenv("WORKFLOW_STEP_PARALLELISM", "4"))
+
+
+def _logs_by_step(
+    execution: Execution, steps: tuple[StepSpec, ...], session: "Session"
+) -> dict[int, ExecutionStepLog]:
+    """Existing step logs of the execution, keyed by step position."""
+    by_id = {step.id: index for index, step in enumerate(steps)}
+    by_order = {step.step_order: index for index, step in enumerate(steps)}
+    logs = {}
+    for log in (
+        session.query(ExecutionStepLog)
+        .options(joinedload(ExecutionStepLog.output_blob))
+        .filter(ExecutionStepLog.execution_id == execution.id,
+                ExecutionStepLog.parent_log_id.is_(None))
+        .order_by(ExecutionStepLog.id)
+    ):
+        index = by_id.get(log.step_id) if log.step_id is not None else None
+        if index is None:
+            index = by_order.get(log.step_order)
+        if index is not None:
+            logs[index] = log
+    return logs
+
+
+def create_execution(
+    workflow: Workflow,
+    session: "Session",
+    status: str = "QUEUED",
+    inputs: dict | None = None,
+    cassette_mode: str | None = None,
+    cassette_path: str | None = None,
+) -> Execution:
+    """
+    Create and commit an Execution row for the workflow. A recording
+    execution gets its own cassette file unless `cassette_path` is given.
+    """
+    execution = Execution(
+        workflow_id=workflow.id,
+        status=status,
+        inputs=json.dumps(inputs) if inputs is not None else None,
+        cassette_mode=cassette_mode,
+        cassette_path=cassette_path,
+    )
     session.add(execution)
-    session.flush()
+    if cassette_mode == "record" and cassette_path is None:
+        session.flush()
+        execution.cassette_path = execution_cassette_path(execution.id)
+    session.commit()
+    return execution
+
+
+async def execute_async(
+    execution: Execution, session: "AsyncSession", parallelism: int | None = None
+) -> RunResult:
+    """
+    Run the steps of an existing execution as a dependency graph. Steps
+    whose parents have all completed run concurrently as tasks, up to
+    `parallelism` at a time. Only the execution's own task touches the
+    session; step tasks just call the LLM, and map steps log their items
+    in a session of their own. Step logs are committed as steps start and
+    finish, one transaction per scheduling round, so other sessions can
+    follow progress; streamed partial outputs go through the write-behind
+    StepLogWriter.
+
+    Running an execution that already has step logs resumes it: completed
+    steps are not re-run and their stored outputs feed their children,
+    while logs of unfinished steps are reused for the new attempt. If the
+    task running the execution is cancelled, its running steps are
+    cancelled with it and the execution is left RUNNING, to be resumed;
+    stopped by `cancel_execution` or by the workflow's deadline_seconds,
+    the execution and its running steps are recorded as CANCELLED or
+    TIMED_OUT instead.
+
+    Executions with a cassette mode record their LLM calls to, or replay
+    them from, the execution's cassette file.
+    """
+    try:
+        cassette = (Cassette(execution.cassette_path, execution.cassette_mode)
+                    if execution.cassette_mode else None)
+    except (OSError, ValueError) as e:
+        execution.status = "FAILED"
+        execution.finished_at = datetime.utcnow()
+        execution.error_message = str(e)
+        await session.commit()
+        _publish_execution(execution.id, execution.status)
+        return RunResult(success=False, step_outputs=[], error_message=str(e),
+                         status="FAILED")
+
     execution_id = execution.id
+    _tasks[execution_id] = asyncio.current_task()
+    EXECUTIONS_IN_FLIGHT.inc()
+    started = time.perf_counter()
+    try:
+        with span("execution", execution_id=execution_id,
+                  workflow_id=execution.workflow_id), \
+                (use_cassette(cassette) if cassette else nullcontext()):
+            result = await _execute(execution, session, parallelism)
+    except asyncio.CancelledError:
+        status = _cancel_reasons.get(execution_id)
+        if status is None:
+            raise
+        asyncio.current_task().uncancel()
+        result = await _stop_execution(session, execution_id, status)
+    finally:
+        _tasks.pop(execution_id, None)
+        _cancel_reasons.pop(execution_id, None)
+        EXECUTIONS_IN_FLIGHT.dec()
+    EXECUTION_SECONDS.observe(time.perf_counter() - started, status=result.status)
+    return result
+
+
+async def _stop_execution(
+    session: "AsyncSession", execution_id: int, status: str
+) -> RunResult:
+    """
+    Record a cancelled or timed-out run on the execution and its running
+    steps. The result carries the outputs of the steps that did complete.
+    """
+    await session.rollback()
+    now = datetime.utcnow()
+    message = "Execution cancelled" if status == "CANCELLED" else "Execution deadline exceeded"
+    await session.execute(
+        update(ExecutionStepLog)
+        .where(ExecutionStepLog.execution_id == execution_id,
+               ExecutionStepLog.status == "RUNNING")
+        .values(status=status, finished_at=now)
+        .execution_options(synchronize_session=False))
+    await session.execute(
+        update(Execution)
+        .where(Execution.id == execution_id, Execution.status.in_(("QUEUED", "RUNNING")))
+        .values(status=status, finished_at=now, error_message=message)
+        .execution_options(synchronize_session=False))
+    await session.commit()
+    _publish_execution(execution_id, status)
+    completed = await session.scalars(
+        select(ExecutionStepLog)
+        .options(joinedload(ExecutionStepLog.output_blob))
+        .where(ExecutionStepLog.execution_id == execution_id,
+               ExecutionStepLog.parent_log_id.is_(None),
+               ExecutionStepLog.status == "COMPLETED")
+        .order_by(ExecutionStepLog.step_order))
+    return RunResult(success=False, step_outputs=[log_output(log) or "" for log in completed],
+                     error_message=message, status=status)
+
+
+# Executions running on this process's engine loop, and the status to
+# record for those being cancelled. Only touched on the loop.
+_tasks: dict[int, asyncio.Task] = {}
+_cancel_reasons: dict[int, str | None] = {}
+
+
+def _cancel(execution_id: int, status: str | None) -> None:
+    task = _tasks.get(execution_id)
+    if task is None or execution_id in _cancel_reasons:
+        return
+    _cancel_reasons[execution_id] = status
+    task.cancel()
+
+
+def cancel_execution(execution_id: int, status: str | None = "CANCELLED") -> None:
+    """
+    Cancel the execution if it is running in this process, from any
+    thread. Its running steps are cancelled at once, aborting their LLM
+    requests, and the execution and those steps are recorded with
+    `status`; with None they are left as they are, for the process that
+    took the execution over.
+    """
+    engine_loop.call_soon(_cancel, execution_id, status)
+
+
+async def execute_by_id(execution_id: int, parallelism: int | None = None) -> RunResult | None:
+    """`execute_async` in a session of its own; None if there is no such execution."""
+    async with AsyncSessionLocal() as session:
+        # The workflow row comes along; its steps only load on a plan miss.
+        execution = await session.get(
+            Execution, execution_id, options=[joinedload(Execution.workflow)])
+        if execution is None:
+            return None
+        return await execute_async(execution, session, parallelism)
+
+
+def execute(
+    execution: Execution, session: "Session", parallelism: int | None = None
+) -> RunResult:
+    """
+    Blocking `execute_async` for sync callers. The execution runs on the
+    engine loop in a session of its own; `execution` is expired in
+    `session` afterwards so that it reloads the outcome.
+    """
+    execution_id = execution.id
+    session.commit()
+    result = engine_loop.run(execute_by_id(execution_id, parallelism))
+    session.expire(execution)
+    return result
+
+
+async def _execute(
+    execution: Execution, session: "AsyncSession", parallelism: int | None
+) -> RunResult:
+    parallelism = parallelism or STEP_PARALLELISM
+    # A plan miss lazily loads the workflow's steps, which needs run_sync.
+    plan = await session.run_sync(lambda _: get_plan(execution.workflow))
+    steps = plan.steps
+    inputs = json.loads(execution.inputs) if execution.inputs else None
+
+    outputs: dict[int, str] = {}
+    existing_logs = await session.run_sync(
+        lambda sync_session: _logs_by_step(execution, steps, sync_session))
+    for index, log in existing_logs.items():
+        if log.status == "COMPLETED":
+            outputs[index] = log_output(log) or ""
 
+    execution_id = execution.id
+    # Not over a cancellation that came in after the execution was loaded.
+    claimed = await session.execute(
+        update(Execution)
+        .where(Execution.id == execution_id, Execution.status != "CANCELLED")
+        .values(status="RUNNING", finished_at=None, error_message=None)
+        .execution_options(synchronize_session=False))
+    await session.commit()
+    if claimed.rowcount == 0:
+        return RunResult(success=False,
+                         step_outputs=[outputs[i] for i in range(len(steps)) if i in outputs],
+                         error_message="Execution cancelled", status="CANCELLED")
+    _publish_execution(execution_id, "RUNNING")
+
+    deadline = Deadline(plan.deadline_seconds)
+    timer = None
+    if plan.deadline_seconds:
+        timer = asyncio.get_running_loop().call_later(
+            plan.deadline_seconds, _cancel, execution_id, "TIMED_OUT")
+    running: dict[asyncio.Task, tuple[int, ExecutionStepLog]] = {}
     try:
-        for step_order, step in enumerate(ordered_steps):
-            step_log = ExecutionStepLog(
-                execution_id=execution_id,
-                step_order=step_order,
-                status="RUNNING",
-            )
-            session.add(step_log)
-            session.flush()
+        if plan.error:
+            raise ValueError(plan.error)
+        parents = plan.parents
 
-            prompt_with_context = _build_prompt_with_context(
-                step.prompt, context)
-            try:
-                output, retry_count = _execute_step_with_retries(
-                    step, prompt_with_context)
-                step_log.output = output
-                step_log.retry_count = retry_count
-                step_log.status = "COMPLETED"
-                step_outputs.append(output)
-                context = output
-            except Exception as e:
-                step_log.status = "FAILED"
-                step_log.retry_count = step.retry_limit
-                execution.status = "FAILED"
-                session.commit()
-                return (
-                    execution_id,
-                    RunResult(
-                        success=False,
-                        step_outputs=step_outputs,
-                        error_message=str(e),
-                    ),
-                )
+        pending = [i for i in range(len(steps)) if i not in outputs]
+        progresses: dict[int, StepProgress] = {}
+        error: Exception | None = None
+
+        while pending or running:
+            ready = [] if error else [
+                i for i in pending if all(p in outputs for p in parents[i])]
+            started: list[tuple[int, ExecutionStepLog, str | None]] = []
+            for index in ready[:parallelism - len(running)]:
+                pending.remove(index)
+                step = steps[index]
+                step_log = existing_logs.get(index)
+                if step_log is None:
+                    step_log = ExecutionStepLog(
+                        execution_id=execution_id,
+                        step_id=step.id,
+                        step_order=step.step_order,
+                    )
+                    session.add(step_log)
+                _start_log(step_log)
+
+                try:
+                    prompt = step.template.render(inputs)
+                    if step.kind != "map":
+                        prompt = _use_prompt(step_log, step.context_policy.assemble(prompt, [
+                            (steps[s].step_order, outputs[s])
+                            for s in plan.context_sources[index]]))
+                except ValueError as e:
+                    step_log.status = "FAILED"
+                    step_log.finished_at = step_log.started_at
+                    started.append((index, step_log, None))
+                    error = e
+                    break
+                started.append((index, step_log, prompt))
+
+            # One transaction for every step started in this round.
+            if started:
+                await session.commit()
+            for index, step_log, prompt in started:
+                _publish_step(step_log)
+                if prompt is None:
+                    continue
+                step = steps[index]
+                progress = StepProgress(
+                    execution_id, step_log.id, step.step_order)
+                progresses[index] = progress
+                if step.kind == "map":
+                    parent = parents[index][0]
+                    coro = _execute_map_step(
+                        step, prompt, (steps[parent].step_order, outputs[parent]),
+                        progress, deadline)
+                else:
+                    coro = _execute_step_with_retries(step, prompt, progress, deadline)
+                # Each task inherits the execution span as its parent.
+                running[asyncio.create_task(coro)] = (index, step_log)
+
+            if not running:
+                break
+
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            finished = []
+            for task in done:
+                index, step_log = running.pop(task)
+                output, step_error = await _finish_log(
+                    session, step_log, progresses[index], task)
+                if step_error is not None:
+                    error = error or step_error
+                else:
+                    outputs[index] = output
+                finished.append(step_log)
+            # Steps that finished together are committed together, and
+            # before their events go out.
+            await session.commit()
+            for step_log in finished:
+                _publish_step(step_log)
+
+        step_outputs = [outputs[i] for i in range(len(steps)) if i in outputs]
+        execution.finished_at = datetime.utcnow()
+        if error is not None:
+            execution.status = (
+                "TIMED_OUT" if isinstance(error, DeadlineExceeded) else "FAILED")
+            execution.error_message = str(error)
+            await session.commit()
+            _publish_execution(execution_id, execution.status)
+            return RunResult(
+                success=False,
+                step_outputs=step_outputs,
+                error_message=str(error),
+                status=execution.status,
+            )
 
         execution.status = "SUCCESS"
-        session.commit()
-        return (
-            execution_id,
-            RunResult(success=True, step_outputs=step_outputs,
-                      error_message=None),
-        )
+        execution.error_message = None
+        await session.commit()
+        _publish_execution(execution_id, "SUCCESS")
+        return RunResult(success=True, step_outputs=step_outputs,
+                         error_message=None, status="SUCCESS")
+    except asyncio.CancelledError:
+        for task in running:
+            task.cancel()
+        await asyncio.gather(*running, return_exceptions=True)
+        for _, step_log in running.values():
+            get_log_writer().discard(step_log.id)
+        raise
     except Exception as e:
+        await session.rollback()
         execution.status = "FAILED"
-        session.commit()
-        return (
-            execution_id,
-            RunResult(
-                success=False,
-                step_outputs=step_outputs,
-                error_message=str(e),
-            ),
+        execution.finished_at = datetime.utcnow()
+        execution.error_message = str(e)
+        await session.commit()
+        _publish_execution(execution_id, "FAILED")
+        return RunResult(
+            success=False,
+            step_outputs=[outputs[i] for i in sorted(outputs)],
+            error_message=str(e),
+            status="FAILED",
         )
+    finally:
+        if timer is not None:
+            timer.cancel()
+
+
+async def run_workflow_async(
+    workflow_id: int,
+    cassette_mode: str | None = None,
+    cassette_path: str | None = None,
+) -> tuple[int, RunResult]:
+    """
+    Execute a workflow with execution tracking. Creates an Execution and
+    ExecutionStepLog records, updates them as steps run, and returns
+    execution_id and the final RunResult.
+    """
+    async with AsyncSessionLocal() as session:
+        workflow = await session.get(Workflow, workflow_id)
+        execution = await session.run_sync(lambda sync_session: create_execution(
+            workflow, sync_session, status="RUNNING",
+            cassette_mode=cassette_mode, cassette_path=cassette_path))
+        execution_id = execution.id
+        # Lease it like a queued run, so no other process recovers it meanwhile.
+        keeper = get_keeper()
+        await session.run_sync(acquire, execution_id, keeper.owner)
+        keeper.hold(execution_id, cancel_execution)
+        try:
+            return execution_id, await execute_async(execution, session)
+        finally:
+            keeper.drop(execution_id)
+            await session.run_sync(release, execution_id, keeper.owner)
+
+
+def run_workflow(
+    workflow: Workflow,
+    session: "Session",
+    cassette_mode: str | None = None,
+    cassette_path: str | None = None,
+) -> tuple[int, RunResult]:
+    """
+    Execute workflow inline with execution tracking: a blocking
+    `run_workflow_async`, run on the engine loop. Returns execution_id and
+    the final RunResult.
+    """
+    return engine_loop.run(
+        run_workflow_async(workflow.id, cassette_mode, cassette_path))
@@ -1,16 +1,81 @@
 """Pydantic schemas for workflow creation."""
 
-from pydantic import BaseModel, Field
+from typing import Any, Literal
+
+from pydantic import AliasChoices, BaseModel, Field, field_validator, model_validator
+
+from context import compile_context, resolve_context_steps
+from criteria import compile_criteria
+from fanout import check_map_steps
+from graph import resolve_dependencies, topological_order
 
 
 class StepCreate(BaseModel):
     model: str = Field(..., min_length=1)
     prompt: str = Field(..., min_length=1)
-    criteria: str | None = None
+    criteria: str | None = Field(
+        default=None,
+        validation_alias=AliasChoices("criteria", "completion_criteria"),
+    )
     retry_limit: int = Field(default=0, ge=0)
     step_order: int = Field(..., ge=0)
+    cache: bool = False
+    depends_on: list[int] | None = None
+    hedge: bool = False
+    hedge_model: str | None = None
+    coalesce: bool = True
+    # Map steps run the prompt over each item of their parent's output.
+    kind: Literal["prompt", "map"] = "prompt"
+    split: Literal["lines", "json", "delimiter"] | None = None
+    split_delimiter: str | None = Field(default=None, min_length=1, max_length=100)
+    chunk_size: int | None = Field(default=None, ge=1)
+    map_concurrency: int | None = Field(default=None, ge=1)
+    deadline_seconds: float | None = Field(default=None, gt=0)
+    # How earlier outputs go into the prompt; see context.py.
+    context: str | None = None
+    context_steps: list[int] | None = None
+    context_max_tokens: int | None = Field(default=None, ge=1)
+
+    @field_validator("criteria")
+    @classmethod
+    def check_criteria(cls, value: str | None) -> str | None:
+        compile_criteria(value)
+        return value
+
+    @field_validator("context")
+    @classmethod
+    def check_context(cls, value: str | None) -> str | None:
+        compile_context(value)
+        return value
+
+    @model_validator(mode="after")
+    def check_split(self) -> "StepCreate":
+        if self.split == "delimiter" and not self.split_delimiter:
+            raise ValueError("split 'delimiter' needs split_delimiter")
+        return self
 
 
 class WorkflowCreate(BaseModel):
     name: str = Field(..., min_length=1)
     steps: list[StepCreate]
+    deadline_seconds: float | None = Field(default=None, gt=0)
+
+    @model_validator(mode="after")
+    def check_dependencies(self) -> "WorkflowCreate":
+        orders = [s.step_order for s in self.steps]
+        if len(set(orders)) != len(orders):
+            raise ValueError("step_order values must be unique")
+        steps = sorted(self.steps, key=lambda s: s.step_order)
+        parents = resolve_dependencies(
+            [s.step_order for s in steps], [s.depends_on for s in steps])
+        topological_order(parents)
+        check_map_steps(
+            [s.step_order for s in steps], [s.kind for s in steps], parents)
+        resolve_context_steps(
+            [s.step_order for s in steps], [s.kind for s in steps],
+            [s.context_steps for s in steps], parents)
+        return self
+
+
+class BatchCreate(BaseModel):
+    inputs: list[dict[str, Any]] = Field(..., min_length=1)
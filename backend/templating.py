@@ -0,0 +1,43 @@
+"""Runtime input substitution for step prompts."""
+
+import re
+
+PLACEHOLDER = re.compile(r"\{\{\s*([A-Za-z_][A-Za-z0-9_]*)\s*\}\}")
+
+
+class PromptTemplate:
+    """A prompt split once into literal text and placeholder names."""
+
+    __slots__ = ("source", "_parts")
+
+    def __init__(self, source: str):
+        self.source = source
+        # Alternates literal, name, literal, ..., literal.
+        self._parts = tuple(PLACEHOLDER.split(source))
+
+    @property
+    def names(self) -> tuple[str, ...]:
+        return self._parts[1::2]
+
+    def render(self, variables: dict | None) -> str:
+        """
+        Replace `{{ name }}` placeholders with values from `variables`.
+        Without variables the template is returned unchanged; with variables,
+        a placeholder that has no value raises ValueError.
+        """
+        if variables is None or len(self._parts) == 1:
+            return self.source
+        rendered = []
+        for index, part in enumerate(self._parts):
+            if index % 2 == 0:
+                rendered.append(part)
+            elif part in variables:
+                rendered.append(str(variables[part]))
+            else:
+                raise ValueError(f"Missing input variable: {part}")
+        return "".join(rendered)
+
+
+def render_prompt(template: str, variables: dict | None) -> str:
+    """Render a template string once; see PromptTemplate.render."""
+    return PromptTemplate(template).render(variables)
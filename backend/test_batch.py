@@ -0,0 +1,40 @@
+import json
+
+from fastapi.testclient import TestClient
+
+from database import SessionLocal
+from main import app
+from models import Batch, Execution, Workflow
+
+
+def _workflow_id() -> int:
+    with SessionLocal() as db:
+        workflow = Workflow(name="batch")
+        db.add(workflow)
+        db.commit()
+        return workflow.id
+
+
+def _stored(workflow_id: int) -> tuple[int, int]:
+    with SessionLocal() as db:
+        return (db.query(Batch).filter(Batch.workflow_id == workflow_id).count(),
+                db.query(Execution).filter(Execution.workflow_id == workflow_id).count())
+
+
+def test_invalid_ndjson_line_keeps_nothing():
+    workflow_id = _workflow_id()
+    # More lines than one insert chunk, so some were stored before the bad one.
+    body = "".join(json.dumps({"n": i}) + "\n" for i in range(1200)) + "[1]\n"
+    response = TestClient(app).post(
+        f"/workflow/{workflow_id}/batch", content=body,
+        headers={"Content-Type": "application/x-ndjson"})
+    assert response.status_code == 422
+    assert _stored(workflow_id) == (0, 0)
+
+
+def test_invalid_json_body_creates_no_batch():
+    workflow_id = _workflow_id()
+    response = TestClient(app).post(
+        f"/workflow/{workflow_id}/batch", json={"inputs": "nope"})
+    assert response.status_code == 422
+    assert _stored(workflow_id) == (0, 0)
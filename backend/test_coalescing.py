@@ -0,0 +1,210 @@
+import asyncio
+import gc
+
+import httpx
+import pytest
+
+from coalescing import SingleFlight
+from retry_policy import Deadline, DeadlineExceeded, NonRetryableLLMError
+
+
+async def settle():
+    """Let every started call reach the gateway or join a flight."""
+    for _ in range(20):
+        await asyncio.sleep(0)
+
+
+def test_identical_calls_share_one_request(gateway):
+    async def scenario():
+        client = gateway.client()
+        gate = gateway.hold()
+        calls = [asyncio.create_task(client.acomplete("m", "hi")) for _ in range(5)]
+        await settle()
+        gate.set()
+        return await asyncio.gather(*calls), client
+
+    responses, client = asyncio.run(scenario())
+    assert len(gateway.requests) == 1
+    assert {r.content for r in responses} == {"m: hi"}
+    assert [r.coalesced for r in responses].count(False) == 1
+    assert client.coalescer.stats() == {
+        "enabled": True, "in_flight": 0, "started": 1, "joined": 4}
+
+
+def test_different_calls_do_not_share(gateway):
+    async def scenario():
+        client = gateway.client()
+        return await asyncio.gather(
+            client.acomplete("m", "a"), client.acomplete("m", "b"),
+            client.acomplete("n", "a"), client.acomplete("m", "a", use_cache=True))
+
+    responses = asyncio.run(scenario())
+    assert len(gateway.requests) == 4
+    assert not any(r.coalesced for r in responses)
+
+
+@pytest.mark.parametrize("client_options, call_options", [
+    ({}, {"coalesce": False}),
+    ({"coalescer": SingleFlight(enabled=False)}, {}),
+    ({}, {"stop": lambda text: False}),
+])
+def test_opting_out_sends_every_call(gateway, client_options, call_options):
+    async def scenario():
+        client = gateway.client(**client_options)
+        gate = gateway.hold()
+        calls = [asyncio.create_task(client.acomplete("m", "hi", **call_options))
+                 for _ in range(3)]
+        await settle()
+        gate.set()
+        return await asyncio.gather(*calls)
+
+    responses = asyncio.run(scenario())
+    assert len(gateway.requests) == 3
+    assert not any(r.coalesced for r in responses)
+
+
+def test_followers_get_the_leaders_error(gateway):
+    async def rejected(payload):
+        return httpx.Response(400, json={"error": "bad request"})
+
+    gateway.handler = rejected
+
+    async def scenario():
+        client = gateway.client()
+        gate = gateway.hold()
+        calls = [asyncio.create_task(client.acomplete("m", "hi")) for _ in range(3)]
+        await settle()
+        gate.set()
+        return await asyncio.gather(*calls, return_exceptions=True)
+
+    errors = asyncio.run(scenario())
+    assert len(gateway.requests) == 1
+    assert all(isinstance(e, NonRetryableLLMError) and e.status == 400 for e in errors)
+
+
+def test_cancelled_leader_leaves_the_request_to_followers(gateway):
+    async def scenario():
+        client = gateway.client()
+        gate = gateway.hold()
+        leader = asyncio.create_task(client.acomplete("m", "hi"))
+        await settle()
+        follower = asyncio.create_task(client.acomplete("m", "hi"))
+        await settle()
+        leader.cancel()
+        await settle()
+        gate.set()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower
+
+    response = asyncio.run(scenario())
+    assert response.content == "m: hi"
+    assert response.coalesced
+    assert len(gateway.requests) == 1
+    assert gateway.cancelled == 0
+
+
+def test_request_is_cancelled_when_every_caller_is(gateway):
+    async def scenario():
+        client = gateway.client()
+        gateway.hold()
+        calls = [asyncio.create_task(client.acomplete("m", "hi")) for _ in range(2)]
+        await settle()
+        for call in calls:
+            call.cancel()
+        await asyncio.gather(*calls, return_exceptions=True)
+        await settle()
+        return client
+
+    client = asyncio.run(scenario())
+    assert gateway.cancelled == 1
+    assert client.coalescer.stats()["in_flight"] == 0
+
+
+def test_lone_caller_deadline_is_not_called_shared(gateway):
+    async def scenario():
+        client = gateway.client()
+        gateway.hold()
+        await client.acomplete("m", "hi", deadline=Deadline(0.05))
+
+    with pytest.raises(DeadlineExceeded) as error:
+        asyncio.run(scenario())
+    assert "shared" not in str(error.value)
+
+
+def test_follower_deadline_is_called_shared(gateway):
+    async def scenario():
+        client = gateway.client()
+        gate = gateway.hold()
+        leader = asyncio.create_task(client.acomplete("m", "hi"))
+        await settle()
+        follower = asyncio.create_task(
+            client.acomplete("m", "hi", deadline=Deadline(0.05)))
+        with pytest.raises(DeadlineExceeded) as error:
+            await follower
+        gate.set()
+        return str(error.value), await leader
+
+    message, response = asyncio.run(scenario())
+    assert message == "Step deadline exceeded waiting for a shared LLM call"
+    assert response.content == "m: hi"
+    assert len(gateway.requests) == 1
+
+
+def test_follower_starts_over_when_the_leaders_deadline_runs_out(gateway):
+    async def scenario():
+        client = gateway.client()
+        gate = gateway.hold()
+        leader = asyncio.create_task(
+            client.acomplete("m", "hi", deadline=Deadline(0.05)))
+        await settle()
+        follower = asyncio.create_task(client.acomplete("m", "hi"))
+        with pytest.raises(DeadlineExceeded):
+            await leader
+        await settle()
+        gate.set()
+        return await follower
+
+    response = asyncio.run(scenario())
+    assert response.content == "m: hi"
+    assert len(gateway.requests) == 2
+
+
+def test_leader_deadline_is_called_shared_after_its_follower_left():
+    async def scenario():
+        flights = SingleFlight()
+
+        async def call(report):
+            await asyncio.Event().wait()
+
+        leader = asyncio.create_task(flights.run("k", call, deadline=Deadline(0.1)))
+        await settle()
+        with pytest.raises(DeadlineExceeded):
+            await flights.run("k", call, deadline=Deadline(0.02))
+        with pytest.raises(DeadlineExceeded) as error:
+            await leader
+        return str(error.value)
+
+    assert asyncio.run(scenario()) == "Step deadline exceeded waiting for a shared LLM call"
+
+
+def test_abandoned_request_error_is_not_reported_as_unretrieved():
+    async def scenario():
+        unhandled = []
+        asyncio.get_running_loop().set_exception_handler(
+            lambda loop, context: unhandled.append(context))
+        flights = SingleFlight()
+
+        async def call(report):
+            try:
+                await asyncio.Event().wait()
+            except asyncio.CancelledError:
+                raise DeadlineExceeded("Step deadline exceeded during LLM call")
+
+        with pytest.raises(DeadlineExceeded):
+            await flights.run("k", call, deadline=Deadline(0.02))
+        await settle()
+        gc.collect()
+        return unhandled
+
+    assert asyncio.run(scenario()) == []
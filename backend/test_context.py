@@ -0,0 +1,58 @@
+import pytest
+
+from context import OMITTED, ContextPolicy, compile_context, format_prompt
+from tokens import estimate_tokens
+
+
+def test_format_prompt_skips_empty_outputs():
+    assert format_prompt("Go", [(1, " ")]) == "Go"
+    assert format_prompt("Go", [(1, "a")]) == "Previous step output:\na\n\nCurrent step:\nGo"
+    assert format_prompt("Go", [(1, "a"), (2, ""), (3, "c")]) == (
+        "Output of step 1:\na\n\nOutput of step 3:\nc\n\nCurrent step:\nGo")
+
+
+def test_extractors():
+    assert compile_context("tail_chars:10").apply("word " * 20) == f"{OMITTED}\nword word "
+    assert compile_context("tail_chars:3").apply("abcdef") == "abcdef"  # marker costs more
+    assert compile_context(r"regex:id=(\d+)").apply("id=1 id=22") == "1\n22"
+    assert compile_context("json:items.1.name").apply(
+        '{"items": [{"name": "a"}, {"name": "b"}]}') == "b"
+    assert compile_context("json:missing").apply("{}") == ""
+
+
+@pytest.mark.parametrize("context", ["tail", "tail:x", "nope:1", "regex:("])
+def test_malformed_context(context):
+    with pytest.raises(ValueError):
+        compile_context(context)
+
+
+def test_no_budget_keeps_everything():
+    outputs = [(1, "word " * 200)]
+    assembled = ContextPolicy().assemble("Go", outputs)
+    assert assembled.text == format_prompt("Go", outputs)
+    assert assembled.tokens == assembled.full_tokens
+
+
+@pytest.mark.parametrize("budget", [60, 120])
+def test_budget_trims_outputs_to_fit(budget):
+    outputs = [(1, "alpha " * 300), (2, "short"), (3, "omega " * 100)]
+    assembled = ContextPolicy(max_tokens=budget).assemble("Summarise", outputs)
+    assert assembled.tokens <= budget
+    assert assembled.full_tokens > budget
+    assert "short" in assembled.text
+    assert assembled.text.endswith("Current step:\nSummarise")
+    assert OMITTED in assembled.text
+
+
+def test_budget_keeps_the_tail_of_an_output():
+    output = " ".join(f"w{i}" for i in range(500))
+    assembled = ContextPolicy(max_tokens=50).assemble("Go", [(1, output)])
+    assert assembled.tokens <= 50
+    assert "w499" in assembled.text
+    assert "w0 " not in assembled.text
+
+
+def test_prompt_over_budget_fails():
+    prompt = "instructions " * 50
+    with pytest.raises(ValueError, match="budget"):
+        ContextPolicy(max_tokens=estimate_tokens(prompt) - 1).assemble(prompt, [(1, "x")])
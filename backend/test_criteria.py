@@ -0,0 +1,79 @@
+import pytest
+
+from criteria import Always, Keywords, compile_criteria
+
+
+def test_empty_criteria_always_pass():
+    assert isinstance(compile_criteria(None), Always)
+    assert compile_criteria("  ").check("")
+
+
+def test_plain_text_is_a_case_insensitive_substring():
+    criterion = compile_criteria("HELLO")
+    assert criterion.check("well, hello there")
+    assert not criterion.check("goodbye")
+
+
+def test_any_and_all_keywords():
+    assert compile_criteria("any:cat, dog").check("a DOG barked")
+    assert not compile_criteria("all:cat, dog").check("a dog barked")
+    assert compile_criteria("all:cat, dog").check("the cat and the dog")
+
+
+@pytest.mark.parametrize("criteria, output", [
+    ("all:ab,bc", "abc"),
+    ("all:new york,york city", "new york city"),
+])
+def test_overlapping_keywords_are_all_found(criteria, output):
+    assert compile_criteria(criteria).check(output)
+
+
+def test_longer_keyword_counts_for_the_shorter_ones_it_contains():
+    assert compile_criteria("all:york,new york").check("New York")
+
+
+def test_stream_check_finds_keywords_split_across_deltas():
+    check = Keywords(["world", "hello"], require_all=True).stream_check()
+    assert not check("hel")
+    assert not check("hello wo")
+    assert check("hello world")
+
+
+def test_regex_and_length():
+    assert compile_criteria(r"regex:\d{3}").check("code 404")
+    assert not compile_criteria(r"regex:^\d+$").check("12a")
+    assert compile_criteria("len:2..4").check("abc")
+    assert not compile_criteria("len:2..4").check("abcde")
+    assert compile_criteria("len:3").check("abcdef")
+
+
+def test_json_schema():
+    criterion = compile_criteria(
+        'json_schema:{"type": "object", "required": ["name"]}')
+    assert criterion.check('```json\n{"name": "x"}\n```')
+    assert not criterion.check('{"other": 1}')
+    assert not criterion.check("not json")
+
+
+def test_stop_prefix_sets_early_stop():
+    assert compile_criteria("stop:DONE").early_stop
+    assert compile_criteria("stop:regex:[0-9]+").early_stop
+
+
+@pytest.mark.parametrize("criteria", [
+    "stop:regex:done$",
+    r"stop:regex:\bdone\b",
+    r"stop:regex:done\Z",
+    "stop:regex:done(?!!)",
+    "stop:len:1..",
+    "stop:json",
+])
+def test_stop_rejects_criteria_later_text_could_undo(criteria):
+    with pytest.raises(ValueError):
+        compile_criteria(criteria)
+
+
+@pytest.mark.parametrize("criteria", ["regex:(", "len:a..b", "json_schema:{", "any:,"])
+def test_malformed_criteria(criteria):
+    with pytest.raises(ValueError):
+        compile_criteria(criteria)
@@ -0,0 +1,118 @@
+import asyncio
+import time
+
+import pytest
+
+import engine_loop
+from blobs import store_output
+from database import SessionLocal
+from llm_client import set_client
+from models import Execution, ExecutionStepLog, Step, Workflow
+from runner import cancel_execution, create_execution, execute_by_id, run_workflow_async
+
+BLOCK = "wait forever"
+
+
+@pytest.fixture
+def llm(gateway):
+    """The gateway as the process-wide client; prompts containing BLOCK never return."""
+    async def handler(payload):
+        if BLOCK in payload["messages"][0]["content"]:
+            await asyncio.Event().wait()
+        return await gateway.echo(payload)
+
+    gateway.handler = handler
+    previous = set_client(gateway.client())
+    yield gateway
+    set_client(previous)
+
+
+def new_workflow(*prompts: str, deadline_seconds: float | None = None) -> int:
+    with SessionLocal() as db:
+        workflow = Workflow(name="runner", deadline_seconds=deadline_seconds)
+        db.add(workflow)
+        db.flush()
+        db.add_all(Step(workflow_id=workflow.id, model="m", prompt=prompt, step_order=order)
+                   for order, prompt in enumerate(prompts, 1))
+        db.commit()
+        return workflow.id
+
+
+def latest_execution(workflow_id: int) -> int | None:
+    with SessionLocal() as db:
+        row = (db.query(Execution.id).filter(Execution.workflow_id == workflow_id)
+               .order_by(Execution.id.desc()).first())
+        return row.id if row else None
+
+
+def step_statuses(execution_id: int) -> dict[int, str]:
+    with SessionLocal() as db:
+        return dict(db.query(ExecutionStepLog.step_order, ExecutionStepLog.status)
+                    .filter(ExecutionStepLog.execution_id == execution_id,
+                            ExecutionStepLog.parent_log_id.is_(None)))
+
+
+def wait_until_running(workflow_id: int, step_order: int) -> int:
+    for _ in range(200):
+        execution_id = latest_execution(workflow_id)
+        if execution_id and step_statuses(execution_id).get(step_order) == "RUNNING":
+            return execution_id
+        time.sleep(0.02)
+    raise AssertionError(f"Step {step_order} never started")
+
+
+def outcome(execution_id: int) -> tuple[str, str | None]:
+    with SessionLocal() as db:
+        execution = db.get(Execution, execution_id)
+        return execution.status, execution.error_message
+
+
+def test_run_succeeds(llm):
+    workflow_id = new_workflow("one", "two")
+    execution_id, result = engine_loop.run(run_workflow_async(workflow_id))
+    assert result.status == "SUCCESS"
+    assert result.step_outputs[0] == "m: one"
+    assert result.step_outputs[1].endswith("two")
+    assert outcome(execution_id) == ("SUCCESS", None)
+
+
+def test_cancelled_run_keeps_completed_outputs(llm):
+    workflow_id = new_workflow("one", BLOCK, "three")
+    run = engine_loop.submit(run_workflow_async(workflow_id))
+    execution_id = wait_until_running(workflow_id, 2)
+    cancel_execution(execution_id)
+    _, result = run.result(timeout=10)
+
+    assert result.status == "CANCELLED"
+    assert result.step_outputs == ["m: one"]
+    assert outcome(execution_id) == ("CANCELLED", "Execution cancelled")
+    assert step_statuses(execution_id) == {1: "COMPLETED", 2: "CANCELLED"}
+    assert llm.cancelled == 1
+
+
+def test_deadline_times_the_run_out(llm):
+    workflow_id = new_workflow("one", BLOCK, deadline_seconds=0.5)
+    execution_id, result = engine_loop.submit(run_workflow_async(workflow_id)).result(timeout=10)
+
+    assert result.status == "TIMED_OUT"
+    assert result.step_outputs == ["m: one"]
+    assert outcome(execution_id) == ("TIMED_OUT", "Execution deadline exceeded")
+    assert step_statuses(execution_id) == {1: "COMPLETED", 2: "TIMED_OUT"}
+
+
+def test_execution_cancelled_before_it_starts(llm):
+    workflow_id = new_workflow("one", "two")
+    with SessionLocal() as db:
+        execution = create_execution(db.get(Workflow, workflow_id), db, status="CANCELLED")
+        digest, size = store_output(db, "done before")
+        step = db.query(Step).filter(Step.workflow_id == workflow_id,
+                                     Step.step_order == 1).one()
+        db.add(ExecutionStepLog(execution_id=execution.id, step_id=step.id, step_order=1,
+                                status="COMPLETED", output_hash=digest, output_size=size))
+        db.commit()
+        execution_id = execution.id
+
+    result = engine_loop.run(execute_by_id(execution_id))
+    assert result.status == "CANCELLED"
+    assert result.step_outputs == ["done before"]
+    assert llm.requests == []
@@ -0,0 +1,49 @@
+import json
+
+import pytest
+
+from fanout import check_map_steps, map_chunks, split_output
+
+
+def test_split_lines_and_delimiter():
+    assert split_output(" a \n\n b\n") == ["a", "b"]
+    assert split_output("a;; b;", "delimiter", ";") == ["a", "b"]
+    with pytest.raises(ValueError):
+        split_output("a", "delimiter")
+
+
+def test_split_json_keeps_items_parsed():
+    assert split_output('```json\n[{"a": 1}, "x", 3]\n```', "json") == [{"a": 1}, "x", 3]
+    with pytest.raises(ValueError, match="not a JSON array"):
+        split_output('{"a": 1}', "json")
+    with pytest.raises(ValueError, match="not valid JSON"):
+        split_output("[1,", "json")
+
+
+def test_json_items_one_per_chunk():
+    assert map_chunks('[{"a": 1}, "x", 3]', "json", None, None) == ['{"a": 1}', "x", "3"]
+
+
+def test_chunked_json_is_encoded_once():
+    chunks = map_chunks('[{"a":1},{"b":2},{"c":3}]', "json", None, 2)
+    assert chunks == ['[{"a": 1}, {"b": 2}]', '[{"c": 3}]']
+    assert json.loads(chunks[0]) == [{"a": 1}, {"b": 2}]
+    assert map_chunks('["x", {"y": [1]}]', "json", None, 5) == ['["x", {"y": [1]}]']
+
+
+def test_chunked_lines_and_delimiter():
+    assert map_chunks("a\nb\nc", "lines", None, 2) == ["a\nb", "c"]
+    assert map_chunks("a|b|c", "delimiter", "|", 2) == ["a|b", "c"]
+
+
+def test_too_many_chunks(monkeypatch):
+    monkeypatch.setattr("fanout.MAP_MAX_ITEMS", 2)
+    with pytest.raises(ValueError, match="MAP_MAX_ITEMS"):
+        map_chunks("a\nb\nc", "lines", None, 1)
+    assert map_chunks("a\nb\nc", "lines", None, 2) == ["a\nb", "c"]
+
+
+def test_map_steps_need_one_parent():
+    check_map_steps([1, 2], ["prompt", "map"], [[], [0]])
+    with pytest.raises(ValueError, match="exactly one"):
+        check_map_steps([1, 2, 3], ["prompt", "prompt", "map"], [[], [], [0, 1]])
@@ -0,0 +1,40 @@
+import pytest
+
+from graph import CycleError, resolve_dependencies, topological_order
+
+
+def test_undeclared_steps_depend_on_the_previous_one():
+    assert resolve_dependencies([1, 2, 3], [None, None, None]) == [[], [0], [1]]
+
+
+def test_declared_parents_map_step_orders_to_positions():
+    parents = resolve_dependencies([10, 20, 30, 40], [None, [10], [10], [30, 20, 20]])
+    assert parents == [[], [0], [0], [2, 1]]
+
+
+def test_unknown_parent():
+    with pytest.raises(ValueError, match="unknown step 5"):
+        resolve_dependencies([1, 2], [None, [5]])
+
+
+def test_self_dependency_is_a_cycle():
+    with pytest.raises(CycleError):
+        resolve_dependencies([1, 2], [None, [2]])
+
+
+def test_topological_order_puts_parents_first():
+    parents = [[2], [], [1], [0, 1]]
+    order = topological_order(parents)
+    assert sorted(order) == [0, 1, 2, 3]
+    for child, step_parents in enumerate(parents):
+        for parent in step_parents:
+            assert order.index(parent) < order.index(child)
+
+
+def test_topological_order_keeps_independent_steps_in_position_order():
+    assert topological_order([[], [], [0, 1], []]) == [0, 1, 3, 2]
+
+
+def test_cycle():
+    with pytest.raises(CycleError):
+        topological_order([[], [2], [1]])
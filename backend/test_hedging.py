@@ -0,0 +1,141 @@
+import asyncio
+
+import httpx
+import pytest
+
+from hedging import MIN_HEDGE_DELAY, HedgeBudget, Hedger, LatencyTracker
+from retry_policy import NonRetryableLLMError
+
+
+@pytest.fixture
+def slow_first(gateway):
+    """Requests to "slow", and the first request of all, never answer."""
+    async def handler(payload):
+        if payload["model"] == "slow" or len(gateway.requests) == 1:
+            await asyncio.Event().wait()
+        return await gateway.echo(payload)
+
+    gateway.handler = handler
+    return gateway
+
+
+def hedger(**options) -> Hedger:
+    return Hedger(**{"default_delay": MIN_HEDGE_DELAY, **options})
+
+
+def test_latency_percentile_needs_enough_samples():
+    tracker = LatencyTracker(window=100)
+    for latency in range(1, 11):
+        tracker.record("m", latency)
+    assert tracker.percentile("m", 50, min_samples=20) is None
+    assert tracker.percentile("m", 50, min_samples=10) == 5
+    assert tracker.percentile("m", 95, min_samples=10) == 10
+    assert tracker.percentile("other", 50, min_samples=0) is None
+
+
+def test_hedge_delay_follows_observed_latency():
+    subject = Hedger(default_delay=2.0, min_samples=3)
+    assert subject.delay_for("m") == 2.0
+    for latency in (0.2, 0.3, 0.4):
+        subject.latencies.record("m", latency)
+    assert subject.delay_for("m") == 0.4
+    for _ in range(3):
+        subject.latencies.record("fast", 0.001)
+    assert subject.delay_for("fast") == MIN_HEDGE_DELAY
+
+
+def test_budget_earns_a_fraction_of_a_hedge_per_call():
+    budget = HedgeBudget(ratio=0.5, burst=1)
+    assert budget.withdraw()
+    assert not budget.withdraw()
+    budget.deposit()
+    assert not budget.withdraw()
+    budget.deposit()
+    assert budget.withdraw()
+    for _ in range(10):
+        budget.deposit()
+    assert budget.credits == 1
+
+
+def test_fast_primary_is_not_hedged(gateway):
+    client = gateway.client(hedger=hedger(default_delay=1.0))
+    response = asyncio.run(client.acomplete_hedged("m", "hi"))
+    assert response.hedge_winner is None
+    assert len(gateway.requests) == 1
+    assert client.hedger.stats()["sent"] == 0
+
+
+def test_slow_primary_loses_to_the_hedge(slow_first):
+    client = slow_first.client(hedger=hedger())
+    response = asyncio.run(client.acomplete_hedged("slow", "hi", hedge_model="fast"))
+    assert response.content == "fast: hi"
+    assert response.hedge_winner == "hedge"
+    assert [r["model"] for r in slow_first.requests] == ["slow", "fast"]
+    # The losing primary's request was cancelled.
+    assert slow_first.cancelled == 1
+    assert client.hedger.stats()["won"] == 1
+
+
+def test_hedge_to_the_same_model(slow_first):
+    client = slow_first.client(hedger=hedger())
+    response = asyncio.run(client.acomplete_hedged("m", "hi"))
+    assert response.hedge_winner == "hedge"
+    assert [r["model"] for r in slow_first.requests] == ["m", "m"]
+
+
+def test_primary_that_answers_first_wins(gateway):
+    async def handler(payload):
+        if len(gateway.requests) == 2:
+            await asyncio.Event().wait()
+        await asyncio.sleep(0.1)
+        return await gateway.echo(payload)
+
+    gateway.handler = handler
+    client = gateway.client(hedger=hedger())
+    response = asyncio.run(client.acomplete_hedged("m", "hi"))
+    assert response.hedge_winner == "primary"
+    assert len(gateway.requests) == 2
+    assert gateway.cancelled == 1
+
+
+def test_budget_denies_hedges(slow_first):
+    client = slow_first.client(hedger=hedger(budget_ratio=0, budget_burst=1))
+
+    async def scenario():
+        first = await client.acomplete_hedged("slow", "one", hedge_model="fast")
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(
+                client.acomplete_hedged("slow", "two", hedge_model="fast"), 0.3)
+        return first
+
+    assert asyncio.run(scenario()).hedge_winner == "hedge"
+    stats = client.hedger.stats()
+    assert (stats["sent"], stats["denied"]) == (1, 1)
+    assert [r["model"] for r in slow_first.requests] == ["slow", "fast", "slow"]
+
+
+def test_primary_error_wins_when_both_fail(gateway):
+    async def handler(payload):
+        if len(gateway.requests) == 1:
+            await asyncio.sleep(0.1)
+            return httpx.Response(400, json={"error": "primary"})
+        return httpx.Response(404, json={"error": "hedge"})
+
+    gateway.handler = handler
+    client = gateway.client(hedger=hedger())
+    with pytest.raises(NonRetryableLLMError) as error:
+        asyncio.run(client.acomplete_hedged("m", "hi"))
+    assert error.value.status == 400
+
+
+def test_cancelling_the_call_cancels_both_contenders(slow_first):
+    async def scenario():
+        client = slow_first.client(hedger=hedger())
+        call = asyncio.create_task(client.acomplete_hedged("slow", "hi", hedge_model="slow"))
+        await asyncio.sleep(0.2)
+        call.cancel()
+        await asyncio.gather(call, return_exceptions=True)
+
+    asyncio.run(scenario())
+    assert len(slow_first.requests) == 2
+    assert slow_first.cancelled == 2
@@ -0,0 +1,180 @@
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+import recovery
+from database import SessionLocal
+from leases import LeaseKeeper, acquire, claim, release
+from models import Execution, Workflow
+
+
+def new_executions(count: int, **values) -> list[int]:
+    with SessionLocal() as db:
+        workflow = Workflow(name="leases")
+        db.add(workflow)
+        db.flush()
+        executions = [Execution(workflow_id=workflow.id, **{"status": "QUEUED", **values})
+                      for _ in range(count)]
+        db.add_all(executions)
+        db.commit()
+        return [execution.id for execution in executions]
+
+
+def lease_of(execution_id: int) -> tuple[str, str | None, datetime | None]:
+    with SessionLocal() as db:
+        execution = db.get(Execution, execution_id)
+        return execution.status, execution.lease_owner, execution.lease_expires_at
+
+
+def expire(execution_id: int, **values) -> None:
+    with SessionLocal() as db:
+        db.query(Execution).filter(Execution.id == execution_id).update(
+            {"lease_expires_at": datetime.utcnow() - timedelta(seconds=1), **values})
+        db.commit()
+
+
+def race(count: int, target) -> list:
+    """Run `target(i)` on `count` threads released at once; returns the results."""
+    barrier = threading.Barrier(count)
+    results = [None] * count
+
+    def run(i):
+        barrier.wait()
+        results[i] = target(i)
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_only_one_of_two_claimers_wins():
+    [execution_id] = new_executions(1)
+
+    def take(i):
+        with SessionLocal() as db:
+            return acquire(db, execution_id, f"owner-{i}")
+
+    assert sorted(race(2, take)) == [False, True]
+    with SessionLocal() as db:
+        assert not acquire(db, execution_id, "late")
+
+
+def test_concurrent_claims_never_share_an_execution():
+    ids = set(new_executions(20, enqueued_at=datetime.utcnow() - timedelta(days=1)))
+
+    def take(i):
+        with SessionLocal() as db:
+            return set(claim(db, f"worker-{i}", 1000)) & ids
+
+    first, second = race(2, take)
+    assert not first & second
+    assert first | second == ids
+    for execution_id in ids:
+        assert lease_of(execution_id)[1] in ("worker-0", "worker-1")
+
+
+def test_claim_takes_only_enqueued_executions():
+    [queued] = new_executions(1)
+    with SessionLocal() as db:
+        assert queued not in claim(db, "worker", 1000)
+
+
+def test_expired_lease_can_be_taken_over():
+    [execution_id] = new_executions(1)
+    with SessionLocal() as db:
+        assert acquire(db, execution_id, "dead")
+        expire(execution_id, status="RUNNING")
+        assert acquire(db, execution_id, "alive")
+    assert lease_of(execution_id)[1] == "alive"
+
+
+def test_finished_executions_cannot_be_claimed():
+    [execution_id] = new_executions(1, status="SUCCESS")
+    with SessionLocal() as db:
+        assert not acquire(db, execution_id, "owner")
+
+
+def test_release_only_by_the_holder():
+    [execution_id] = new_executions(1)
+    with SessionLocal() as db:
+        acquire(db, execution_id, "holder")
+        release(db, execution_id, "other")
+        assert lease_of(execution_id)[1] == "holder"
+        release(db, execution_id, "holder")
+    assert lease_of(execution_id)[1:] == (None, None)
+
+
+def test_heartbeat_renews_held_leases():
+    [execution_id] = new_executions(1)
+    keeper = LeaseKeeper("keeper", interval=3600)
+    with SessionLocal() as db:
+        acquire(db, execution_id, "keeper")
+    expire(execution_id)
+    keeper.hold(execution_id)
+    keeper.renew()
+    assert lease_of(execution_id)[2] > datetime.utcnow()
+    assert keeper.held() == [execution_id]
+    keeper.stop()
+
+
+@pytest.mark.parametrize("change, reason", [
+    ({"lease_owner": "thief"}, None),
+    ({"status": "CANCELLED"}, "CANCELLED"),
+])
+def test_heartbeat_stops_lost_and_cancelled_executions(change, reason):
+    [execution_id] = new_executions(1)
+    keeper = LeaseKeeper("keeper", interval=3600)
+    with SessionLocal() as db:
+        acquire(db, execution_id, "keeper")
+        db.query(Execution).filter(Execution.id == execution_id).update(change)
+        db.commit()
+    stopped = []
+    keeper.hold(execution_id, lambda *args: stopped.append(args))
+    keeper.renew()
+    assert stopped == [(execution_id, reason)]
+    assert keeper.held() == []
+    assert keeper.lost == (1 if reason is None else 0)
+    keeper.stop()
+
+
+class Pool:
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, execution_id, block=False, on_done=None):
+        self.submitted.append(execution_id)
+
+
+def test_expired_leases_are_reclaimed(monkeypatch):
+    pool = Pool()
+    monkeypatch.setattr(recovery, "get_pool", lambda: pool)
+    dead, alive, queued_dead, enqueued = new_executions(4)
+    with SessionLocal() as db:
+        for execution_id in (dead, alive, queued_dead, enqueued):
+            acquire(db, execution_id, "owner")
+    expire(dead, status="RUNNING")
+    expire(queued_dead)
+    expire(enqueued, enqueued_at=datetime.utcnow())
+
+    reclaimed = set(recovery.reclaim_expired())
+    assert {dead, queued_dead} <= reclaimed
+    assert not {alive, enqueued} & reclaimed
+    assert {dead, queued_dead} <= set(pool.submitted)
+    assert lease_of(dead) == ("QUEUED", None, None)
+    assert lease_of(alive)[1] == "owner"
+    # Taken once: a second pass, or another process, finds nothing left.
+    assert not {dead, queued_dead} & set(recovery.reclaim_expired())
+
+
+def test_concurrent_reclaimers_never_share_an_execution(monkeypatch):
+    monkeypatch.setattr(recovery, "get_pool", Pool)
+    ids = set(new_executions(10, status="RUNNING"))
+    for execution_id in ids:
+        expire(execution_id)
+    first, second = race(2, lambda i: set(recovery.reclaim_expired()) & ids)
+    assert not first & second
+    assert first | second == ids
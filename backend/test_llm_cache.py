@@ -0,0 +1,59 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy.exc import OperationalError
+
+from database import SessionLocal
+from llm_cache import LRUCache, ResponseCache, cache_key
+from models import LLMCacheEntry
+
+
+def test_cache_key_covers_every_parameter():
+    key = cache_key("m", "p", 0.0, 10)
+    assert key == cache_key("m", "p", 0.0, 10)
+    assert len({key, cache_key("n", "p", 0.0, 10), cache_key("m", "q", 0.0, 10),
+                cache_key("m", "p", 0.5, 10), cache_key("m", "p", 0.0, 11)}) == 5
+
+
+def test_lru_evicts_least_recently_used():
+    cache = LRUCache(max_entries=2, ttl=60)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    cache.get("a")
+    cache.set("c", "3")
+    assert (cache.get("a"), cache.get("b"), cache.get("c")) == ("1", None, "3")
+
+
+def test_database_tier_survives_a_new_memory_tier():
+    key = cache_key("m", "persisted", 0.0, 10)
+    ResponseCache(8, 60, 3600).set(key, "m", "answer")
+    fresh = ResponseCache(8, 60, 3600)
+    assert fresh.get(key) == "answer"
+    assert fresh.stats()["persistent_hits"] == 1
+    assert fresh.get(key) == "answer"
+    assert fresh.stats()["memory_hits"] == 1
+
+
+def test_expired_database_entries_miss():
+    key = cache_key("m", "old", 0.0, 10)
+    with SessionLocal() as db:
+        db.merge(LLMCacheEntry(key=key, model="m", response="stale",
+                               created_at=datetime.utcnow() - timedelta(hours=2)))
+        db.commit()
+    assert ResponseCache(8, 60, 3600).get(key) is None
+
+
+def test_failed_database_write_is_not_an_error():
+    def locked_session():
+        db = SessionLocal()
+
+        def commit():
+            raise OperationalError("INSERT", {}, Exception("database is locked"))
+
+        db.commit = commit
+        return db
+
+    cache = ResponseCache(8, 60, 3600, session_factory=locked_session)
+    key = cache_key("m", "locked", 0.0, 10)
+    cache.set(key, "m", "paid for")
+    assert cache.get(key) == "paid for"
+    assert ResponseCache(8, 60, 3600).get(key) is None
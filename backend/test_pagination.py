@@ -0,0 +1,22 @@
+from datetime import datetime
+
+import pytest
+
+from pagination import decode_cursor, encode_cursor
+
+
+@pytest.mark.parametrize("created_at, execution_id", [
+    (datetime(2024, 1, 2, 3, 4, 5, 678901), 42),
+    (datetime(1999, 12, 31), 1),
+    (datetime(2030, 6, 1, 12, 0, 0, 1), 10 ** 12),
+])
+def test_cursor_round_trip(created_at, execution_id):
+    cursor = encode_cursor(created_at, execution_id)
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == (created_at, execution_id)
+
+
+@pytest.mark.parametrize("cursor", ["", "not a cursor", "WzFd", encode_cursor(datetime(2024, 1, 1), 1)[:-3]])
+def test_malformed_cursor(cursor):
+    with pytest.raises(ValueError, match="Invalid cursor"):
+        decode_cursor(cursor)
@@ -0,0 +1,180 @@
+import asyncio
+import time
+import uuid
+
+import pytest
+
+import rate_limit
+from database import SessionLocal
+from models import RateLimitSlot, RateLimitState
+from rate_limit import DatabaseBackend, MemoryBackend, ModelLimits, RateLimiter
+from retry_policy import Deadline, DeadlineExceeded
+
+
+def new_model() -> str:
+    """A model name no other test has used, so database rows start fresh."""
+    return f"model-{uuid.uuid4().hex[:8]}"
+
+
+def db_state(model: str) -> tuple[int, int]:
+    """(in_flight counter, slot rows) for `model` in the database."""
+    with SessionLocal() as db:
+        state = db.get(RateLimitState, model)
+        slots = db.query(RateLimitSlot).filter(RateLimitSlot.model == model).count()
+        return (state.in_flight if state else 0), slots
+
+
+@pytest.fixture(autouse=True)
+def fast_polling(monkeypatch):
+    monkeypatch.setattr(rate_limit, "POLL_INTERVAL", 0.01)
+
+
+def test_requests_bucket_refills_over_time(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(rate_limit.time, "monotonic", lambda: now[0])
+    backend, limits = MemoryBackend(), ModelLimits(rpm=2)
+    assert backend.try_acquire("m", limits, 1)[0] == 0
+    assert backend.try_acquire("m", limits, 1)[0] == 0
+    assert backend.try_acquire("m", limits, 1)[0] == pytest.approx(30.0)
+    now[0] += 15
+    assert backend.try_acquire("m", limits, 1)[0] == pytest.approx(15.0)
+    now[0] += 15
+    assert backend.try_acquire("m", limits, 1)[0] == 0
+
+
+def test_tokens_bucket_waits_for_the_missing_tokens():
+    backend, limits = MemoryBackend(), ModelLimits(tpm=600)
+    assert backend.try_acquire("m", limits, 500)[0] == 0
+    assert backend.try_acquire("m", limits, 300)[0] == pytest.approx(20.0, abs=0.1)
+
+
+def test_oversized_request_is_capped_at_the_bucket():
+    limiter = RateLimiter({"m": ModelLimits(tpm=100)})
+    lease = asyncio.run(limiter.acquire("m", 10_000, Deadline(1)))
+    assert lease.waited < 0.5
+
+
+def test_unlimited_models_are_not_queued():
+    limiter = RateLimiter({"m": ModelLimits(max_in_flight=1)})
+    lease = asyncio.run(limiter.acquire("other", 10))
+    assert lease.waited == 0.0
+    assert limiter.stats() == {}
+
+
+@pytest.mark.parametrize("backend", [MemoryBackend, DatabaseBackend])
+def test_in_flight_cap(backend):
+    model = new_model()
+    limiter = RateLimiter({model: ModelLimits(max_in_flight=2)}, backend())
+
+    async def scenario():
+        first = await limiter.acquire(model, 1)
+        second = await limiter.acquire(model, 1)
+        third = asyncio.create_task(limiter.acquire(model, 1))
+        await asyncio.sleep(0.1)
+        assert not third.done()
+        await first.release()
+        third = await asyncio.wait_for(third, 1)
+        await second.release()
+        await third.release()
+
+    asyncio.run(scenario())
+    assert limiter.stats()[model]["admitted"] == 3
+    if backend is DatabaseBackend:
+        assert db_state(model) == (0, 0)
+
+
+def test_queue_is_first_come_first_served():
+    limiter = RateLimiter({"m": ModelLimits(max_in_flight=1)})
+    admitted = []
+
+    async def call(name):
+        lease = await limiter.acquire("m", 1)
+        admitted.append(name)
+        await asyncio.sleep(0.01)
+        await lease.release()
+
+    async def scenario():
+        holder = await limiter.acquire("m", 1)
+        calls = []
+        for name in "abcd":
+            calls.append(asyncio.create_task(call(name)))
+            await asyncio.sleep(0.005)
+        await holder.release()
+        await asyncio.gather(*calls)
+
+    asyncio.run(scenario())
+    assert admitted == list("abcd")
+
+
+def test_deadline_while_queued():
+    limiter = RateLimiter({"m": ModelLimits(max_in_flight=1)})
+
+    async def scenario():
+        await limiter.acquire("m", 1)
+        await limiter.acquire("m", 1, Deadline(0.05))
+
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(scenario())
+    assert limiter.stats()["m"]["queued"] == 0
+
+
+def test_database_slots_expire(monkeypatch):
+    model = new_model()
+    backend, limits = DatabaseBackend(), ModelLimits(max_in_flight=1)
+    wait, slot = backend.try_acquire(model, limits, 1)
+    assert wait == 0 and slot is not None
+    assert backend.try_acquire(model, limits, 1)[0] > 0
+
+    real_time = time.time
+    monkeypatch.setattr(rate_limit.time, "time", lambda: real_time() + 601)
+    # The first call finds the cap full and takes the expired slot back.
+    assert backend.try_acquire(model, limits, 1)[0] > 0
+    assert db_state(model) == (0, 0)
+    wait, fresh = backend.try_acquire(model, limits, 1)
+    assert wait == 0
+
+    # The expired slot's late release gives nothing back twice.
+    backend.release(model, slot)
+    assert db_state(model) == (1, 1)
+    backend.release(model, fresh)
+    assert db_state(model) == (0, 0)
+
+
+class SlowBackend(DatabaseBackend):
+    def try_acquire(self, model, limits, tokens):
+        time.sleep(0.1)
+        return super().try_acquire(model, limits, tokens)
+
+
+def test_cancelled_acquire_releases_its_slot():
+    model = new_model()
+    limiter = RateLimiter({model: ModelLimits(max_in_flight=1)}, SlowBackend())
+
+    async def scenario():
+        call = asyncio.create_task(limiter.acquire(model, 1))
+        await asyncio.sleep(0.02)
+        call.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await call
+        await asyncio.sleep(0.3)
+
+    asyncio.run(scenario())
+    assert db_state(model) == (0, 0)
+    assert limiter.stats()[model]["queued"] == 0
+
+
+def test_client_releases_a_lease_the_deadline_leaves_no_time_for(gateway):
+    model = new_model()
+
+    class SlowAdmission(RateLimiter):
+        async def acquire(self, model, tokens, deadline=None):
+            lease = await super().acquire(model, tokens, deadline)
+            await asyncio.sleep(0.1)
+            return lease
+
+    limiter = SlowAdmission({model: ModelLimits(max_in_flight=1)}, DatabaseBackend())
+    client = gateway.client(limiter=limiter)
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(client.acomplete(model, "hi", deadline=Deadline(0.05), coalesce=False))
+    assert db_state(model) == (0, 0)
+    assert gateway.requests == []
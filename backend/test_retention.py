@@ -0,0 +1,124 @@
+import gzip
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+import retention
+from blobs import store_output
+from database import SessionLocal
+from models import ArchivedExecution, Execution, ExecutionStepLog, OutputBlob, Workflow
+from retention import RetentionPolicy, archive_batch, expired_ids, read_archived, run_retention
+
+NOW = datetime(2030, 1, 1)
+POLICY = RetentionPolicy(keep_days=30, keep_failed_days=90, keep_last=0, batch_size=100)
+
+
+@pytest.fixture(autouse=True)
+def archive_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(retention, "ARCHIVE_DIR", str(tmp_path))
+    yield tmp_path
+    # SQLite reuses the id of a deleted newest row; keep archived ids unique.
+    new_execution("RUNNING", 0)
+
+
+def new_execution(status: str, age_days: float, output: str | None = None) -> int:
+    with SessionLocal() as db:
+        workflow = Workflow(name="retention")
+        db.add(workflow)
+        db.flush()
+        execution = Execution(workflow_id=workflow.id, status=status,
+                              created_at=NOW - timedelta(days=age_days))
+        db.add(execution)
+        db.flush()
+        if output is not None:
+            digest, size = store_output(db, output)
+            db.add(ExecutionStepLog(execution_id=execution.id, step_order=1,
+                                    status="COMPLETED", output_hash=digest, output_size=size))
+        db.commit()
+        return execution.id
+
+
+def exists(execution_id: int) -> bool:
+    with SessionLocal() as db:
+        return db.get(Execution, execution_id) is not None
+
+
+def test_expiry_by_status_and_age():
+    old = new_execution("SUCCESS", 31)
+    recent = new_execution("SUCCESS", 29)
+    failed_recent = new_execution("FAILED", 60)
+    failed_old = new_execution("FAILED", 91)
+    running = new_execution("RUNNING", 365)
+    with SessionLocal() as db:
+        ids = set(expired_ids(db, POLICY, NOW))
+    assert {old, failed_old} <= ids
+    assert not {recent, failed_recent, running} & ids
+
+
+def test_keep_last_per_workflow():
+    with SessionLocal() as db:
+        workflow = Workflow(name="keep")
+        db.add(workflow)
+        db.flush()
+        executions = [Execution(workflow_id=workflow.id, status="SUCCESS",
+                                created_at=NOW - timedelta(days=100 + i)) for i in range(3)]
+        db.add_all(executions)
+        db.commit()
+        ids = [e.id for e in executions]
+        expired = set(expired_ids(db, RetentionPolicy(keep_last=2), NOW))
+    assert ids[2] in expired
+    assert not {ids[0], ids[1]} & expired
+
+
+def test_archive_round_trip():
+    execution_id = new_execution("SUCCESS", 40, output="archived output " * 10)
+    result = archive_batch([execution_id], POLICY, NOW)
+    assert result["executions"] == 1
+    assert not exists(execution_id)
+    record = read_archived(execution_id)
+    assert record["status"] == "SUCCESS"
+    assert record["step_logs"][0]["output"] == "archived output " * 10
+    with SessionLocal() as db:
+        assert db.query(OutputBlob).filter(
+            OutputBlob.hash == record["step_logs"][0]["output_hash"]).count() == 0
+
+
+def test_resumed_execution_is_not_archived():
+    resumed = new_execution("FAILED", 100, output="keep me")
+    finished = new_execution("SUCCESS", 100)
+    with SessionLocal() as db:
+        picked = expired_ids(db, POLICY, NOW)
+        assert {resumed, finished} <= set(picked)
+        # Resumed after being picked, before being archived.
+        db.query(Execution).filter(Execution.id == resumed).update({"status": "QUEUED"})
+        db.commit()
+
+    result = archive_batch([resumed, finished], POLICY, NOW)
+    assert result["executions"] == 1
+    assert exists(resumed)
+    assert not exists(finished)
+    assert read_archived(resumed) is None
+    with SessionLocal() as db:
+        assert db.query(ExecutionStepLog).filter(
+            ExecutionStepLog.execution_id == resumed).count() == 1
+        assert db.get(ArchivedExecution, resumed) is None
+
+
+def test_no_longer_old_enough_is_skipped():
+    execution_id = new_execution("SUCCESS", 40)
+    result = archive_batch([execution_id], POLICY, NOW - timedelta(days=20))
+    assert result["executions"] == 0
+    assert exists(execution_id)
+
+
+def test_run_retention_archives_in_batches(archive_dir):
+    ids = [new_execution("CANCELLED", 50) for _ in range(5)]
+    totals = run_retention(RetentionPolicy(keep_last=0, batch_size=2), NOW)
+    assert totals["executions"] >= 5
+    assert not any(exists(execution_id) for execution_id in ids)
+    archived = set()
+    for path in archive_dir.iterdir():
+        with gzip.open(path, "rt") as f:
+            archived |= {json.loads(line)["id"] for line in f}
+    assert set(ids) <= archived
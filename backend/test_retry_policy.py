@@ -0,0 +1,60 @@
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+import httpx
+import pytest
+
+from retry_policy import (
+    NonRetryableLLMError, RetryableLLMError, RetryPolicy, classify, parse_retry_after,
+)
+
+
+def test_backoff_grows_exponentially_up_to_the_cap():
+    policy = RetryPolicy(base_delay=0.5, max_delay=3.0, jitter=False)
+    assert [policy.backoff(retry) for retry in range(5)] == [0.5, 1.0, 2.0, 3.0, 3.0]
+
+
+def test_backoff_jitter_stays_within_the_delay():
+    policy = RetryPolicy(base_delay=1.0, max_delay=20.0)
+    for _ in range(100):
+        assert 0 <= policy.backoff(2) <= 4.0
+
+
+def test_retry_after_wins_over_backoff():
+    assert RetryPolicy(jitter=False).backoff(3, retry_after=7.5) == 7.5
+    assert RetryPolicy(jitter=False).backoff(3, retry_after=0.0) == 0.0
+
+
+@pytest.mark.parametrize("value, expected", [
+    (None, None), ("", None), ("3", 3.0), ("1.5", 1.5), ("-2", 0.0), ("soon", None),
+])
+def test_parse_retry_after_seconds(value, expected):
+    assert parse_retry_after(value) == expected
+
+
+def test_parse_retry_after_http_date():
+    when = datetime.now(timezone.utc) + timedelta(seconds=30)
+    assert 25 <= parse_retry_after(format_datetime(when, usegmt=True)) <= 30
+    past = datetime.now(timezone.utc) - timedelta(hours=1)
+    assert parse_retry_after(format_datetime(past, usegmt=True)) == 0.0
+
+
+def _status_error(status, headers=None):
+    request = httpx.Request("POST", "http://llm.test")
+    response = httpx.Response(status, headers=headers, request=request)
+    return httpx.HTTPStatusError("error", request=request, response=response)
+
+
+def test_classify_http_statuses():
+    throttled = classify(_status_error(429, {"Retry-After": "2"}))
+    assert isinstance(throttled, RetryableLLMError)
+    assert throttled.retry_after == 2.0
+    assert not throttled.provider_failure
+    assert classify(_status_error(503)).provider_failure
+    assert isinstance(classify(_status_error(400)), NonRetryableLLMError)
+
+
+def test_classify_transport_and_decoding_errors():
+    assert isinstance(classify(httpx.ConnectTimeout("slow")), RetryableLLMError)
+    assert isinstance(classify(KeyError("choices")), RetryableLLMError)
+    assert isinstance(classify(RuntimeError("bug")), NonRetryableLLMError)
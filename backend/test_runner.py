@@ -1,9 +1,11 @@
-from database import SessionLocal, Base, engine
+from blobs import log_output
+from database import SessionLocal, engine
+from migrations import upgrade
 from models import Workflow, Step, Execution, ExecutionStepLog
 from runner import run_workflow
 
 # ⭐ Ensure tables exist
-Base.metadata.create_all(bind=engine)
+upgrade(engine)
 
 
 def create_dummy_workflow(db):
@@ -61,7 +63,7 @@ def print_execution_logs(db, execution_id):
             f"Step {log.step_order} | "
             f"Status: {log.status} | "
             f"Retries: {log.retry_count} | "
-            f"Output: {log.output}"
+            f"Output: {log_output(log)}"
         )
 
 
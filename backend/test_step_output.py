@@ -0,0 +1,101 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from blobs import store_output
+from main import _byte_range, app, get_db
+from migrations import upgrade
+from models import Execution, ExecutionStepLog, Workflow
+
+OUTPUT = "0123456789" * 10
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-9", (0, 9)),
+    ("bytes=90-", (90, 99)),
+    ("bytes=95-500", (95, 99)),
+    ("bytes=-10", (90, 99)),
+    ("bytes=-500", (0, 99)),
+    ("bytes=5-2", None),
+    ("bytes=0-1,5-6", None),
+    ("items=0-9", None),
+    ("bytes=abc", None),
+])
+def test_byte_range(header, expected):
+    assert _byte_range(header, 100) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=100-", "bytes=-0"])
+def test_unsatisfiable_byte_range(header):
+    with pytest.raises(ValueError):
+        _byte_range(header, 100)
+
+
+@pytest.fixture
+def client(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    upgrade(engine)
+    sessions = sessionmaker(bind=engine)
+    with sessions() as db:
+        workflow = Workflow(name="w")
+        db.add(workflow)
+        db.flush()
+        execution = Execution(workflow_id=workflow.id, status="SUCCESS")
+        db.add(execution)
+        db.flush()
+        digest, size = store_output(db, OUTPUT)
+        db.add(ExecutionStepLog(execution_id=execution.id, step_order=1, status="COMPLETED",
+                                output_hash=digest, output_size=size))
+        db.add(ExecutionStepLog(execution_id=execution.id, step_order=2, status="RUNNING",
+                                output="partial"))
+        db.commit()
+        execution_id = execution.id
+
+    def get_test_db():
+        with sessions() as db:
+            yield db
+
+    app.dependency_overrides[get_db] = get_test_db
+    try:
+        yield TestClient(app), f"/execution/{execution_id}/steps"
+    finally:
+        app.dependency_overrides.pop(get_db, None)
+        engine.dispose()
+
+
+def test_completed_output_has_a_strong_etag(client):
+    client, steps = client
+    response = client.get(f"{steps}/1/output")
+    assert response.status_code == 200
+    assert response.text == OUTPUT
+    etag = response.headers["etag"]
+    assert etag.startswith('"') and etag.endswith('"')
+
+    cached = client.get(f"{steps}/1/output", headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.headers["etag"] == etag
+    assert client.get(f"{steps}/1/output", headers={"If-None-Match": '"other"'}).status_code == 200
+
+
+def test_range_requests(client):
+    client, steps = client
+    partial = client.get(f"{steps}/1/output", headers={"Range": "bytes=10-14"})
+    assert partial.status_code == 206
+    assert partial.text == "01234"
+    assert partial.headers["content-range"] == "bytes 10-14/100"
+
+    unsatisfiable = client.get(f"{steps}/1/output", headers={"Range": "bytes=200-"})
+    assert unsatisfiable.status_code == 416
+    assert unsatisfiable.headers["content-range"] == "bytes */100"
+
+    assert client.get(f"{steps}/1/output", headers={"Range": "bytes=0-1,4-5"}).text == OUTPUT
+
+
+def test_running_output_is_not_cached(client):
+    client, steps = client
+    response = client.get(f"{steps}/2/output")
+    assert response.text == "partial"
+    assert "etag" not in response.headers
+    assert response.headers["cache-control"] == "no-store"
+    assert client.get(f"{steps}/3/output").status_code == 404
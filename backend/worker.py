@@ -0,0 +1,117 @@
+"""
+Worker process for the database execution queue.
+
+    EXECUTION_QUEUE=database uvicorn main:app --port 8000   # the API only enqueues
+    python worker.py --concurrency 8                        # start one or more
+
+Each worker claims enqueued executions from the shared database, up to
+`--concurrency` at a time, and runs them as coroutines on its engine loop
+while its heartbeat keeps their leases alive. Executions whose worker died are
+claimed again once their lease runs out, and resume from their last
+completed step. SIGINT/SIGTERM stop claiming and let running executions
+finish before the worker exits.
+"""
+
+import argparse
+import logging
+import signal
+import threading
+from concurrent.futures import Future, wait
+
+import engine_loop
+from database import SessionLocal, engine
+from executor import QUEUE_POLL_INTERVAL, run_execution
+from leases import claim, get_keeper
+from migrations import upgrade
+from observability import configure_logging, instrument_sessions
+
+logger = logging.getLogger(__name__)
+
+# Idle polling backs off up to this many seconds.
+MAX_IDLE_INTERVAL = 5.0
+
+
+class Worker:
+    def __init__(self, concurrency: int, poll_interval: float = QUEUE_POLL_INTERVAL):
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.keeper = get_keeper()
+        self.completed = 0
+        self._running: set[Future] = set()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+
+    def stop(self, *_) -> None:
+        logger.info("Worker %s stopping, waiting for running executions", self.keeper.owner)
+        self._stopping.set()
+        self._wakeup.set()
+
+    def _finished(self, future: Future) -> None:
+        with self._lock:
+            self._running.discard(future)
+            self.completed += 1
+        # A slot just freed up: claim again without waiting for the poll.
+        self._wakeup.set()
+
+    def _claim(self, limit: int) -> list[int]:
+        db = SessionLocal()
+        try:
+            return claim(db, self.keeper.owner, limit)
+        finally:
+            db.close()
+
+    def run(self) -> None:
+        logger.info("Worker %s started with concurrency %d",
+                    self.keeper.owner, self.concurrency)
+        idle = self.poll_interval
+        while not self._stopping.is_set():
+            with self._lock:
+                free = self.concurrency - len(self._running)
+            claimed = []
+            if free > 0:
+                try:
+                    claimed = self._claim(free)
+                except Exception:
+                    logger.exception("Claiming executions failed")
+            for execution_id in claimed:
+                self.keeper.hold(execution_id)
+                future = engine_loop.submit(run_execution(execution_id, claimed=True))
+                with self._lock:
+                    self._running.add(future)
+                future.add_done_callback(self._finished)
+
+            if claimed and len(claimed) == free:
+                idle = self.poll_interval
+                continue
+            idle = self.poll_interval if claimed else min(idle * 2, MAX_IDLE_INTERVAL)
+            self._wakeup.wait(idle if free > 0 else None)
+            self._wakeup.clear()
+        with self._lock:
+            running = list(self._running)
+        wait(running)
+        self.keeper.stop()
+        logger.info("Worker %s stopped after %d executions",
+                    self.keeper.owner, self.completed)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--concurrency", type=int, default=32,
+                        help="executions run at once by this worker")
+    parser.add_argument("--poll-interval", type=float, default=QUEUE_POLL_INTERVAL,
+                        help="seconds between claims while work is arriving")
+    args = parser.parse_args()
+
+    configure_logging()
+    instrument_sessions()
+    upgrade(engine)
+
+    worker = Worker(args.concurrency, args.poll_interval)
+    signal.signal(signal.SIGINT, worker.stop)
+    signal.signal(signal.SIGTERM, worker.stop)
+    worker.run()
+
+
+if __name__ == "__main__":
+    main()
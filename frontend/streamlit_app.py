@@ -1,5 +1,6 @@
 """Streamlit frontend for Agentic Workflow Builder."""
 
+import json
 import time
 from typing import Any
 
@@ -7,6 +8,8 @@ import requests
 import streamlit as st
 
 API_BASE_URL = "https://agentic-workflow-builder.onrender.com"
+FINISHED_STATUSES = ["SUCCESS", "FAILED", "CANCELLED", "TIMED_OUT"]
+RESUMABLE_STATUSES = ["FAILED", "CANCELLED", "TIMED_OUT"]
 
 
 def init_session_state():
@@ -16,6 +19,13 @@ def init_session_state():
     if "execution_id" not in st.session_state:
         st.session_state.execution_id = None
 
+    # Cursors of the history pages visited so far; the last one is current.
+    if "history_cursors" not in st.session_state:
+        st.session_state.history_cursors = [None]
+
+    if "history_next_cursor" not in st.session_state:
+        st.session_state.history_next_cursor = None
+
 
 
 def add_step():
@@ -25,6 +35,11 @@ def add_step():
             "prompt": "",
             "completion_criteria": "",
             "retry_limit": 0,
+            "cache": False,
+            "depends_on": "",
+            "hedge": False,
+            "hedge_model": "",
+            "coalesce": True,
         }
     )
 
@@ -34,6 +49,13 @@ def remove_step(index: int):
 
 
 
+def parse_depends_on(value: str) -> list[int] | None:
+    """Blank means 'previous step'; otherwise comma-separated step numbers."""
+    if not value.strip():
+        return None
+    return [int(part) for part in value.split(",") if part.strip()]
+
+
 def create_workflow(name: str, steps: list[dict[str, Any]]) -> dict | None:
     try:
         payload = {
@@ -44,6 +66,11 @@ def create_workflow(name: str, steps: list[dict[str, Any]]) -> dict | None:
                     "prompt": step["prompt"],
                     "completion_criteria": step["completion_criteria"] or None,
                     "retry_limit": step["retry_limit"],
+                    "cache": step["cache"],
+                    "depends_on": parse_depends_on(step["depends_on"]),
+                    "hedge": step["hedge"],
+                    "hedge_model": step["hedge_model"] or None,
+                    "coalesce": step["coalesce"],
                     "step_order": idx + 1,
                 }
                 for idx, step in enumerate(steps)
@@ -55,7 +82,7 @@ def create_workflow(name: str, steps: list[dict[str, Any]]) -> dict | None:
         res.raise_for_status()
         return res.json()
 
-    except requests.RequestException as e:
+    except (requests.RequestException, ValueError) as e:
         st.error(f"Error creating workflow: {e}")
         return None
 
@@ -73,6 +100,32 @@ def run_workflow_api(workflow_id: int):
         return None
 
 
+def resume_execution_api(execution_id: int):
+    try:
+        res = requests.post(
+            f"{API_BASE_URL}/execution/{execution_id}/resume", timeout=15
+        )
+        res.raise_for_status()
+        return res.json()
+
+    except requests.RequestException as e:
+        st.error(f"Error resuming execution: {e}")
+        return None
+
+
+def cancel_execution_api(execution_id: int):
+    try:
+        res = requests.post(
+            f"{API_BASE_URL}/execution/{execution_id}/cancel", timeout=15
+        )
+        res.raise_for_status()
+        return res.json()
+
+    except requests.RequestException as e:
+        st.error(f"Error cancelling execution: {e}")
+        return None
+
+
 def get_execution(execution_id: int):
     try:
         res = requests.get(
@@ -86,9 +139,11 @@ def get_execution(execution_id: int):
         return None
 
 
-def get_executions():
+def get_executions(params: dict[str, Any]):
     try:
-        res = requests.get(f"{API_BASE_URL}/executions", timeout=15)
+        res = requests.get(
+            f"{API_BASE_URL}/executions", params=params, timeout=15
+        )
         res.raise_for_status()
         return res.json()
 
@@ -97,86 +152,167 @@ def get_executions():
         return None
 
 
+def count_executions(params: dict[str, Any]):
+    try:
+        res = requests.get(
+            f"{API_BASE_URL}/executions/count", params=params, timeout=15
+        )
+        res.raise_for_status()
+        return res.json()["count"]
 
-def display_execution_progress(execution_id: int):
+    except requests.RequestException as e:
+        st.error(f"Error counting executions: {e}")
+        return None
 
-    progress_placeholder = st.empty()
-    status_placeholder = st.empty()
-    logs_placeholder = st.empty()
-    final_placeholder = st.empty()
 
-    # bounded polling → safe for Streamlit
-    for _ in range(100):
 
-        execution = get_execution(execution_id)
-        if not execution:
-            break
+def iter_sse(response: requests.Response):
+    """Yield (event, data) pairs from a Server-Sent Events response."""
+    event, data = "message", []
+    for line in response.iter_lines(decode_unicode=True):
+        if line is None:
+            continue
+        if line == "":
+            if data:
+                yield event, json.loads("\n".join(data))
+            event, data = "message", []
+        elif line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data.append(line[len("data:"):].strip())
+
+
+def apply_event(execution: dict, event: str, data: dict) -> dict:
+    """Fold one stream event into the locally held execution state."""
+    if event == "snapshot":
+        return data
+
+    if event == "execution":
+        execution["status"] = data["status"]
+        return execution
+
+    logs = {log["step_order"]: log for log in execution["step_logs"]}
+    log = logs.get(data["step_order"])
+    if log is None:
+        log = {
+            "id": data.get("log_id"),
+            "step_order": data["step_order"],
+            "status": "RUNNING",
+            "output": "",
+            "retry_count": 0,
+        }
+        execution["step_logs"].append(log)
+        execution["step_logs"].sort(key=lambda l: l["step_order"])
+
+    if event == "step":
+        log["status"] = data["status"]
+        log["retry_count"] = data["retry_count"]
+    elif event == "attempt":
+        log["output"] = ""
+    elif event == "delta":
+        log["output"] = (log["output"] or "") + data["delta"]
+    return execution
+
+
+def render_execution(execution: dict, placeholders: tuple) -> None:
+    progress_placeholder, status_placeholder, logs_placeholder, final_placeholder = placeholders
+    status = execution["status"]
+    step_logs = execution["step_logs"]
+
+    # Progress Bar
+    total = len(step_logs)
+    completed = sum(1 for s in step_logs if s["status"] == "COMPLETED")
+    progress = completed / total if total else 0
+
+    progress_placeholder.progress(
+        progress, text=f"Steps Completed: {completed}/{total}"
+    )
 
-        status = execution["status"]
-        step_logs = execution["step_logs"]
+    # Status Display
+    color = {"QUEUED": "🔵", "RUNNING": "🟡", "SUCCESS": "🟢",
+             "FAILED": "🔴", "CANCELLED": "⚫", "TIMED_OUT": "🟠"}.get(status, "⚪")
 
-        # Progress Bar
-        total = len(step_logs)
-        completed = sum(1 for s in step_logs if s["status"] == "COMPLETED")
-        progress = completed / total if total else 0
+    status_placeholder.markdown(
+        f"### {color} Execution Status: **{status}**"
+    )
 
-        progress_placeholder.progress(
-            progress, text=f"Steps Completed: {completed}/{total}"
-        )
+    # Step Logs
+    with logs_placeholder.container():
+        if step_logs:
+            st.subheader("Step Logs")
 
-        # Status Display
-        color = {"RUNNING": "🟡", "SUCCESS": "🟢",
-                 "FAILED": "🔴"}.get(status, "⚪")
+            for log in step_logs:
+                icon = {
+                    "RUNNING": "⏳",
+                    "COMPLETED": "✅",
+                    "FAILED": "❌",
+                    "CANCELLED": "⏹️",
+                    "TIMED_OUT": "⌛",
+                }.get(log["status"], "⚪")
 
-        status_placeholder.markdown(
-            f"### {color} Execution Status: **{status}**"
-        )
+                with st.expander(
+                    f"{icon} Step {log['step_order']} - {log['status']} "
+                    f"(Retries: {log['retry_count']})"
+                ):
+                    if log["output"]:
+                        st.code(log["output"])
+                    else:
+                        st.info("No output yet...")
 
-        # Step Logs
-        with logs_placeholder.container():
-            if step_logs:
-                st.subheader("Step Logs")
+    # Final Output
+    if status in FINISHED_STATUSES:
 
+        with final_placeholder.container():
+
+            st.markdown("---")
+
+            if status == "SUCCESS":
+                st.success("Workflow Completed Successfully!")
+
+                st.subheader("Final Outputs")
                 for log in step_logs:
-                    icon = {
-                        "RUNNING": "⏳",
-                        "COMPLETED": "✅",
-                        "FAILED": "❌",
-                    }.get(log["status"], "⚪")
+                    if log["output"]:
+                        st.markdown(f"**Step {log['step_order']}**")
+                        st.code(log["output"])
 
-                    with st.expander(
-                        f"{icon} Step {log['step_order']} - {log['status']} "
-                        f"(Retries: {log['retry_count']})"
-                    ):
-                        if log["output"]:
-                            st.code(log["output"])
-                        else:
-                            st.info("No output yet...")
+            elif status == "FAILED":
+                st.error("Workflow Failed")
 
-        # Final Output
-        if status in ["SUCCESS", "FAILED"]:
+            else:
+                st.warning(f"Workflow {status.replace('_', ' ').title()}")
 
-            with final_placeholder.container():
 
-                st.markdown("---")
+def display_execution_progress(execution_id: int):
 
-                if status == "SUCCESS":
-                    st.success("Workflow Completed Successfully!")
+    placeholders = (st.empty(), st.empty(), st.empty(), st.empty())
+    execution = None
+    last_render = 0.0
 
-                    st.subheader("Final Outputs")
-                    for log in step_logs:
-                        if log["output"]:
-                            st.markdown(f"**Step {log['step_order']}**")
-                            st.code(log["output"])
+    # The server pushes snapshots, step changes and token deltas; renders
+    # are throttled so a fast token stream does not redraw every delta.
+    try:
+        with requests.get(
+            f"{API_BASE_URL}/execution/{execution_id}/stream",
+            stream=True,
+            timeout=(15, 60),
+        ) as res:
+            res.raise_for_status()
+            for event, data in iter_sse(res):
+                execution = apply_event(execution, event, data)
+                if event == "delta" and time.monotonic() - last_render < 0.2:
+                    continue
+                render_execution(execution, placeholders)
+                last_render = time.monotonic()
 
-                else:
-                    st.error("Workflow Failed")
+    except requests.RequestException as e:
+        st.warning(f"Live updates unavailable: {e}")
+        execution = get_execution(execution_id)
 
+    if execution:
+        render_execution(execution, placeholders)
+        if execution["status"] in FINISHED_STATUSES:
             # Reset session
             st.session_state.execution_id = None
-            break
-
-        time.sleep(2)
 
 
 
@@ -222,6 +358,31 @@ def main():
                     "Retry Limit", min_value=0, value=step["retry_limit"], key=f"retry_{idx}"
                 )
 
+                step["depends_on"] = st.text_input(
+                    "Depends On (step numbers, blank = previous step)",
+                    step["depends_on"],
+                    key=f"depends_{idx}",
+                )
+
+                step["cache"] = st.checkbox(
+                    "Cache Responses", step["cache"], key=f"cache_{idx}"
+                )
+
+                step["hedge"] = st.checkbox(
+                    "Hedge Slow Requests", step["hedge"], key=f"hedge_{idx}"
+                )
+
+                if step["hedge"]:
+                    step["hedge_model"] = st.text_input(
+                        "Hedge Model (blank = same model)",
+                        step["hedge_model"],
+                        key=f"hedge_model_{idx}",
+                    )
+
+                step["coalesce"] = st.checkbox(
+                    "Share Identical In-Flight Calls", step["coalesce"], key=f"coalesce_{idx}"
+                )
+
             with col2:
                 if st.button("🗑 Remove", key=f"remove_{idx}"):
                     remove_step(idx)
@@ -255,7 +416,7 @@ def main():
 
         if result:
             st.session_state.execution_id = result["execution_id"]
-            st.success(f"Execution Started! ID = {result['execution_id']}")
+            st.success(f"Execution Queued! ID = {result['execution_id']}")
 
     st.divider()
 
@@ -269,24 +430,82 @@ def main():
 
     st.header("4️⃣ Execution History")
 
-    if st.button("Refresh History"):
-
-        executions = get_executions()
-
-        if executions:
-            for exec_data in executions:
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        status_filter = st.selectbox(
+            "Status", ["All", "QUEUED", "RUNNING", *FINISHED_STATUSES]
+        )
+    with col2:
+        workflow_filter = st.number_input(
+            "Workflow ID (0 = all)", min_value=0, step=1
+        )
+    with col3:
+        page_size = st.selectbox("Page Size", [10, 25, 50, 100])
+
+    filters = {}
+    if status_filter != "All":
+        filters["status"] = status_filter
+    if workflow_filter:
+        filters["workflow_id"] = int(workflow_filter)
+
+    nav1, nav2, nav3 = st.columns(3)
+    with nav1:
+        if st.button("Refresh History"):
+            st.session_state.history_cursors = [None]
+    with nav2:
+        if st.button("◀ Previous") and len(st.session_state.history_cursors) > 1:
+            st.session_state.history_cursors.pop()
+    with nav3:
+        if st.button("Next ▶") and st.session_state.history_next_cursor:
+            st.session_state.history_cursors.append(
+                st.session_state.history_next_cursor
+            )
+
+    params = {**filters, "limit": page_size}
+    cursor = st.session_state.history_cursors[-1]
+    if cursor:
+        params["cursor"] = cursor
+
+    page = get_executions(params)
+
+    if page:
+        st.session_state.history_next_cursor = page["next_cursor"]
+        total = count_executions(filters)
+        st.caption(
+            f"Page {len(st.session_state.history_cursors)}"
+            + (f" of {max(1, -(-total // page_size))} ({total} executions)"
+               if total is not None else "")
+        )
 
-                icon = {
-                    "RUNNING": "🟡",
-                    "SUCCESS": "🟢",
-                    "FAILED": "🔴",
-                }.get(exec_data["status"], "⚪")
+        for exec_data in page["items"]:
+
+            icon = {
+                "QUEUED": "🔵",
+                "RUNNING": "🟡",
+                "SUCCESS": "🟢",
+                "FAILED": "🔴",
+                "CANCELLED": "⚫",
+                "TIMED_OUT": "🟠",
+            }.get(exec_data["status"], "⚪")
+
+            with st.expander(
+                f"{icon} Execution {exec_data['id']} "
+                f"(Workflow {exec_data['workflow_id']})"
+            ):
+                st.write(exec_data)
+
+                if exec_data["status"] in RESUMABLE_STATUSES and st.button(
+                    "🔁 Resume", key=f"resume_{exec_data['id']}"
+                ):
+                    if resume_execution_api(exec_data["id"]):
+                        st.session_state.execution_id = exec_data["id"]
+                        st.rerun()
 
-                with st.expander(
-                    f"{icon} Execution {exec_data['id']} "
-                    f"(Workflow {exec_data['workflow_id']})"
+                if exec_data["status"] in ("QUEUED", "RUNNING") and st.button(
+                    "⏹️ Cancel", key=f"cancel_{exec_data['id']}"
                 ):
-                    st.write(exec_data)
+                    if cancel_execution_api(exec_data["id"]):
+                        st.rerun()
 
 
 if __name__ == "__main__":